@@ -0,0 +1,57 @@
+import os
+import sys
+import ast
+import json
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
+
+import main
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "samples")
+token_count = int(os.getenv("BENCH_TOKENS", "20000"))
+
+
+def build_nft_token_attribute_rows_per_token(df_nft_info):
+    # previous implementation - literal_eval + json round trip + one json_normalize DataFrame per token
+    nft_token_attributes_list = []
+    for _, row in df_nft_info.iterrows():
+        dict_md = json.loads(json.dumps(ast.literal_eval(row["metadata"])))
+        if "attributes" in dict_md:
+            df_md = pd.json_normalize(dict_md["attributes"]).rename(
+                index=str,
+                columns={"trait_type": "attribute_key", "value": "attribute_value"}
+            )
+            df_md["attribute_type"] = df_md["attribute_value"].apply(lambda s: type(s).__name__)
+            df_md["nft_token_id"] = row["nft_token_id"]
+            df_md["chain"] = "Celo"
+            df_md["collection_contract_address"] = row["collection_contract_address"]
+            df_md["collection_slug"] = row["collection_slug"]
+            nft_token_attributes_list.append(df_md)
+    return pd.concat(nft_token_attributes_list)
+
+def bench(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} : {elapsed / token_count * 1e6:>8.1f} us/token ({len(result)} attribute rows)")
+
+def run_benchmark():
+    with open(os.path.join(samples_dir, "nft_md.json")) as f:
+        nft_metadata = json.load(f)
+
+    df_base = pd.DataFrame({
+        "collection_contract_address": "0x179513e0fa9B5AD964405B01194105A2d8e0c2df",
+        "collection_slug": "celostrials",
+        "nft_token_id": range(1, token_count + 1)
+    })
+    df_repr = df_base.assign(metadata=repr(nft_metadata))
+    df_json = df_base.assign(metadata=json.dumps(nft_metadata))
+
+    bench("per token", lambda: build_nft_token_attribute_rows_per_token(df_repr))
+    bench("batched", lambda: main.build_nft_token_attribute_rows(df_json))
+
+
+if __name__ == "__main__":
+    run_benchmark()
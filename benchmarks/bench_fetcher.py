@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
+
+import config
+import fetcher
+import http_client
+
+# simulated metadata host latency per request
+latency_seconds = float(os.getenv("BENCH_LATENCY", "0.05"))
+token_count = int(os.getenv("BENCH_TOKENS", "1000"))
+concurrency_levels = [1, 8, 32, 128]
+
+
+class MetadataStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(latency_seconds)
+        token_id = self.path.strip("/").split(".")[0]
+        body = json.dumps({
+            "name": f"Stub #{token_id}",
+            "description": "stub token",
+            "image": f"ipfs://QmStub/{token_id}.png",
+            "attributes": [{"trait_type": "background", "value": "celo"}]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_benchmark():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MetadataStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"127.0.0.1:{server.server_port}"
+    # measure the fetch engine, not the rate limiter
+    config.rate_limits["stub"] = {"rate": 1e9, "burst": 1e9}
+    http_client.register_endpoint(f"http://{host}", "stub")
+
+    print("tokens:", token_count, "latency:", latency_seconds)
+    for concurrency in concurrency_levels:
+        # sequential baseline would take token_count * latency - cap small levels to keep runs short
+        n_tokens = min(token_count, max(50, concurrency * 50))
+        items = ((token_id, f"http://{host}/{token_id}.json") for token_id in range(1, n_tokens + 1))
+        results = []
+
+        start = time.perf_counter()
+        errors = fetcher.fetch_metadata(
+            items,
+            lambda key, url, md, err: results.append(key),
+            concurrency=concurrency,
+            host_limits={host: concurrency}
+        )
+        elapsed = time.perf_counter() - start
+
+        print(f"concurrency {concurrency:>4} : {len(results) / elapsed:>9.1f} tokens/sec ({len(results)} tokens, {errors} errors)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import pandas as pd
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
+
+import main
+import config
+
+transfers_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "output", "staging", "transfers.csv")
+# replicate the staging sample to get a collection-sized workload
+repeat = int(os.getenv("BENCH_REPEAT", "2000"))
+
+
+def build_nft_transfer_rows_iterrows(df_transfers, contract_address):
+    # previous per-row implementation, kept as the baseline
+    nft_tranfer_list = []
+
+    for _, row in df_transfers.iterrows():
+        timestamp = datetime.fromtimestamp(main.hex_to_int(row["timeStamp"])).replace(microsecond=0).isoformat()
+
+        topics = [str(item).strip("'") for item in str(row["topics"]).strip("[]").split(", ")]
+        method_id = topics[0][:10]
+        if len(topics) == 4:
+            token_id = main.hex_to_int(topics[3])
+        else:
+            token_id = 0
+
+        nft_tranfer_row = {
+            "amount_raw": token_id,
+            "block_date": datetime.fromisoformat(timestamp).date(),
+            "block_number": main.hex_to_int(row["blockNumber"]),
+            "block_timestamp": timestamp,
+            "chain": "Celo",
+            "collection_contract_address": contract_address,
+            "from_address": row["fromAddressHash"].lower(),
+            "internal_index": main.hex_to_int(row["transactionIndex"]),
+            "log_index": main.hex_to_int(row["logIndex"]),
+            "nft_token_id": token_id,
+            "to_address": row["toAddressHash"].lower(),
+            "transaction_hash": row["transactionHash"],
+            "transfer_type": "mint" if row["fromAddressHash"].lower() == config.zero_address else config.method_types[method_id]
+        }
+        nft_tranfer_list.append(nft_tranfer_row)
+
+    return pd.DataFrame(nft_tranfer_list, columns=config.nft_transfers_columns)
+
+def bench(label, fn, n_rows):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} : {n_rows / elapsed:>10.0f} rows/sec ({n_rows} rows, {elapsed:.3f}s)")
+    return result
+
+def run_benchmark():
+    # explorer api values are strings - read the sample the same way
+    df_transfers = pd.concat([pd.read_csv(transfers_csv, dtype=str)] * repeat, ignore_index=True)
+    contract_address = main.w3.to_checksum_address(df_transfers["address"][0])
+
+    df_iterrows = bench("iterrows", lambda: build_nft_transfer_rows_iterrows(df_transfers, contract_address), len(df_transfers))
+    df_vectorized = bench("vectorized", lambda: main.build_nft_transfer_rows(df_transfers, contract_address), len(df_transfers))
+
+    pd.testing.assert_frame_equal(df_iterrows, df_vectorized, check_dtype=False)
+    print("outputs match")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
+
+
+import main
+import config
+import storage
+import http_client
+from mock_celo import Dataset, MockCelo
+
+# end-to-end run of the main.py stages against the local mock explorer / rpc / metadata hosts
+# BENCH_SCALES="10,1000,100000" token counts, BENCH_LATENCY per request, BENCH_ERROR_RATE of 503s on explorer + metadata
+scales = [int(scale) for scale in os.getenv("BENCH_SCALES", "10,1000,10000").split(",")]
+latency_seconds = float(os.getenv("BENCH_LATENCY", "0.005"))
+error_rate = float(os.getenv("BENCH_ERROR_RATE", "0.0"))
+# optional json file the results are written to - compare two runs to spot regressions
+output_path = os.getenv("BENCH_OUTPUT")
+
+# stage -> table whose rows it emits
+stages = [
+    ("pull_all_contracts", "contracts"),
+    ("get_active_contract_tokens", "contract_token"),
+    ("pull_nft_contracts", "nft_contracts"),
+    ("get_active_nft_collections", "nft_collection_info"),
+    ("pull_nft_info", "nft_info"),
+    ("pull_nft_media_types", "nft_info"),
+    ("pull_nft_token_attributes", "nft_token_attributes"),
+    ("pull_nft_transfers", "nft_transfers"),
+    ("pull_nft_ownership", "nft_owners")
+]
+
+
+def peak_rss_mb():
+    # high-water mark of the whole process - linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def count_rows(table):
+    if not storage.table_exists(table):
+        return 0
+    return sum(len(df) for df in storage.read_table_chunks(table, columns=None))
+
+def point_pipeline_at(mock):
+    # every client the stages use talks to the mock - explorer url, rpc provider and the shared rate limit buckets
+    main.celo_base_api_url = mock.explorer_url
+    # lazy like the production provider - process pool workers receive it and build their own
+    main.w3 = http_client.LazyWeb3(mock.rpc_url)
+
+    # measure the pipeline, not the production rate limits
+    for endpoint in ["bench", "rpc"]:
+        config.rate_limits[endpoint] = {"rate": 1e9, "burst": 1e9}
+    http_client.buckets.clear()
+    http_client.register_endpoint(mock.base_url, "bench")
+
+def run_scale(token_count):
+    dataset = Dataset(token_count)
+    mock = MockCelo(dataset, latency_seconds=latency_seconds, error_rate=error_rate).start()
+    point_pipeline_at(mock)
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        # output tables, checkpoints and the metadata cache are relative paths - a fresh tree per scale
+        os.chdir(work_dir)
+        try:
+            for stage, table in stages:
+                mock.reset_counts()
+                start = time.perf_counter()
+                getattr(main, stage)()
+                elapsed = time.perf_counter() - start
+                requests = mock.reset_counts()
+                rows = count_rows(table)
+
+                results.append({
+                    "tokens": token_count,
+                    "stage": stage,
+                    "seconds": round(elapsed, 3),
+                    "requests": sum(count for key, count in requests.items() if not key.startswith("rpc:") and key != "media_bytes"),
+                    "rpc_calls": sum(count for key, count in requests.items() if key.startswith("rpc:")),
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                    "rows": rows,
+                    "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+                    "requests_by_endpoint": requests
+                })
+        finally:
+            os.chdir(cwd)
+            mock.stop()
+
+    return results
+
+def print_results(results):
+    print(f"{'tokens':>8} {'stage':<28} {'seconds':>9} {'requests':>9} {'rpc calls':>10} {'rows':>8} {'rows/sec':>10} {'peak rss':>9}")
+    for result in results:
+        print(
+            f"{result['tokens']:>8} {result['stage']:<28} {result['seconds']:>9.3f} {result['requests']:>9} "
+            f"{result['rpc_calls']:>10} {result['rows']:>8} {result['rows_per_sec']:>10.1f} {result['peak_rss_mb']:>7.1f}MB"
+        )
+
+def run_benchmark():
+    print("scales:", scales, "latency:", latency_seconds, "error rate:", error_rate)
+    results = []
+    for token_count in scales:
+        results.extend(run_scale(token_count))
+    print_results(results)
+
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
+
+import main
+import logs
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "samples")
+# replicate the recorded samples to get a collection-sized workload
+repeat = int(os.getenv("BENCH_REPEAT", "200"))
+
+
+def bench(label, fn, n_rows):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} : {n_rows / elapsed:>10.0f} rows/sec ({n_rows} rows, {elapsed:.3f}s)")
+
+def run_benchmark():
+    with open(os.path.join(samples_dir, "transfers.json")) as f:
+        explorer_result = json.load(f)["result"] * repeat
+    with open(os.path.join(samples_dir, "transfer_logs.json")) as f:
+        fixture = json.load(f)
+    raw_logs = fixture["result"] * repeat
+    block_timestamps = {int(block, 16): int(ts, 16) for block, ts in fixture["block_timestamps"].items()}
+    contract_address = main.w3.to_checksum_address(explorer_result[0]["address"])
+
+    # decode cost only - both paths start from the parsed json response
+    bench("explorer tokentx path", lambda: main.build_nft_transfer_rows(pd.json_normalize(explorer_result), contract_address), len(explorer_result))
+    bench("eth_getLogs path", lambda: pd.DataFrame(logs.decode_transfer_logs(raw_logs, block_timestamps)), len(raw_logs))
+
+
+if __name__ == "__main__":
+    run_benchmark()
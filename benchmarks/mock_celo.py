@@ -0,0 +1,466 @@
+import json
+import time
+import random
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import encode, decode
+from eth_utils import to_checksum_address, function_signature_to_4byte_selector
+
+# offline stand-in for the celo explorer api, the json-rpc node and the metadata hosts
+# everything is generated from a synthetic dataset - no recorded responses needed
+
+transfer_topic = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+multicall3_address = "0xca11bde05977b3631167028862be2a173976ca11"
+zero_address = "0x" + "0" * 40
+genesis_timestamp = 1600000000
+block_time_seconds = 5
+# distinct images per collection, and the file behind each of them
+media_variants = 16
+media_body = b"\x89PNG\r\n\x1a\n" + bytes(64 * 1024)
+
+
+def abi_function(name, inputs, outputs):
+    return {
+        "inputs": [{"internalType": input_type, "name": f"arg{i}", "type": input_type} for i, input_type in enumerate(inputs)],
+        "name": name,
+        "outputs": [{"internalType": output_type, "name": "", "type": output_type} for output_type in outputs],
+        "stateMutability": "view",
+        "type": "function"
+    }
+
+nft_abi = json.dumps([
+    abi_function("name", [], ["string"]),
+    abi_function("symbol", [], ["string"]),
+    abi_function("owner", [], ["address"]),
+    abi_function("paused", [], ["bool"]),
+    abi_function("totalSupply", [], ["uint256"]),
+    abi_function("tokenURI", ["uint256"], ["string"]),
+    abi_function("tokenByIndex", ["uint256"], ["uint256"]),
+    abi_function("ownerOf", ["uint256"], ["address"]),
+    abi_function("supportsInterface", ["bytes4"], ["bool"])
+], separators=(",", ":"))
+
+erc20_abi = json.dumps([
+    abi_function("name", [], ["string"]),
+    abi_function("symbol", [], ["string"]),
+    abi_function("decimals", [], ["uint8"]),
+    abi_function("totalSupply", [], ["uint256"]),
+    abi_function("balanceOf", ["address"], ["uint256"])
+], separators=(",", ":"))
+
+# selector -> (function name, input types)
+selectors = {
+    function_signature_to_4byte_selector(f"{name}({','.join(inputs)})"): (name, inputs)
+    for name, inputs in [
+        ("name", []), ("symbol", []), ("owner", []), ("paused", []), ("decimals", []), ("totalSupply", []),
+        ("tokenURI", ["uint256"]), ("tokenByIndex", ["uint256"]), ("ownerOf", ["uint256"]),
+        ("supportsInterface", ["bytes4"]), ("balanceOf", ["address"]),
+        ("aggregate3", ["(address,bool,bytes)[]"])
+    ]
+}
+
+
+def to_int(value):
+    # json-rpc quantities are hex strings, some clients send plain ints
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+class Reverted(Exception):
+    pass
+
+
+class Dataset:
+    # token_count tokens spread over collections of collection_size, plus erc-20 contracts the nft filters must drop
+    def __init__(self, token_count, collection_size=1000, erc20_count=None, transfers_per_token=2, seed=0):
+        rng = random.Random(seed)
+        self.collections = []
+        self.erc20s = []
+        self.transfers_per_token = transfers_per_token
+
+        sizes = [collection_size] * (token_count // collection_size)
+        if token_count % collection_size:
+            sizes.append(max(10, token_count % collection_size))
+        for i, size in enumerate(sizes):
+            self.collections.append({
+                "address": to_checksum_address(f"0xc0{i:038x}"),
+                "name": f"BenchCollection{i}",
+                "symbol": f"BC{i}",
+                "owner": to_checksum_address(f"0x0e{i:038x}"),
+                "total_supply": size,
+                "deploy_block": 1000 + i * 10,
+                "holders": [to_checksum_address(f"0xa0{rng.randrange(16 ** 10):038x}") for _ in range(size)]
+            })
+        for i in range(erc20_count if erc20_count is not None else max(1, len(sizes) // 2)):
+            self.erc20s.append({"address": to_checksum_address(f"0xe2{i:038x}"), "name": f"BenchToken{i}", "symbol": f"BT{i}"})
+
+        self.by_address = {contract["address"].lower(): contract for contract in self.collections + self.erc20s}
+        self.deployed_at = {}
+        for contract in self.by_address.values():
+            self.deployed_at.setdefault(self.deploy_block(contract), []).append(contract)
+        self.latest_block = max([collection["deploy_block"] for collection in self.collections] + [0]) + collection_size * (transfers_per_token + 1)
+
+    def is_nft(self, contract):
+        return "total_supply" in contract
+
+    def contract_rows(self):
+        rows = []
+        for contract in self.collections + self.erc20s:
+            rows.append({
+                "ABI": nft_abi if self.is_nft(contract) else erc20_abi,
+                "Address": contract["address"].lower(),
+                "CompilerVersion": "v0.8.4+commit.c7e474f2",
+                "ContractName": contract["name"],
+                "OptimizationUsed": "true"
+            })
+        return rows
+
+    def transfers(self, collection):
+        # mint of token i at deploy_block + i, then transfers_per_token - 1 hops between holders
+        rows = []
+        previous_owner = {}
+        for hop in range(self.transfers_per_token):
+            for token_id in range(1, collection["total_supply"] + 1):
+                block_number = collection["deploy_block"] + hop * collection["total_supply"] + token_id
+                from_address = zero_address if hop == 0 else previous_owner[token_id]
+                to_address = collection["holders"][(token_id * (hop + 1)) % len(collection["holders"])].lower()
+                previous_owner[token_id] = to_address
+                rows.append({
+                    "address": collection["address"].lower(),
+                    "block_number": block_number,
+                    "from": from_address,
+                    "to": to_address,
+                    "token_id": token_id,
+                    "log_index": hop,
+                    "transaction_index": 0,
+                    "transaction_hash": "0x" + format(block_number * 1000 + hop, "064x")
+                })
+        return rows
+
+    def block_timestamp(self, block_number):
+        return genesis_timestamp + block_number * block_time_seconds
+
+    def deploy_block(self, contract):
+        # erc-20s are there from block 1
+        return contract.get("deploy_block", 1)
+
+    def deploy_transaction(self, contract):
+        # the creation transaction - sent by the owner, no recipient
+        return {
+            "blockNumber": hex(self.deploy_block(contract)),
+            "from": contract.get("owner", zero_address).lower(),
+            "hash": "0x" + format(self.deploy_block(contract), "064x"),
+            "to": None
+        }
+
+    def block(self, block_number, full_transactions):
+        transactions = [self.deploy_transaction(contract) for contract in self.deployed_at.get(block_number, [])]
+        return {
+            "number": hex(block_number),
+            "timestamp": hex(self.block_timestamp(block_number)),
+            "transactions": transactions if full_transactions else [tx["hash"] for tx in transactions]
+        }
+
+    def code(self, address, block_number):
+        contract = self.by_address.get(address.lower())
+        if contract is None or block_number < self.deploy_block(contract):
+            return "0x"
+        return "0x6080604052"
+
+    def receipt(self, transaction_hash):
+        block_number = int(transaction_hash, 16)
+        for contract in self.deployed_at.get(block_number, []):
+            return {"transactionHash": transaction_hash, "blockNumber": hex(block_number), "contractAddress": contract["address"].lower(), "status": "0x1"}
+        return None
+
+    def call(self, base_url, to, data):
+        # -> abi encoded return data, raises Reverted like a node would
+        to = to.lower()
+        selector, args = data[:4], data[4:]
+        if selector not in selectors:
+            raise Reverted("unknown selector")
+        fn_name, input_types = selectors[selector]
+        values = decode(input_types, args) if input_types else ()
+
+        if to == multicall3_address and fn_name == "aggregate3":
+            results = []
+            for target, allow_failure, call_data in values[0]:
+                try:
+                    results.append((True, self.call(base_url, target, call_data)))
+                except Reverted:
+                    if not allow_failure:
+                        raise
+                    results.append((False, b""))
+            return encode(["(bool,bytes)[]"], [results])
+
+        contract = self.by_address.get(to)
+        if contract is None:
+            raise Reverted("no contract")
+        if fn_name == "name":
+            return encode(["string"], [contract["name"]])
+        if fn_name == "symbol":
+            return encode(["string"], [contract["symbol"]])
+        if fn_name == "decimals" and not self.is_nft(contract):
+            return encode(["uint8"], [18])
+        if fn_name == "balanceOf" and not self.is_nft(contract):
+            return encode(["uint256"], [0])
+        if not self.is_nft(contract):
+            raise Reverted("not an nft")
+
+        total_supply = contract["total_supply"]
+        if fn_name == "owner":
+            return encode(["address"], [contract["owner"]])
+        if fn_name == "paused":
+            return encode(["bool"], [False])
+        if fn_name == "totalSupply":
+            return encode(["uint256"], [total_supply])
+        if fn_name == "supportsInterface":
+            return encode(["bool"], [True])
+        if fn_name == "tokenByIndex":
+            if values[0] >= total_supply:
+                raise Reverted("index out of range")
+            return encode(["uint256"], [values[0] + 1])
+        if not 1 <= values[0] <= total_supply:
+            raise Reverted("nonexistent token")
+        if fn_name == "tokenURI":
+            return encode(["string"], [f"{base_url}/metadata/{contract['address'].lower()}/{values[0]}.json"])
+        if fn_name == "ownerOf":
+            return encode(["address"], [contract["holders"][values[0] - 1]])
+        raise Reverted("unsupported call")
+
+
+class MockCelo:
+    # latency is added to every request, error_rate turns explorer/metadata requests into 503s (the client retries them)
+    def __init__(self, dataset, latency_seconds=0.0, error_rate=0.0, page_size=100, seed=0):
+        self.dataset = dataset
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.base_url = None
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def reset_counts(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def inject_error(self):
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                mock.handle_get(self)
+
+            def do_POST(self):
+                mock.handle_post(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def explorer_url(self):
+        return self.base_url + "/api"
+
+    @property
+    def rpc_url(self):
+        return self.base_url + "/rpc"
+
+    def send_json(self, handler, payload, status=200):
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def send_media(self, handler):
+        # a png served as octet-stream like many object stores do - Range is honoured
+        body = media_body
+        range_header = handler.headers.get("Range", "")
+        if range_header.startswith("bytes=0-"):
+            body = body[:int(range_header[len("bytes=0-"):]) + 1]
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes 0-{len(body) - 1}/{len(media_body)}")
+        else:
+            handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+        self.count("media_bytes", len(body))
+
+    def handle_get(self, handler):
+        time.sleep(self.latency_seconds)
+        url = urlparse(handler.path)
+        if self.inject_error():
+            self.count("error")
+            return self.send_json(handler, {"error": "injected"}, status=503)
+
+        if url.path.startswith("/metadata/"):
+            self.count("metadata")
+            _, _, contract_address, token_file = url.path.split("/")
+            token_id = token_file.split(".")[0]
+            return self.send_json(handler, {
+                "name": f"Bench #{token_id}",
+                "description": f"synthetic token of {contract_address}",
+                # extensionless and shared by many tokens - the media stage has to sniff it, once per distinct asset
+                "image": f"{self.base_url}/media/{contract_address}/{int(token_id) % media_variants}",
+                "attributes": [
+                    {"trait_type": "background", "value": ["celo", "gold", "green"][int(token_id) % 3]},
+                    {"trait_type": "level", "value": int(token_id) % 10}
+                ]
+            })
+
+        if url.path.startswith("/media/"):
+            self.count("media")
+            return self.send_media(handler)
+
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        action = query.get("action", "")
+        self.count("explorer:" + action)
+        self.send_json(handler, self.explorer_response(action, query))
+
+    def explorer_response(self, action, query):
+        dataset = self.dataset
+        if action == "listcontracts":
+            page_n = int(query.get("page", 1))
+            rows = dataset.contract_rows()[(page_n - 1) * self.page_size:page_n * self.page_size]
+            return {"message": "OK", "result": rows, "status": "1"}
+
+        contract = dataset.by_address.get(query.get("contractaddress", query.get("address", "")).lower())
+        if contract is None:
+            return {"message": "not found", "result": None, "status": "0"}
+
+        if action == "getabi":
+            return {"message": "OK", "result": nft_abi if dataset.is_nft(contract) else erc20_abi, "status": "1"}
+        if action == "getToken":
+            is_nft = dataset.is_nft(contract)
+            return {"message": "OK", "status": "1", "result": {
+                "contractAddress": contract["address"].lower(),
+                "name": contract["name"],
+                "symbol": contract["symbol"],
+                "type": "ERC-721" if is_nft else "ERC-20",
+                "decimals": "" if is_nft else "18",
+                "totalSupply": str(contract["total_supply"] if is_nft else 10 ** 24)
+            }}
+        if action == "txlist":
+            deploy_block = contract.get("deploy_block", 1)
+            return {"message": "OK", "status": "1", "result": [{
+                "blockNumber": str(deploy_block),
+                "from": contract.get("owner", zero_address).lower(),
+                "hash": "0x" + format(deploy_block, "064x"),
+                "timeStamp": str(dataset.block_timestamp(deploy_block))
+            }]}
+        if action == "tokentx":
+            from_block, to_block = int(query.get("fromBlock", 0)), int(query.get("toBlock", dataset.latest_block))
+            rows = [
+                {
+                    "address": transfer["address"],
+                    "blockNumber": format(transfer["block_number"], "x"),
+                    "data": "0x",
+                    "fromAddressHash": transfer["from"],
+                    "logIndex": format(transfer["log_index"], "x"),
+                    "timeStamp": format(dataset.block_timestamp(transfer["block_number"]), "X"),
+                    "toAddressHash": transfer["to"],
+                    "topics": self.transfer_topics(transfer),
+                    "transactionHash": transfer["transaction_hash"],
+                    "transactionIndex": format(transfer["transaction_index"], "x")
+                }
+                for transfer in self.transfers_in_range([contract["address"]], from_block, to_block)
+            ]
+            return {"message": "OK", "result": rows, "status": "1"}
+        return {"message": "unknown action", "result": None, "status": "0"}
+
+    def transfer_topics(self, transfer):
+        return [
+            transfer_topic,
+            "0x" + transfer["from"][2:].rjust(64, "0"),
+            "0x" + transfer["to"][2:].rjust(64, "0"),
+            "0x" + format(transfer["token_id"], "064x")
+        ]
+
+    def transfers_in_range(self, contract_addresses, from_block, to_block):
+        rows = []
+        for contract_address in contract_addresses:
+            contract = self.dataset.by_address.get(contract_address.lower())
+            if contract is None or not self.dataset.is_nft(contract):
+                continue
+            if "transfers" not in contract:
+                contract["transfers"] = self.dataset.transfers(contract)
+            rows.extend(transfer for transfer in contract["transfers"] if from_block <= transfer["block_number"] <= to_block)
+        return rows
+
+    def handle_post(self, handler):
+        time.sleep(self.latency_seconds)
+        payload = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))))
+        self.count("rpc_http")
+        if isinstance(payload, list):
+            return self.send_json(handler, [self.rpc_response(item) for item in payload])
+        self.send_json(handler, self.rpc_response(payload))
+
+    def rpc_response(self, item):
+        method, params = item["method"], item.get("params", [])
+        self.count("rpc:" + method)
+        response = {"jsonrpc": "2.0", "id": item.get("id")}
+        dataset = self.dataset
+
+        if method == "eth_chainId":
+            response["result"] = hex(42220)
+        elif method == "eth_blockNumber":
+            response["result"] = hex(dataset.latest_block)
+        elif method == "eth_getBlockByNumber":
+            response["result"] = dataset.block(to_int(params[0]), len(params) > 1 and params[1])
+        elif method == "eth_getCode":
+            response["result"] = dataset.code(params[0], dataset.latest_block if params[1] == "latest" else to_int(params[1]))
+        elif method == "eth_getTransactionReceipt":
+            response["result"] = dataset.receipt(params[0])
+        elif method == "eth_call":
+            try:
+                data = bytes.fromhex(params[0]["data"][2:])
+                response["result"] = "0x" + dataset.call(self.base_url, params[0]["to"], data).hex()
+            except Reverted as err:
+                response["error"] = {"code": 3, "message": f"execution reverted: {err}"}
+        elif method == "eth_getLogs":
+            log_filter = params[0]
+            addresses = log_filter["address"] if isinstance(log_filter["address"], list) else [log_filter["address"]]
+            from_block, to_block = to_int(log_filter["fromBlock"]), to_int(log_filter["toBlock"])
+            response["result"] = [
+                {
+                    "address": transfer["address"],
+                    "blockNumber": hex(transfer["block_number"]),
+                    "data": "0x",
+                    "logIndex": hex(transfer["log_index"]),
+                    "removed": False,
+                    "topics": self.transfer_topics(transfer),
+                    "transactionHash": transfer["transaction_hash"],
+                    "transactionIndex": hex(transfer["transaction_index"])
+                }
+                for transfer in self.transfers_in_range(addresses, from_block, to_block)
+            ]
+        else:
+            response["error"] = {"code": -32601, "message": f"method {method} not supported by the mock"}
+        return response
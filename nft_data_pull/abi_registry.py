@@ -0,0 +1,128 @@
+import json
+import hashlib
+import pandas as pd
+from eth_utils import to_checksum_address
+
+import storage
+
+# capability bits - one per view function later stages care about
+PAUSED = 1
+OWNER = 2
+SYMBOL = 4
+TOKEN_URI = 8
+TOTAL_SUPPLY = 16
+TOKEN_BY_INDEX = 32
+ERC165 = 64
+BASE_URI = 128
+NFT = TOKEN_URI | TOTAL_SUPPLY
+
+capability_functions = {
+    "paused": PAUSED,
+    "owner": OWNER,
+    "symbol": SYMBOL,
+    "tokenURI": TOKEN_URI,
+    "totalSupply": TOTAL_SUPPLY,
+    "tokenByIndex": TOKEN_BY_INDEX,
+    "supportsInterface": ERC165,
+    "baseURI": BASE_URI
+}
+
+# many collections are deployed from the same template - everything below is keyed by abi hash, parsed once
+abi_texts = {}
+parsed_abis = {}
+abi_capabilities = {}
+contract_factories = {}
+# address -> (abi_hash, capabilities)
+contract_index = {}
+contract_instances = {}
+
+
+def abi_hash(contract_abi):
+    # contract_abi: json string from the explorer or the parsed list
+    if not isinstance(contract_abi, str):
+        contract_abi = json.dumps(contract_abi, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha1(contract_abi.encode()).hexdigest()
+
+def register_abi(contract_abi):
+    # -> abi_hash, the abi is parsed and classified only the first time its hash is seen
+    hash_value = abi_hash(contract_abi)
+    if hash_value not in parsed_abis:
+        parsed = json.loads(contract_abi) if isinstance(contract_abi, str) else contract_abi
+        function_names = {item.get("name") for item in parsed if item.get("type") == "function"}
+        abi_texts[hash_value] = contract_abi if isinstance(contract_abi, str) else json.dumps(contract_abi)
+        parsed_abis[hash_value] = parsed
+        abi_capabilities[hash_value] = sum(flag for fn_name, flag in capability_functions.items() if fn_name in function_names)
+    return hash_value
+
+def capabilities(contract_abi):
+    # 0 for missing or malformed abis instead of raising - listcontracts has a few of those
+    try:
+        return abi_capabilities[register_abi(contract_abi)]
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+def has_capability(capability_bits, flag):
+    return capability_bits & flag == flag
+
+def register_contract(contract_address, contract_abi):
+    contract_address = to_checksum_address(contract_address)
+    hash_value = register_abi(contract_abi)
+    contract_index[contract_address] = (hash_value, abi_capabilities[hash_value])
+    return contract_index[contract_address]
+
+def contract_capabilities(contract_address):
+    return contract_index[to_checksum_address(contract_address)][1]
+
+def get_abi(contract_address):
+    # abi json string from the index, None for contracts that were never registered
+    contract_address = to_checksum_address(contract_address)
+    if contract_address not in contract_index:
+        return None
+    return abi_texts[contract_index[contract_address][0]]
+
+def get_contract(w3, contract_address, contract_abi=None):
+    # contract objects come from one factory per abi - built once per address
+    contract_address = to_checksum_address(contract_address)
+    if contract_address not in contract_instances:
+        if contract_abi is not None:
+            register_contract(contract_address, contract_abi)
+        hash_value = contract_index[contract_address][0]
+        if hash_value not in contract_factories:
+            register_abi(abi_texts[hash_value])
+            contract_factories[hash_value] = w3.eth.contract(abi=parsed_abis[hash_value])
+        contract_instances[contract_address] = contract_factories[hash_value](address=contract_address)
+    return contract_instances[contract_address]
+
+def write_index(df_contracts):
+    # df_contracts: explorer listcontracts rows (Address, ContractName, ABI) - merged into the persisted index
+    index_rows = []
+    for contract_address, contract_name, contract_abi in zip(df_contracts["Address"], df_contracts["ContractName"], df_contracts["ABI"]):
+        if not isinstance(contract_abi, str) or not contract_abi.startswith("["):
+            continue
+        contract_address = to_checksum_address(contract_address)
+        hash_value, capability_bits = register_contract(contract_address, contract_abi)
+        index_rows.append({"address": contract_address, "contract_name": contract_name, "abi_hash": hash_value, "capabilities": capability_bits})
+
+    df_index = pd.DataFrame(index_rows, columns=["address", "contract_name", "abi_hash", "capabilities"])
+    if storage.table_exists("contract_index"):
+        df_index = pd.concat([storage.read_table("contract_index"), df_index])
+    df_index = df_index.drop_duplicates("address", keep="last")
+    storage.write_table(df_index, "contract_index")
+
+    # one row per distinct abi instead of one per contract
+    df_abis = pd.DataFrame({"abi_hash": list(abi_texts), "abi": list(abi_texts.values())})
+    if storage.table_exists("abis"):
+        df_abis = pd.concat([storage.read_table("abis"), df_abis])
+    storage.write_table(df_abis.drop_duplicates("abi_hash"), "abis")
+
+def load_index():
+    # fills the registry from the persisted index - abis are parsed lazily when a contract is first used
+    if not storage.table_exists("contract_index") or not storage.table_exists("abis"):
+        return False
+    df_abis = storage.read_table("abis", columns=["abi_hash", "abi"])
+    abi_texts.update(zip(df_abis["abi_hash"], df_abis["abi"]))
+    df_index = storage.read_table("contract_index", columns=["address", "abi_hash", "capabilities"])
+    for contract_address, hash_value, capability_bits in zip(df_index["address"], df_index["abi_hash"], df_index["capabilities"]):
+        contract_index[to_checksum_address(contract_address)] = (hash_value, int(capability_bits))
+        abi_capabilities.setdefault(hash_value, int(capability_bits))
+    return True
@@ -0,0 +1,204 @@
+import os
+import time
+import sqlite3
+
+import config
+import ipfs
+import metrics
+
+def cache_key(url):
+    # ipfs content can never change - key it by cid (+ path) so any gateway url maps to the same entry
+    ipfs_path = ipfs.parse_ipfs_uri(url)
+    if ipfs_path is not None:
+        cid, path = ipfs_path
+        return "ipfs:" + cid + path, True
+    return url, False
+
+
+def connect(path):
+    # process pool workers share the file - writers wait for each other instead of failing right away
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=config.cache_busy_timeout_seconds)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def is_locked(err):
+    return isinstance(err, sqlite3.OperationalError) and "locked" in str(err)
+
+
+class MetadataCache:
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or config.metadata_cache_path
+        self.max_bytes = max_bytes or config.metadata_cache_max_bytes
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "evictions": 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                immutable INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        # total size kept by triggers in the file itself - every process sharing the cache sees the same total,
+        # so max_bytes caps the whole cache, not each process's share of it
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entries_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO entries_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM entries")
+        self.conn.execute("CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN UPDATE entries_size SET total = total + NEW.size; END")
+        self.conn.execute("CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN UPDATE entries_size SET total = total - OLD.size; END")
+        self.conn.commit()
+
+    def total_bytes(self):
+        return self.conn.execute("SELECT total FROM entries_size").fetchone()[0]
+
+    def get(self, url):
+        # returns {"body", "immutable", "etag", "last_modified"} or None
+        # a cache another process holds locked past the busy timeout is a miss, not a failed token
+        try:
+            return self._get(url)
+        except sqlite3.OperationalError as err:
+            if not is_locked(err):
+                raise
+            metrics.inc("cache_errors_total", cache="metadata", error="locked")
+            return None
+
+    def _get(self, url):
+        key, _ = cache_key(url)
+        row = self.conn.execute(
+            "SELECT body, immutable, etag, last_modified FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            metrics.inc("cache_requests_total", cache="metadata", result="miss")
+            return None
+
+        self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        entry = {"body": row[0], "immutable": bool(row[1]), "etag": row[2], "last_modified": row[3]}
+        if entry["immutable"]:
+            self.stats["hits"] += 1
+            metrics.inc("cache_requests_total", cache="metadata", result="hit")
+        return entry
+
+    def validators(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_revalidated(self):
+        # 304 from origin - the stored body is still current
+        self.stats["hits"] += 1
+        self.stats["revalidated"] += 1
+        metrics.inc("cache_requests_total", cache="metadata", result="revalidated")
+
+    def mark_stale(self):
+        # origin sent a new body - counts as a miss
+        self.stats["misses"] += 1
+        metrics.inc("cache_requests_total", cache="metadata", result="stale")
+
+    def put(self, url, body, headers=None):
+        # the fetched body is already in hand - a locked cache only means it isn't stored this time
+        try:
+            self._put(url, body, headers)
+        except sqlite3.OperationalError as err:
+            self.conn.rollback()
+            if not is_locked(err):
+                raise
+            metrics.inc("cache_errors_total", cache="metadata", error="locked")
+
+    def _put(self, url, body, headers=None):
+        key, immutable = cache_key(url)
+        headers = headers or {}
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+
+        # delete + insert rather than INSERT OR REPLACE - replaced rows don't fire delete triggers
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        # mutable responses without validators can't be revalidated - nothing to gain from storing them, but an
+        # older entry must go too, or its validators could get a 304 for a body that has since changed
+        if not immutable and not etag and not last_modified:
+            self.conn.commit()
+            return
+
+        self.conn.execute(
+            "INSERT INTO entries (key, immutable, etag, last_modified, body, size, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, int(immutable), etag, last_modified, body, len(body), time.time())
+        )
+
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        # drop least recently used entries until 90% of the cap is free again
+        target = self.max_bytes * 0.9
+        total_bytes = self.total_bytes()
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if total_bytes <= target:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total_bytes -= size
+            self.stats["evictions"] += 1
+            metrics.inc("cache_evictions_total", cache="metadata")
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class MediaTypeCache:
+    # content type per asset - ipfs assets by cid (+ path) forever, http urls for media_cache_ttl_seconds
+    # failed probes are remembered for media_negative_ttl_seconds so dead links aren't probed on every run
+    def __init__(self, path=None):
+        self.path = path or config.metadata_cache_path
+        self.stats = {"hits": 0, "misses": 0}
+
+        self.conn = connect(self.path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media_types (
+                key TEXT PRIMARY KEY,
+                immutable INTEGER NOT NULL,
+                mime_type TEXT,
+                checked_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, url):
+        # returns {"mime_type"} (mime_type None for a recent failed probe) or None when the url needs probing
+        key, _ = cache_key(url)
+        row = self.conn.execute("SELECT immutable, mime_type, checked_at FROM media_types WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            immutable, mime_type, checked_at = row
+            ttl = config.media_cache_ttl_seconds if mime_type is not None else config.media_negative_ttl_seconds
+            if (immutable and mime_type is not None) or time.time() - checked_at < ttl:
+                self.stats["hits"] += 1
+                metrics.inc("cache_requests_total", cache="media", result="hit")
+                return {"mime_type": mime_type}
+
+        self.stats["misses"] += 1
+        metrics.inc("cache_requests_total", cache="media", result="miss")
+        return None
+
+    def put(self, url, mime_type):
+        key, immutable = cache_key(url)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO media_types (key, immutable, mime_type, checked_at) VALUES (?, ?, ?, ?)",
+            (key, int(immutable), mime_type, time.time())
+        )
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
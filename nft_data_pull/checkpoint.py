@@ -0,0 +1,50 @@
+import os
+import json
+import threading
+
+import config
+
+# concurrent pipeline branches share the checkpoint file - read-modify-write under one lock
+lock = threading.Lock()
+
+
+def load_checkpoints(namespace, path=None):
+    # {contract_address: value} for one stage, e.g. "nft_transfers" -> last block pulled
+    path = path or config.checkpoint_path
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get(namespace, {})
+
+def save_checkpoint(namespace, contract_address, value, path=None):
+    with lock:
+        _save_checkpoint(namespace, contract_address, value, path or config.checkpoint_path)
+
+def _save_checkpoint(namespace, contract_address, value, path):
+    checkpoints = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoints = json.load(f)
+    checkpoints.setdefault(namespace, {})[contract_address] = value
+
+    # write to a temp file and swap it in so a crash never leaves a half written checkpoint file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoints, f, indent=4)
+    os.replace(tmp_path, path)
+
+def reset_checkpoints(namespace, path=None):
+    # forget a whole stage, e.g. when its table is rebuilt from scratch
+    path = path or config.checkpoint_path
+    with lock:
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            checkpoints = json.load(f)
+        if checkpoints.pop(namespace, None) is None:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoints, f, indent=4)
+        os.replace(tmp_path, path)
@@ -44,6 +44,15 @@ nft_info_columns=[
     "updated_at"
 ]
 
+# content hash of each token's metadata - attributes_hash is the hash its attribute rows were built from
+nft_metadata_hashes_columns=[
+    "collection_contract_address",
+    "nft_token_id",
+    "metadata_uri",
+    "metadata_hash",
+    "attributes_hash"
+]
+
 nft_token_attributes_columns=[
     "attribute_key",
     "attribute_type",
@@ -52,6 +61,8 @@ nft_token_attributes_columns=[
     "collection_contract_address",
     "collection_slug",
     "created_at",
+    "display_type",
+    "max_value",
     "nft_token_id",
     "updated_at"
 ]
@@ -103,7 +114,229 @@ nft_transfers_columns=[
     "transfer_type"
 ]
 
+# current holder of every token - written by pull_nft_ownership from the ownership index
+nft_owners_columns=[
+    "chain",
+    "collection_contract_address",
+    "nft_token_id",
+    "owner_address",
+    "last_transfer_block"
+]
+
 method_types={
     "0xddf252ad": "transfer",
     "0xa0712d68": "mint"
 }
+
+# metadata fetcher settings
+metadata_concurrency=64
+metadata_default_host_limit=16
+metadata_host_limits={
+    # all ipfs uris share one limit - the resolver spreads them over the gateways
+    "ipfs": 32
+}
+metadata_timeout_seconds=30
+
+# contract call aggregation settings
+# "multicall" packs calls into one Multicall3 aggregate3 call, "batch" sends a JSON-RPC batch of eth_calls
+rpc_aggregation_mode="multicall"
+rpc_batch_size=300
+multicall3_address="0xcA11bde05977b3631167028862bE2a173976CA11"
+multicall3_abi=[
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# metadata cache settings
+metadata_cache_path="./output/cache/metadata.sqlite"
+metadata_cache_max_bytes=2 * 1024 ** 3
+# process pool workers share the cache file - how long a writer waits for another one's lock
+cache_busy_timeout_seconds=30
+
+# media type probing settings
+# bytes requested per asset (Range) - enough for every signature media.py knows, svg xml prologs included
+media_sniff_bytes=512
+media_concurrency=32
+# gateways tried in health order before an ipfs asset counts as failed
+media_ipfs_gateway_attempts=2
+media_cache_ttl_seconds=30 * 24 * 3600
+media_negative_ttl_seconds=24 * 3600
+# ar://TX is served by this gateway
+arweave_gateway="https://arweave.net"
+
+# random tokens an inferred tokenURI template has to reproduce before it's trusted
+uri_template_verify_samples=5
+
+# collections without tokenByIndex take their token ids from the mints in nft_transfers - off by default:
+# the info stage then waits for the transfers stage so it never reads a half pulled table, and
+# attributes no longer run side by side with transfers
+token_discovery_mints=False
+
+# checkpoint settings
+checkpoint_path="./output/staging/checkpoints.json"
+nft_info_chunk_size=500
+
+# transfers ingestion settings
+# explorer caps the number of results per query - a full page means the block range was truncated
+explorer_max_results=10000
+transfers_block_chunk_size=1000000
+
+# eth_getLogs transfer extraction settings
+transfer_event_topic="0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+zero_address="0x0000000000000000000000000000000000000000"
+logs_block_window=50000
+# results a node returns per eth_getLogs call - windows well below it grow back towards logs_block_window
+logs_max_results=10000
+# error messages that mean the window was too wide or too dense - other get_logs errors don't shrink it
+logs_range_error_markers=["more than", "too many", "too large", "range", "limit exceeded", "-32005", "response size"]
+# shared block -> timestamp cache is cleared past this many blocks
+block_timestamp_cache_size=1000000
+logs_addresses_per_request=50
+# erc-4906 MetadataUpdate(uint256) / BatchMetadataUpdate(uint256,uint256)
+metadata_update_topic="0xf8e1a15aba9398e019f0b49df1a4fde98ee17ae345cb5f6b5e2c27f5033e8ce7"
+batch_metadata_update_topic="0x6bd5c950a8d8df17f772f5af37cb3655737899cbf903264b9795592da439661c"
+
+# deployment info for collections
+# "rpc" finds creation blocks by binary search over eth_getCode (needs an archive node), "explorer" asks txlist per contract
+# contracts the rpc lookup can't place (factory deployments, pruned state) always fall back to the explorer
+deployment_lookup="rpc"
+
+# ownership index settings
+# (contract, token_id) -> owner with its change history - see ownership.py
+ownership_index_path="./output/staging/ownership_index.npz"
+# bumped when rows already in nft_transfers are wrong - a table written by an older version is pulled again
+# 2: explorer rows had the sender as to_address
+nft_transfers_version=2
+
+# attribute extraction settings
+attributes_chunk_size=20000
+
+# output settings
+# "csv" or "parquet" (parquet needs pyarrow - poetry install -E parquet)
+output_format="csv"
+
+tables={
+    "contracts": {"path": "./output/staging/contracts", "columns": None, "partition_cols": []},
+    "contract_token": {"path": "./output/staging/contract_token", "columns": None, "partition_cols": []},
+    "nft_contracts": {"path": "./output/staging/nft_contracts", "columns": None, "partition_cols": []},
+    "contract_index": {"path": "./output/staging/contract_index", "columns": ["address", "contract_name", "abi_hash", "capabilities"], "partition_cols": []},
+    "abis": {"path": "./output/staging/abis", "columns": ["abi_hash", "abi"], "partition_cols": []},
+    "nft_metadata_hashes": {"path": "./output/staging/nft_metadata_hashes", "columns": nft_metadata_hashes_columns, "partition_cols": []},
+    "nft_collection_info": {"path": "./output/nft_collection_info", "columns": nft_collection_info_columns, "partition_cols": ["chain"]},
+    "nft_info": {"path": "./output/nft_info", "columns": nft_info_columns, "partition_cols": ["chain", "collection_contract_address"]},
+    "nft_token_attributes": {"path": "./output/nft_token_attributes", "columns": nft_token_attributes_columns, "partition_cols": ["chain", "collection_contract_address"]},
+    "nft_transfers": {"path": "./output/nft_transfers", "columns": nft_transfers_columns, "partition_cols": ["chain", "collection_contract_address"]},
+    "nft_owners": {"path": "./output/nft_owners", "columns": nft_owners_columns, "partition_cols": ["chain", "collection_contract_address"]}
+}
+
+# column types for typed outputs - columns not listed here are stored as strings, uint256 ones as decimal strings
+column_types={
+    "amount_raw": "uint256",
+    "block_number": "Int64",
+    "capabilities": "Int64",
+    "decimals": "Int64",
+    "deploy_block_number": "Int64",
+    "internal_index": "Int64",
+    "last_transfer_block": "Int64",
+    "log_index": "Int64",
+    "nft_token_id": "uint256",
+    "total_supply": "Int64"
+}
+
+# process pool settings
+# workers for the *_parallel stages - None uses every cpu, each worker gets 1/n of the rate limits
+scheduler_workers=None
+# token ids per nft_info work item - large collections are split so they don't become the long tail
+scheduler_range_size=2000
+
+# explorer pagination settings
+explorer_max_page=999
+explorer_page_workers=8
+
+# http client settings
+http_pool_size=64
+http_timeout_seconds=30
+http_max_retries=5
+http_backoff_base_seconds=0.5
+http_backoff_max_seconds=30
+# total time budget for one request including retries
+http_deadline_seconds=180
+http_retry_statuses=[429, 500, 502, 503, 504, 520, 522, 524]
+# tokens that still fail after retries before pull_nft_info gives up on a collection
+nft_info_max_errors=10
+
+# token bucket per endpoint: sustained requests/sec and burst size
+# every metadata host gets its own bucket with the "metadata" settings
+rate_limits={
+    "explorer": {"rate": 5, "burst": 10},
+    "rpc": {"rate": 25, "burst": 50},
+    "ipfs": {"rate": 20, "burst": 40},
+    "metadata": {"rate": 20, "burst": 40}
+}
+
+# ipfs gateway settings - every gateway gets its own "ipfs" rate limit bucket
+ipfs_gateways=[
+    # "http://127.0.0.1:8080",  # local ipfs node
+    "https://ipfs.io",
+    "https://cloudflare-ipfs.com",
+    "https://dweb.link",
+    "https://nftstorage.link"
+]
+# start a request on the next healthiest gateway when nothing came back within this delay
+ipfs_hedge_delay_seconds=1.5
+# max gateways racing for the same document
+ipfs_hedge_max=3
+ipfs_gateway_retries=1
+ipfs_gateway_deadline_seconds=30
+ipfs_initial_latency_seconds=1.0
+ipfs_health_alpha=0.2
+
+# metrics settings
+# metrics.prom (prometheus text) and run_summary.json are rewritten here after every stage
+metrics_path="./output/metrics"
+# serve /metrics for a prometheus scraper while the pipeline runs - None to disable
+metrics_port=None
+# None, "cprofile" or "pyinstrument" (pip install pyinstrument) - wraps the stages in metrics_profile_stages, all when empty
+metrics_profiler=None
+metrics_profile_stages=[]
+metrics_histogram_buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# pipeline runner settings (pipeline.py)
+# transfers stage: "explorer" (tokentx api, pull_nft_transfers) or "logs" (eth_getLogs, pull_nft_transfers_logs)
+transfer_engine="explorer"
+# nft_contracts stage: "contracts" filters the contracts table, "explorer" crawls listcontracts itself (pull_nft_contracts)
+nft_contracts_source="contracts"
+# run info / attributes / transfers on the process pool (the *_parallel stages)
+pipeline_parallel=False
+# stages running at the same time - independent branches like attributes and transfers
+pipeline_max_concurrent=3
+# tables kept in memory between chained stages of one run
+pipeline_memory_tables=["contracts", "nft_contracts", "nft_collection_info"]
+# input files up to this size are fingerprinted by content, bigger ones by size + mtime
+pipeline_hash_max_bytes=64 * 1024 ** 2
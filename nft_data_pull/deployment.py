@@ -0,0 +1,112 @@
+import sys
+from eth_utils import to_checksum_address
+
+import config
+import http_client
+import logs
+import rpc_batch
+
+# checksum address -> {"block_number", "timestamp", "transaction_hash", "from"} - "from" is checksummed too, whichever
+# lookup placed the contract, it stands in for the owner column
+# shared by every stage in the process - a contract is deployed only once
+deployments = {}
+
+
+def has_code(code):
+    return code not in (None, "", "0x", "0x0")
+
+def find_creation_blocks(w3, contract_addresses, latest_block):
+    # binary search for the first block with code, all contracts in lockstep -
+    # one json-rpc batch of eth_getCode per round, ~log2(latest_block) rounds however many contracts there are
+    # contracts the node can't answer for (pruned state, selfdestructed) are left out
+    codes = rpc_batch.batch_requests(w3, [("eth_getCode", [address, hex(latest_block)]) for address in contract_addresses])
+    bounds = {address: (0, latest_block) for address, code in zip(contract_addresses, codes) if has_code(code)}
+    creation_blocks = {}
+
+    while bounds:
+        searching = [address for address, (low, high) in bounds.items() if low < high]
+        for address in set(bounds) - set(searching):
+            creation_blocks[address] = bounds.pop(address)[0]
+        if not searching:
+            break
+
+        middles = [(bounds[address][0] + bounds[address][1]) // 2 for address in searching]
+        codes = rpc_batch.batch_requests(w3, [("eth_getCode", [address, hex(middle)]) for address, middle in zip(searching, middles)])
+        for address, middle, code in zip(searching, middles, codes):
+            low, high = bounds[address]
+            if code is None:
+                del bounds[address]
+            elif has_code(code):
+                bounds[address] = (low, middle)
+            else:
+                bounds[address] = (middle + 1, high)
+
+    return creation_blocks
+
+def find_creation_transactions(w3, creation_blocks):
+    # creation block -> the transaction whose receipt created the contract
+    # contracts deployed by a factory have no such transaction and are left out
+    block_numbers = sorted(set(creation_blocks.values()))
+    blocks = rpc_batch.batch_requests(w3, [("eth_getBlockByNumber", [hex(block_number), True]) for block_number in block_numbers])
+    block_timestamps = {}
+    creation_txs = []
+    for block_number, block in zip(block_numbers, blocks):
+        if block is None:
+            continue
+        block_timestamps[block_number] = int(block["timestamp"], 16)
+        # contract creations are the only transactions without a recipient
+        creation_txs.extend((block_number, tx) for tx in block.get("transactions", []) if isinstance(tx, dict) and not tx.get("to"))
+
+    receipts = rpc_batch.batch_requests(w3, [("eth_getTransactionReceipt", [tx["hash"]]) for _, tx in creation_txs])
+    created = {}
+    for (block_number, tx), receipt in zip(creation_txs, receipts):
+        if receipt and receipt.get("contractAddress"):
+            created[receipt["contractAddress"].lower()] = (block_number, tx)
+    # later transfer scans start at these blocks
+    logs.block_timestamp_cache.update(block_timestamps)
+
+    found = {}
+    for address, block_number in creation_blocks.items():
+        if address.lower() not in created:
+            continue
+        _, tx = created[address.lower()]
+        found[address] = {
+            "block_number": block_number,
+            "timestamp": block_timestamps[block_number],
+            "transaction_hash": tx["hash"],
+            "from": to_checksum_address(tx["from"])
+        }
+    return found
+
+def get_deployment_from_explorer(explorer_url, contract_address):
+    # one txlist call per contract - only for contracts the rpc lookup couldn't place
+    api_query = f"{explorer_url}/?module=account&action=txlist&address={contract_address}&sort=asc&start_block=0&page=1&offset=1"
+    first_tx = http_client.get_json(api_query)["result"][0]
+    return {
+        "block_number": int(first_tx["blockNumber"]),
+        "timestamp": int(first_tx["timeStamp"]),
+        "transaction_hash": first_tx["hash"],
+        "from": to_checksum_address(first_tx["from"])
+    }
+
+def resolve_deployments(w3, contract_addresses, explorer_url):
+    # -> {checksum address: deployment} for every contract that could be resolved
+    contract_addresses = [to_checksum_address(address) for address in contract_addresses]
+    missing = [address for address in contract_addresses if address not in deployments]
+
+    if missing and config.deployment_lookup == "rpc":
+        try:
+            creation_blocks = find_creation_blocks(w3, missing, w3.eth.block_number)
+            deployments.update(find_creation_transactions(w3, creation_blocks))
+        except:
+            print("deployment lookup error, falling back to explorer:", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+
+    for address in missing:
+        if address in deployments:
+            continue
+        try:
+            deployments[address] = get_deployment_from_explorer(explorer_url, address)
+        except:
+            print("deployment lookup error for", address, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+
+    return {address: deployments[address] for address in contract_addresses if address in deployments}
@@ -0,0 +1,119 @@
+import json
+import asyncio
+import aiohttp
+from urllib.parse import urlparse
+
+import config
+import http_client
+import ipfs
+import metrics
+
+
+@metrics.timed("parse_seconds", step="metadata_json")
+def parse_json(body):
+    return json.loads(body)
+
+def get_host(url):
+    # ipfs uris aren't tied to a host - they share the "ipfs" limit and the resolver picks gateways
+    if ipfs.parse_ipfs_uri(url):
+        return "ipfs"
+    return urlparse(url).netloc
+
+
+async def fetch_json(session, url, cache=None):
+    entry = None
+    headers = {}
+    if cache is not None:
+        entry = cache.get(url)
+        if entry is not None:
+            if entry["immutable"]:
+                return parse_json(entry["body"])
+            headers = cache.validators(entry)
+
+    ipfs_path = ipfs.parse_ipfs_uri(url)
+    if ipfs_path is not None:
+        body = await ipfs.fetch_ipfs(session, *ipfs_path)
+        if cache is not None:
+            cache.put(url, body)
+        return parse_json(body)
+
+    # rate limiting, retries and backoff are shared with the sync client in http_client
+    status, response_headers, body = await http_client.request_async(session, url, headers)
+    if status == 304 and entry is not None:
+        cache.mark_revalidated()
+        return parse_json(entry["body"])
+    # metadata hosts often serve json as text/plain or octet-stream - parse the raw body
+    result = parse_json(body)
+    if cache is not None:
+        if entry is not None:
+            cache.mark_stale()
+        cache.put(url, body, response_headers)
+    return result
+
+
+async def _worker(session, queue, host_limits, host_limit_default, on_result, state, cache):
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return
+            key, url = item
+            host = get_host(url)
+            if host not in host_limits:
+                host_limits[host] = asyncio.Semaphore(host_limit_default)
+            try:
+                async with host_limits[host]:
+                    result = await fetch_json(session, url, cache)
+                error = None
+            except Exception as err:
+                result, error = None, err
+                state["errors"] += 1
+            try:
+                on_result(key, url, result, error)
+            except Exception as err:
+                # metadata the caller can't use (e.g. no "image") counts towards max_errors like a failed fetch
+                if error is None:
+                    state["errors"] += 1
+                print("metadata error for", key, url, "\n", f"{type(err)}, {err}")
+        finally:
+            queue.task_done()
+
+
+async def fetch_metadata_async(items, on_result, concurrency=None, host_limits=None, max_errors=None, cache=None):
+    concurrency = concurrency or config.metadata_concurrency
+    host_limits = host_limits if host_limits is not None else config.metadata_host_limits
+    host_limit_default = max(1, min(concurrency, config.metadata_default_host_limit))
+    semaphores = {host: asyncio.Semaphore(limit) for host, limit in host_limits.items()}
+    state = {"errors": 0}
+
+    # one connector for the whole run so connections get reused across tokens and collections
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=config.metadata_timeout_seconds)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # bounded queue - items are pulled lazily so memory doesn't grow with collection size
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+        workers = [
+            asyncio.create_task(_worker(session, queue, semaphores, host_limit_default, on_result, state, cache))
+            for _ in range(concurrency)
+        ]
+
+        for item in items:
+            if max_errors is not None and state["errors"] >= max_errors:
+                break
+            await queue.put(item)
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return state["errors"]
+
+
+def fetch_metadata(items, on_result, concurrency=None, host_limits=None, max_errors=None, cache=None):
+    # items: iterable of (key, url)
+    # on_result(key, url, metadata, error) is called as each token completes - in completion order,
+    # an exception it raises is counted as an error of that token
+    # -> number of tokens that failed
+    # cache: optional cache.MetadataCache - immutable ipfs hits skip the network, http entries get revalidated
+    return asyncio.run(fetch_metadata_async(items, on_result, concurrency, host_limits, max_errors, cache))
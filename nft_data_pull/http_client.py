@@ -0,0 +1,268 @@
+import time
+import random
+import asyncio
+import threading
+import requests
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+import config
+import metrics
+
+# host -> endpoint name, e.g. explorer / rpc - anything unknown is a metadata host
+endpoint_hosts = {}
+buckets = {}
+buckets_lock = threading.Lock()
+session = None
+
+
+class TokenBucket:
+    # rate adapts to throttling: halved on 429 (down to 1/16 of the configured rate), recovers a little on every success
+    def __init__(self, rate, burst):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # takes a token and returns how long the caller has to wait before using it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait_time = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait_time, self.blocked_until - now)
+
+    def throttled(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"http status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def register_endpoint(url, endpoint):
+    if url:
+        endpoint_hosts[urlparse(url).netloc] = endpoint
+
+def endpoint_for(url):
+    host = urlparse(url).netloc
+    if host in endpoint_hosts:
+        return endpoint_hosts[host]
+    if host in [urlparse(gateway).netloc for gateway in config.ipfs_gateways]:
+        return "ipfs:" + host
+    return "metadata:" + host
+
+def get_bucket(endpoint):
+    with buckets_lock:
+        if endpoint not in buckets:
+            limits = config.rate_limits.get(endpoint.split(":")[0], config.rate_limits["metadata"])
+            buckets[endpoint] = TokenBucket(limits["rate"], limits["burst"])
+        return buckets[endpoint]
+
+def share_rate_limits(n_processes):
+    # a process pool worker gets 1/n of every endpoint's rate and burst - buckets aren't shared across processes
+    with buckets_lock:
+        for endpoint, limits in config.rate_limits.items():
+            config.rate_limits[endpoint] = {
+                "rate": limits["rate"] / n_processes,
+                "burst": max(1, limits["burst"] / n_processes)
+            }
+        buckets.clear()
+
+def get_session():
+    # one pooled session for all sync requests - connections are reused across stages
+    global session
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.http_pool_size, pool_maxsize=config.http_pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def backoff_seconds(attempt, retry_after=None):
+    # full jitter exponential backoff, never shorter than what the server asked for
+    delay = random.uniform(0, min(config.http_backoff_max_seconds, config.http_backoff_base_seconds * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+def check_status(bucket, status, headers):
+    if status == 429:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        bucket.throttled(retry_after)
+        raise RetryableStatus(status, retry_after)
+    if status in config.http_retry_statuses:
+        raise RetryableStatus(status, parse_retry_after(headers.get("Retry-After")))
+    bucket.succeeded()
+
+def record_response(endpoint, status, seconds, n_bytes):
+    # metadata hosts are grouped under one label - per host series would explode with every new collection
+    endpoint_label = "metadata" if endpoint.startswith("metadata:") else endpoint
+    metrics.inc("http_requests_total", endpoint=endpoint_label, status=status)
+    metrics.observe("http_request_seconds", seconds, endpoint=endpoint_label)
+    metrics.inc("http_bytes_total", n_bytes, endpoint=endpoint_label)
+
+def request(method, url, endpoint=None, deadline_seconds=None, max_retries=None, **kwargs):
+    endpoint = endpoint or endpoint_for(url)
+    bucket = get_bucket(endpoint)
+    deadline = time.monotonic() + (deadline_seconds or config.http_deadline_seconds)
+    max_retries = config.http_max_retries if max_retries is None else max_retries
+    kwargs.setdefault("timeout", config.http_timeout_seconds)
+
+    for attempt in range(max_retries + 1):
+        wait_time = bucket.reserve()
+        if time.monotonic() + wait_time > deadline:
+            raise TimeoutError(f"deadline exceeded for {url}")
+        time.sleep(wait_time)
+
+        start = time.perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+            record_response(endpoint, response.status_code, time.perf_counter() - start, len(response.content))
+            check_status(bucket, response.status_code, response.headers)
+            response.raise_for_status()
+            return response
+        except (RetryableStatus, requests.ConnectionError, requests.Timeout) as err:
+            retry_after = getattr(err, "retry_after", None)
+            delay = backoff_seconds(attempt, retry_after)
+            if attempt == max_retries or time.monotonic() + delay > deadline:
+                raise
+            metrics.inc("http_retries_total", endpoint=endpoint, reason=type(err).__name__)
+            time.sleep(delay)
+
+def get_json(url, **kwargs):
+    return request("GET", url, **kwargs).json()
+
+def post_json(url, payload, **kwargs):
+    return request("POST", url, json=payload, **kwargs).json()
+
+async def read_prefix(content, max_bytes):
+    # first max_bytes of a response body - servers that ignore Range still only get read this far
+    body = b""
+    while len(body) < max_bytes:
+        chunk = await content.read(max_bytes - len(body))
+        if not chunk:
+            break
+        body += chunk
+    return body
+
+async def request_async(aiohttp_session, url, headers=None, deadline_seconds=None, max_retries=None, max_bytes=None):
+    # aiohttp counterpart of request() sharing the same buckets - returns (status, headers, body)
+    # max_bytes: only the start of the body is requested (Range) and read
+    import aiohttp
+
+    if max_bytes is not None:
+        headers = dict(headers or {}, Range=f"bytes=0-{max_bytes - 1}")
+
+    endpoint = endpoint_for(url)
+    bucket = get_bucket(endpoint)
+    deadline = time.monotonic() + (deadline_seconds or config.http_deadline_seconds)
+    max_retries = config.http_max_retries if max_retries is None else max_retries
+
+    for attempt in range(max_retries + 1):
+        wait_time = bucket.reserve()
+        if time.monotonic() + wait_time > deadline:
+            raise TimeoutError(f"deadline exceeded for {url}")
+        await asyncio.sleep(wait_time)
+
+        start = time.perf_counter()
+        try:
+            async with aiohttp_session.get(url, headers=headers) as response:
+                body = await response.read() if max_bytes is None else await read_prefix(response.content, max_bytes)
+                record_response(endpoint, response.status, time.perf_counter() - start, len(body))
+                check_status(bucket, response.status, response.headers)
+                if response.status >= 400:
+                    response.raise_for_status()
+                return response.status, response.headers, body
+        except (RetryableStatus, aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+            retry_after = getattr(err, "retry_after", None)
+            delay = backoff_seconds(attempt, retry_after)
+            if attempt == max_retries or time.monotonic() + delay > deadline:
+                raise
+            metrics.inc("http_retries_total", endpoint=endpoint, reason=type(err).__name__)
+            await asyncio.sleep(delay)
+
+class LazyWeb3:
+    # stands in for a Web3 instance - web3 is imported and the provider built on first use,
+    # so stages that never talk to the node don't pay for either
+    def __init__(self, endpoint_uri):
+        self.endpoint_uri = endpoint_uri
+        self.instance = None
+
+    def __getstate__(self):
+        # sent to process pool workers as the endpoint only - each worker builds its own provider
+        return {"endpoint_uri": self.endpoint_uri, "instance": None}
+
+    def __getattr__(self, name):
+        if name == "instance":
+            raise AttributeError(name)
+        if self.instance is None:
+            from web3 import Web3
+
+            instance = Web3(Web3.HTTPProvider(self.endpoint_uri, request_kwargs={"timeout": config.http_timeout_seconds}, session=get_session()))
+            instance.middleware_onion.add(rate_limit_middleware)
+            self.instance = instance
+        return getattr(self.instance, name)
+
+def rate_limit_middleware(make_request, w3):
+    # web3 middleware - json-rpc calls made through w3 go through the rpc bucket too
+    bucket = get_bucket("rpc")
+
+    def middleware(method, params):
+        deadline = time.monotonic() + config.http_deadline_seconds
+        for attempt in range(config.http_max_retries + 1):
+            wait_time = bucket.reserve()
+            if time.monotonic() + wait_time > deadline:
+                raise TimeoutError(f"deadline exceeded for rpc {method}")
+            time.sleep(wait_time)
+
+            start = time.perf_counter()
+            try:
+                try:
+                    response = make_request(method, params)
+                except requests.HTTPError as err:
+                    # the provider raises on non-2xx - 429 / 5xx go through the same throttling and retries as request()
+                    if err.response is None:
+                        raise
+                    check_status(bucket, err.response.status_code, err.response.headers)
+                    raise
+                bucket.succeeded()
+                return response
+            except (RetryableStatus, requests.ConnectionError, requests.Timeout) as err:
+                retry_after = getattr(err, "retry_after", None)
+                delay = backoff_seconds(attempt, retry_after)
+                if attempt == config.http_max_retries or time.monotonic() + delay > deadline:
+                    raise
+                metrics.inc("http_retries_total", endpoint="rpc", reason=type(err).__name__)
+                time.sleep(delay)
+            finally:
+                metrics.inc("rpc_calls_total", method=method)
+                metrics.observe("rpc_call_seconds", time.perf_counter() - start, method=method)
+
+    return middleware
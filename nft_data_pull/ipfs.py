@@ -0,0 +1,130 @@
+import re
+import time
+import asyncio
+
+import config
+import http_client
+import metrics
+
+# CIDv0 (base58 Qm...) or CIDv1 (base32 b... e.g. bafy / bafk)
+cid_pattern = r"(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})"
+# ipfs://CID/path, ipfs://ipfs/CID/path
+ipfs_scheme_pattern = re.compile(r"^ipfs://(?:ipfs/)?" + cid_pattern + r"(/[^?#]*)?")
+# https://any.gateway/ipfs/CID/path
+gateway_path_pattern = re.compile(r"^https?://[^/]+/ipfs/" + cid_pattern + r"(/[^?#]*)?")
+# https://CID.ipfs.dweb.link/path
+subdomain_pattern = re.compile(r"^https?://" + cid_pattern + r"\.ipfs\.[^/]+(/[^?#]*)?")
+# bare CID (+ path) as some contracts return it
+bare_cid_pattern = re.compile(r"^/?" + cid_pattern + r"(/[^?#]*)?$")
+
+
+def parse_ipfs_uri(uri):
+    # -> (cid, path) for any ipfs form, None for plain http uris
+    uri = str(uri).strip()
+    for pattern in [ipfs_scheme_pattern, gateway_path_pattern, subdomain_pattern, bare_cid_pattern]:
+        match = pattern.match(uri)
+        if match:
+            return match.group(1), (match.group(2) or "").rstrip("/")
+    return None
+
+def to_ipfs_uri(uri):
+    # canonical gateway independent form - ipfs://CID/path
+    parsed = parse_ipfs_uri(uri)
+    if parsed is None:
+        return uri
+    cid, path = parsed
+    return f"ipfs://{cid}{path}"
+
+def gateway_url(gateway, cid, path):
+    return f"{gateway}/ipfs/{cid}{path}"
+
+
+class GatewayHealth:
+    # exponentially weighted latency and error rate - lower score is better
+    def __init__(self):
+        self.latency = config.ipfs_initial_latency_seconds
+        self.error_rate = 0.0
+
+    def record(self, latency=None, error=False):
+        alpha = config.ipfs_health_alpha
+        self.error_rate = (1 - alpha) * self.error_rate + alpha * (1.0 if error else 0.0)
+        if latency is not None:
+            self.latency = (1 - alpha) * self.latency + alpha * latency
+
+    def record_cancelled(self, elapsed):
+        # a request that lost the race would have taken at least `elapsed` - a lower bound,
+        # it only moves the latency up, so a primary that turns slow without failing is demoted
+        if elapsed > self.latency:
+            alpha = config.ipfs_health_alpha
+            self.latency = (1 - alpha) * self.latency + alpha * elapsed
+
+    def score(self):
+        return self.latency * (1 + 4 * self.error_rate)
+
+
+gateway_health = {}
+
+def get_health(gateway):
+    if gateway not in gateway_health:
+        gateway_health[gateway] = GatewayHealth()
+    return gateway_health[gateway]
+
+def ranked_gateways():
+    return sorted(config.ipfs_gateways, key=lambda gateway: get_health(gateway).score())
+
+async def fetch_from_gateway(session, gateway, cid, path):
+    start = time.monotonic()
+    try:
+        _, _, body = await http_client.request_async(
+            session, gateway_url(gateway, cid, path),
+            max_retries=config.ipfs_gateway_retries, deadline_seconds=config.ipfs_gateway_deadline_seconds
+        )
+    except asyncio.CancelledError:
+        # lost the race - not an error, but it was at least this slow
+        get_health(gateway).record_cancelled(time.monotonic() - start)
+        raise
+    except Exception:
+        get_health(gateway).record(error=True)
+        raise
+    get_health(gateway).record(latency=time.monotonic() - start)
+    return body
+
+async def fetch_ipfs(session, cid, path):
+    # hedged request: start on the healthiest gateway, add the next one whenever the running ones
+    # are slower than the hedge delay (up to ipfs_hedge_max at once) or one of them fails - first body wins
+    gateways = ranked_gateways()
+    pending = set()
+    errors = []
+    next_gateway = 0
+
+    def launch():
+        nonlocal next_gateway
+        pending.add(asyncio.create_task(fetch_from_gateway(session, gateways[next_gateway], cid, path)))
+        next_gateway += 1
+
+    launch()
+    try:
+        while pending:
+            can_hedge = next_gateway < len(gateways) and len(pending) < config.ipfs_hedge_max
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=config.ipfs_hedge_delay_seconds if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            failed = False
+            for task in done:
+                pending.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+                failed = True
+
+            # nothing back within the hedge delay, or a gateway failed - bring in the next one
+            if next_gateway < len(gateways) and (not done or failed):
+                metrics.inc("ipfs_hedged_requests_total", reason="failed" if failed else "slow")
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    raise errors[-1]
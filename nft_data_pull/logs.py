@@ -0,0 +1,160 @@
+import sys
+import time
+from datetime import datetime
+from eth_utils import to_checksum_address
+
+import config
+import http_client
+import metrics
+import rpc_batch
+
+# block number -> unix timestamp, shared by every lookup in the process - blocks never change once mined
+block_timestamp_cache = {}
+
+
+def to_bytes(value):
+    # web3 returns HexBytes, recorded fixtures / raw json-rpc return hex strings
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return bytes(value)
+
+def to_int(value):
+    if isinstance(value, str):
+        return int(value, 16)
+    return int(value)
+
+def get_block_timestamps(w3, block_numbers, block_timestamps=None):
+    # eth_getBlockByNumber in json-rpc batches for blocks not seen yet - blocks the node answered with an error
+    # are asked for again, a window is never decoded with timestamps missing
+    if block_timestamps is None:
+        # long transfer scans touch millions of blocks - start over instead of growing without bound
+        if len(block_timestamp_cache) > config.block_timestamp_cache_size:
+            block_timestamp_cache.clear()
+        block_timestamps = block_timestamp_cache
+    missing = sorted(set(block_numbers) - set(block_timestamps))
+
+    for attempt in range(config.http_max_retries + 1):
+        if not missing:
+            return block_timestamps
+        if attempt > 0:
+            time.sleep(http_client.backoff_seconds(attempt - 1))
+        blocks = rpc_batch.batch_requests(w3, [("eth_getBlockByNumber", [hex(block_number), False]) for block_number in missing])
+        for block_number, block in zip(missing, blocks):
+            if block is not None:
+                block_timestamps[block_number] = int(block["timestamp"], 16)
+        missing = [block_number for block_number, block in zip(missing, blocks) if block is None]
+
+    if missing:
+        raise ValueError(f"no timestamp for blocks {missing[:10]}{' ..' if len(missing) > 10 else ''} after {config.http_max_retries + 1} attempts")
+    return block_timestamps
+
+@metrics.timed("parse_seconds", step="transfer_logs")
+def decode_transfer_logs(raw_logs, block_timestamps):
+    # raw eth_getLogs entries -> rows with config.nft_transfers_columns, the same rows build_nft_transfer_rows
+    # makes from the explorer - lowercase holder addresses, checksum contract address
+    nft_tranfer_list = []
+    transfer_topic = to_bytes(config.transfer_event_topic)
+    block_datetimes = {}
+    contract_addresses = {}
+
+    for log in raw_logs:
+        topics = [to_bytes(topic) for topic in log["topics"]]
+        # erc-721 indexes tokenId - 3 topic Transfer events are erc-20
+        if len(topics) != 4 or topics[0] != transfer_topic:
+            continue
+
+        from_address = "0x" + topics[1][-20:].hex()
+        to_address = "0x" + topics[2][-20:].hex()
+        token_id = int.from_bytes(topics[3], "big")
+        block_number = to_int(log["blockNumber"])
+        if block_number not in block_datetimes:
+            block_datetimes[block_number] = datetime.fromtimestamp(block_timestamps[block_number]).replace(microsecond=0)
+        timestamp = block_datetimes[block_number]
+
+        if log["address"] not in contract_addresses:
+            contract_addresses[log["address"]] = to_checksum_address(log["address"])
+
+        nft_tranfer_row = {
+            "amount_raw": token_id,
+            "block_date": timestamp.date(),
+            "block_number": block_number,
+            "block_timestamp": timestamp.isoformat(),
+            "chain": "Celo",
+            "collection_contract_address": contract_addresses[log["address"]],
+            "from_address": from_address,
+            "internal_index": to_int(log["transactionIndex"]),
+            "log_index": to_int(log["logIndex"]),
+            "nft_token_id": token_id,
+            "to_address": to_address,
+            "transaction_hash": "0x" + to_bytes(log["transactionHash"]).hex(),
+            # transfers out of the zero address are mints - same rule as build_nft_transfer_rows
+            "transfer_type": "mint" if from_address == config.zero_address else "transfer"
+        }
+        nft_tranfer_list.append(nft_tranfer_row)
+
+    return nft_tranfer_list
+
+def is_range_error(err):
+    # nodes refuse wide or dense ranges ("query returned more than 10000 results", "block range too large") -
+    # only those shrink the window, connection resets and rate limits are not about the range
+    message = str(err).lower()
+    return any(marker in message for marker in config.logs_range_error_markers)
+
+def get_log_windows(w3, contract_addresses, topics, from_block, to_block):
+    # yields (window_to_block, raw_logs) - several contracts per request, block windows shrink when the node refuses a range
+    # and grow back over quiet ranges, so one dense stretch doesn't slow down the rest of the scan
+    block_window = config.logs_block_window
+
+    while from_block <= to_block:
+        window_to_block = min(from_block + block_window - 1, to_block)
+        try:
+            raw_logs = w3.eth.get_logs({
+                "fromBlock": from_block,
+                "toBlock": window_to_block,
+                "address": list(contract_addresses),
+                "topics": topics
+            })
+        except:
+            if window_to_block > from_block and is_range_error(sys.exc_info()[1]):
+                print("get_logs error, shrinking block window:", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+                block_window = max(1, block_window // 2)
+                continue
+            raise
+
+        yield window_to_block, raw_logs
+
+        if len(raw_logs) < config.logs_max_results // 4:
+            block_window = min(config.logs_block_window, block_window * 2)
+        from_block = window_to_block + 1
+
+def get_transfer_logs(w3, contract_addresses, from_block, to_block):
+    # yields (window_to_block, rows)
+    for window_to_block, raw_logs in get_log_windows(w3, contract_addresses, [config.transfer_event_topic], from_block, to_block):
+        block_timestamps = get_block_timestamps(w3, [to_int(log["blockNumber"]) for log in raw_logs])
+        yield window_to_block, decode_transfer_logs(raw_logs, block_timestamps)
+
+def decode_metadata_updates(raw_logs):
+    # erc-4906 events -> {checksum address: [(from_token_id, to_token_id)]}, single token updates are 1 wide ranges
+    update_topic = to_bytes(config.metadata_update_topic)
+    batch_update_topic = to_bytes(config.batch_metadata_update_topic)
+    updates = {}
+
+    for log in raw_logs:
+        topic = to_bytes(log["topics"][0])
+        # token ids are not indexed - they sit in the data as uint256 words
+        data = to_bytes(log["data"])
+        if topic == update_topic and len(data) >= 32:
+            token_range = (int.from_bytes(data[:32], "big"),) * 2
+        elif topic == batch_update_topic and len(data) >= 64:
+            token_range = (int.from_bytes(data[:32], "big"), int.from_bytes(data[32:64], "big"))
+        else:
+            continue
+        updates.setdefault(to_checksum_address(log["address"]), []).append(token_range)
+
+    return updates
+
+def get_metadata_updates(w3, contract_addresses, from_block, to_block):
+    # yields (window_to_block, {checksum address: [(from_token_id, to_token_id)]})
+    topics = [[config.metadata_update_topic, config.batch_metadata_update_topic]]
+    for window_to_block, raw_logs in get_log_windows(w3, contract_addresses, topics, from_block, to_block):
+        yield window_to_block, decode_metadata_updates(raw_logs)
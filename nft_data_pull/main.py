@@ -1,23 +1,55 @@
 import os
 import sys
+
+if __name__ == "__main__":
+    # stages and their dependencies are declared in pipeline.py - e.g. python main.py attributes transfers
+    # dispatched before the imports below: pipeline imports this module (pandas, numpy, every stage module) only
+    # once a stage runs, so --list or a run with nothing stale starts without them
+    import pipeline
+    pipeline.cli()
+    sys.exit()
+
 import ast
 import json
-import requests
 import mimetypes
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from datetime import datetime
-from web3 import Web3
 
+import abi_registry
+import cache
+import checkpoint
 import config
+import deployment
+import fetcher
+import http_client
+import ipfs
+import logs
+import media
+import metrics
+import ownership
+import paginator
+import refresh
+import rpc_batch
+import scheduler
+import storage
+import token_discovery
+import uri_template
 
 # load env vars
 load_dotenv()
 infura_url = os.getenv("INFURA_URL")
 
 # global vars
-w3 = Web3(Web3.HTTPProvider(infura_url))
+# the rpc provider is opened on first use - see http_client.LazyWeb3
+w3 = http_client.LazyWeb3(infura_url)
 celo_base_api_url = "https://explorer.celo.org/mainnet/api"
+# opened lazily by process pool workers - see get_metadata_cache
+worker_metadata_cache = None
+
+http_client.register_endpoint(celo_base_api_url, "explorer")
+http_client.register_endpoint(infura_url, "rpc")
 
 
 def hex_to_int(hex):
@@ -26,43 +58,75 @@ def hex_to_int(hex):
     except:
         return hex
 
-def pull_all_contracts():
-    contracts_list = []
+# ascii code -> hex digit value, -1 for anything that isn't a hex digit
+hex_digit_values = np.full(256, -1, dtype=np.int64)
+hex_digit_values[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+hex_digit_values[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+hex_digit_values[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
 
-    for page_n in range(1, 1000):
-        api_query = f"{celo_base_api_url}/?module=contract&action=listcontracts&filter=verified&page={page_n}"
-        contract = requests.get(api_query).json()
-        #with open('./tests/samples/contracts.json', 'w') as f:
-        #    json.dump(result, f, indent=4)
-        df_contract = pd.json_normalize(contract["result"])
-        if df_contract.empty:
-            break
-        else:
-            contracts_list.append(df_contract)
+def hex_series_to_int(series):
+    # vectorized hex_to_int - parses each distinct value once (block numbers, timestamps repeat a lot)
+    codes, uniques = pd.factorize(series)
+    digits = pd.Series(uniques).astype(str).str.replace(r"^0[xX]", "", regex=True).str.lstrip("0")
+    if len(digits) == 0:
+        return pd.Series([], index=series.index, dtype="int64")
+
+    # values that fit in int64 are parsed with numpy, wider ones (e.g. uint256 token ids) fall back to int()
+    if digits.str.len().max() <= 15 and (codes >= 0).all():
+        # right-align every value in a fixed width byte array and weight each nibble by its position
+        padded = np.array(digits.str.zfill(15).tolist(), dtype="S15").view(np.uint8).reshape(-1, 15)
+        values = hex_digit_values[padded]
+        if (values >= 0).all():
+            parsed = values @ (16 ** np.arange(14, -1, -1, dtype=np.int64))
+            return pd.Series(parsed[codes], index=series.index)
+
+    parsed = np.array([hex_to_int(value) for value in uniques], dtype=object)
+    return pd.Series(parsed[codes], index=series.index).where(codes >= 0)
+
+def build_contract_instances(df_contracts):
+    # {(contract_name, contract_address): (contract_instance, capabilities)}
+    # each distinct abi is parsed once by the registry - collections sharing a template share the work
+    contract_instances = {}
+
+    for contract_name, contract_address, contract_abi in zip(df_contracts["ContractName"], df_contracts["Address"], df_contracts["ABI"]):
+        try:
+            contract_address = w3.to_checksum_address(contract_address)
+            contract_instance = abi_registry.get_contract(w3, contract_address, contract_abi)
+            contract_instances[(str(contract_name), contract_address)] = (contract_instance, abi_registry.contract_capabilities(contract_address))
+        except:
+            print("exception for:", contract_address)
+            continue
+
+    return contract_instances
+
+@metrics.instrument_stage
+def pull_all_contracts():
+    api_query = f"{celo_base_api_url}/?module=contract&action=listcontracts&filter=verified"
+    contracts_list = paginator.fetch_all_pages(api_query)
+    #with open('./tests/samples/contracts.json', 'w') as f:
+    #    json.dump(result, f, indent=4)
 
     df_contracts = pd.concat(contracts_list)
-    df_contracts.to_csv("./output/staging/contracts.csv", index=False)
+    storage.write_table(df_contracts, "contracts")
+    abi_registry.write_index(df_contracts)
 
+@metrics.instrument_stage
 def get_active_contract_tokens():
-    df_contracts = pd.read_csv("./output/staging/contracts.csv")
+    df_contracts = storage.read_table("contracts", columns=["ABI", "Address", "ContractName"])
+    contract_instances = build_contract_instances(df_contracts)
     contract_token_list = []
 
-    for _, row in df_contracts.iterrows():
-        try:
-            contract_name = str(row["ContractName"])
-            contract_address = w3.to_checksum_address(row["Address"])
-            contract_abi = row["ABI"]
-
-            contract_instance = w3.eth.contract(address=contract_address, abi=contract_abi)
+    # paused() for all contracts in aggregated calls instead of one round trip each
+    paused_by_address = rpc_batch.call_many(w3, [c for c, bits in contract_instances.values() if bits & abi_registry.PAUSED], "paused")
 
+    for (contract_name, contract_address), (contract_instance, capability_bits) in contract_instances.items():
+        try:
             # filter out if contract is paused
-            if "paused" in contract_abi:
-                is_paused = contract_instance.functions.paused().call()
-                if is_paused is True:
-                    continue
+            if paused_by_address.get(contract_address) is True:
+                continue
             
             api_query = f"{celo_base_api_url}/?module=token&action=getToken&contractaddress={contract_address}"
-            token = requests.get(api_query).json()
+            token = http_client.get_json(api_query)
 
             # skip if status not 1 : OK
             if token["status"] != "1":
@@ -73,7 +137,7 @@ def get_active_contract_tokens():
             decimals = token["result"]["decimals"]
             
             # if blank - pull token symbol
-            if symbol == "" and "symbol" in contract_abi:
+            if symbol == "" and capability_bits & abi_registry.SYMBOL:
                 symbol = contract_instance.functions.symbol().call()
             
             # filter out basd on symbol name
@@ -94,57 +158,59 @@ def get_active_contract_tokens():
             continue
 
     df_contract_token_info = pd.DataFrame(contract_token_list)
-    df_contract_token_info.to_csv("./output/staging/contract_token.csv", index=False)
+    storage.write_table(df_contract_token_info, "contract_token")
 
-def pull_nft_contracts():
-    nft_contracts_list = []
+def filter_nft_contracts(df_contract):
+    if df_contract.empty:
+        return df_contract
 
-    for page_n in range(1, 1000):
-        api_query = f"{celo_base_api_url}/?module=contract&action=listcontracts&filter=verified&page={page_n}"
-        contract = requests.get(api_query).json()
-        #with open('./tests/samples/contracts.json', 'w') as f:
-        #    json.dump(result, f, indent=4)
-        df_contract = pd.json_normalize(contract["result"])
-        if df_contract.empty:
-            break
-        else:
-            # pre-filter contracts to only include ones that:
-            # - have tokenURI and totalSupply methods and..
-            df_filtered = df_contract[
-                df_contract["ABI"].str.contains("tokenURI", case=False) & 
-                df_contract["ABI"].str.contains("totalSupply", case=False)
-            ]
-
-            # - .. contract name doesn't contain "SmartContract" or "Test" strings
-            df_filtered = df_filtered[
-                df_filtered["ContractName"].str.contains("SmartContract|test", case=False) == False
-            ]
-            
-            nft_contracts_list.append(df_filtered)
+    # pre-filter contracts to only include ones that:
+    # - have tokenURI and totalSupply methods and..
+    capability_bits = df_contract["ABI"].map(abi_registry.capabilities)
+    df_filtered = df_contract[capability_bits.map(lambda bits: abi_registry.has_capability(bits, abi_registry.NFT))]
+
+    # - .. contract name doesn't contain "SmartContract" or "Test" strings
+    df_filtered = df_filtered[
+        df_filtered["ContractName"].str.contains("SmartContract|test", case=False) == False
+    ]
+    return df_filtered
+
+@metrics.instrument_stage
+def pull_nft_contracts():
+    api_query = f"{celo_base_api_url}/?module=contract&action=listcontracts&filter=verified"
+    # abi filtering runs per page as pages arrive - only nft contracts are held in memory
+    nft_contracts_list = paginator.fetch_all_pages(api_query, on_page=filter_nft_contracts)
 
     df_contracts = pd.concat(nft_contracts_list)
-    df_contracts.to_csv("./output/staging/nft_contracts.csv", index=False)
+    storage.write_table(df_contracts, "nft_contracts")
+    abi_registry.write_index(df_contracts)
+
+@metrics.instrument_stage
+def filter_all_contracts():
+    # pull_nft_contracts without a second listcontracts crawl - filters the contracts table pull_all_contracts wrote
+    df_contracts = filter_nft_contracts(storage.read_table("contracts"))
+    storage.write_table(df_contracts, "nft_contracts")
+    abi_registry.write_index(df_contracts)
 
+@metrics.instrument_stage
 def get_active_nft_collections():
-    df_nft_contracts = pd.read_csv("./output/staging/nft_contracts.csv")
+    df_nft_contracts = storage.read_table("nft_contracts", columns=["ABI", "Address", "ContractName"])
+    contract_instances = build_contract_instances(df_nft_contracts)
+    collections = []
     nft_collection_info_list = []
 
-    for _, row in df_nft_contracts.iterrows():
-        try:
-            contract_name = str(row["ContractName"])
-            contract_address = w3.to_checksum_address(row["Address"])
-            contract_abi = row["ABI"]
-
-            contract_instance = w3.eth.contract(address=contract_address, abi=contract_abi)
+    # paused() and owner() for all contracts in aggregated calls instead of one round trip each
+    paused_by_address = rpc_batch.call_many(w3, [c for c, bits in contract_instances.values() if bits & abi_registry.PAUSED], "paused")
+    owner_by_address = rpc_batch.call_many(w3, [c for c, bits in contract_instances.values() if bits & abi_registry.OWNER], "owner")
 
+    for (contract_name, contract_address), (contract_instance, capability_bits) in contract_instances.items():
+        try:
             # filter out if contract is paused
-            if "paused" in contract_abi:
-                is_paused = contract_instance.functions.paused().call()
-                if is_paused is True:
-                    continue
+            if paused_by_address.get(contract_address) is True:
+                continue
             
             api_query = f"{celo_base_api_url}/?module=token&action=getToken&contractaddress={contract_address}"
-            token = requests.get(api_query).json()
+            token = http_client.get_json(api_query)
 
             # skip if status not 1 : OK
             if token["status"] != "1":
@@ -162,108 +228,208 @@ def get_active_nft_collections():
                 continue
             
             # if blank - pull token symbol
-            if symbol == "" and "symbol" in contract_abi:
+            if symbol == "" and capability_bits & abi_registry.SYMBOL:
                 symbol = str(contract_instance.functions.symbol().call())
             
             # filter out basd on symbol name
             if "test" in symbol.lower():
                 continue
-            
-            api_query = f"{celo_base_api_url}/?module=account&action=txlist&address={contract_address}&sort=asc&start_block=0&page=1&offset=1"
-            first_tx = requests.get(api_query).json()
-            #with open('./tests/samples/first_tx.json', 'w') as f:
-            #    json.dump(result, f, indent=4)
-            timestamp = datetime.fromtimestamp(int(first_tx["result"][0]["timeStamp"])).replace(microsecond=0).isoformat()
-            
-            # pull owner
-            if "owner" in contract_abi:
-                owner = contract_instance.functions.owner().call()
-            if owner == "":
-                owner = first_tx["result"][0]["from"]
-            
-            nft_collection_info_row = {
-                "chain" : "Celo",
-                "collection_name" : contract_name,
-                "collection_slug" : contract_name.lower(),
-                "contract_address" : contract_address,
-                "created_date" : datetime.fromisoformat(timestamp).date(),
-                "deploy_block_number" : first_tx["result"][0]["blockNumber"],
-                "deploy_transaction_hash" : first_tx["result"][0]["hash"],
-                "owner" : owner,
-                "standard" : token_type,
-                "symbol" : symbol,
-                "total_supply" : total_supply
-            }
-            nft_collection_info_list.append(nft_collection_info_row)
+
+            collections.append((contract_name, contract_address, token_type, symbol, total_supply))
 
         except:
             print("exception for:", contract_address)
             continue
 
+    # creation block, transaction and sender for all remaining collections at once - see deployment.py
+    deployments = deployment.resolve_deployments(w3, [c[1] for c in collections], celo_base_api_url)
+
+    for contract_name, contract_address, token_type, symbol, total_supply in collections:
+        deploy_info = deployments.get(contract_address)
+        if deploy_info is None:
+            print("exception for:", contract_address)
+            continue
+        timestamp = datetime.fromtimestamp(deploy_info["timestamp"]).replace(microsecond=0).isoformat()
+
+        # pull owner
+        owner = owner_by_address.get(contract_address, "")
+        if owner == "":
+            owner = deploy_info["from"]
+
+        nft_collection_info_row = {
+            "chain" : "Celo",
+            "collection_name" : contract_name,
+            "collection_slug" : contract_name.lower(),
+            "contract_address" : contract_address,
+            "created_date" : datetime.fromisoformat(timestamp).date(),
+            "deploy_block_number" : deploy_info["block_number"],
+            "deploy_transaction_hash" : deploy_info["transaction_hash"],
+            "owner" : owner,
+            "standard" : token_type,
+            "symbol" : symbol,
+            "total_supply" : total_supply
+        }
+        nft_collection_info_list.append(nft_collection_info_row)
+
     df_nft_collection_info = pd.DataFrame(nft_collection_info_list, columns=config.nft_collection_info_columns)
-    df_nft_collection_info.to_csv("./output/nft_collection_info.csv", index=False)
+    storage.write_table(df_nft_collection_info, "nft_collection_info")
 
-def pull_nft_info():
-    df_nft_collection_info = pd.read_csv("./output/nft_collection_info.csv")
+@metrics.timed("parse_seconds", step="nft_info_row")
+def build_nft_info_row(contract_address, collection_name, collection_slug, token_id, token_uri, nft_metadata):
+    token_description = ""
+    if "description" in nft_metadata:
+        token_description = nft_metadata["description"]
+
+    return {
+        "animation_url": nft_metadata.get("animation_url"),
+        "chain": "Celo",
+        "collection_contract_address": contract_address,
+        "collection_name": collection_name,
+        "collection_slug": collection_slug,
+        "description": token_description,
+        # first guess from the extension - pull_nft_media_types replaces it with the sniffed type
+        "image_mime_type": mimetypes.guess_type(nft_metadata["image"])[0],
+        "image_url": nft_metadata["image"],
+        "metadata": json.dumps(nft_metadata),
+        "metadata_uri": token_uri,
+        "nft_token_id": token_id,
+        "token_name": nft_metadata["name"]
+    }
+
+def resolve_token_uris(contract_instance, token_ids, template, err_count):
+    # -> ([(token_id, token_uri)], err_count)
+    token_uris = []
+
+    # no template - pull tokenURIs in aggregated calls, a few hundred tokens per round trip
+    if template is None:
+        token_uri_results = rpc_batch.aggregate_calls(
+            w3, [(contract_instance, "tokenURI", (token_id,)) for token_id in token_ids]
+        )
+
+    for i, token_id in enumerate(token_ids):
+        try:
+            if template is not None:
+                token_uri = uri_template.render(template, token_id)
+            else:
+                token_uri_result = token_uri_results[i]
+                if not token_uri_result.success:
+                    raise ValueError("tokenURI call reverted")
+                token_uri = token_uri_result.value
+            
+            # ipfs://, gateway and bare cid forms all become ipfs://CID/path - gateways are picked at fetch time
+            token_uri = ipfs.to_ipfs_uri(token_uri)
+            token_uris.append((token_id, token_uri))
+        except:
+            err_count += 1
+            err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
+            print("nft_info token error for", contract_instance.address, "token_id:", token_id, "\n", err_msg)
+            if err_count >= config.nft_info_max_errors:
+                break
+
+    return token_uris, err_count
+
+def fetch_nft_info_rows(contract_instance, collection_name, collection_slug, token_ids, template, metadata_cache, err_count=0):
+    # -> (rows sorted by token id, err_count) for one chunk or range of tokens
+    contract_address = contract_instance.address
+    last_token_id = token_ids[-1]
     nft_info_list = []
 
+    token_uris, err_count = resolve_token_uris(contract_instance, token_ids, template, err_count)
+
+    def on_result(token_id, token_uri, nft_metadata, err):
+        if err is not None:
+            print("nft_info token error for", contract_address, "token_id:", token_id, "\n", f"{type(err)}, {err}")
+            return
+        # metadata without "image" / "name" raises here - the fetcher counts it towards max_errors
+        nft_info_list.append(
+            build_nft_info_row(contract_address, collection_name, collection_slug, token_id, token_uri, nft_metadata)
+        )
+        if token_id % 100 == 0 or token_id == last_token_id:
+            print("..", contract_address, "progress :", token_id)
+
+    # metadata is fetched concurrently - rows are appended as tokens complete
+    err_count += fetcher.fetch_metadata(token_uris, on_result, max_errors=config.nft_info_max_errors - err_count, cache=metadata_cache)
+
+    nft_info_list.sort(key=lambda nft_info_row: nft_info_row["nft_token_id"])
+    return nft_info_list, err_count
+
+def load_fetched_token_ids():
+    # {contract_address: {token_id}} with a row in nft_info - the table itself records what was fetched,
+    # so failed, late minted and sparse low ids are planned again however high the ids written after them
+    fetched_token_ids = {}
+    if not storage.table_exists("nft_info"):
+        return fetched_token_ids
+    for df_nft_info in storage.read_table_chunks("nft_info", columns=["collection_contract_address", "nft_token_id"]):
+        for contract_address, token_id in zip(df_nft_info["collection_contract_address"], df_nft_info["nft_token_id"]):
+            if pd.notna(token_id):
+                fetched_token_ids.setdefault(contract_address, set()).add(int(token_id))
+    return fetched_token_ids
+
+def get_contract_instance(contract_address):
+    # abi from the contract index written by pull_nft_contracts - getabi only for contracts it doesn't know
+    contract_abi = abi_registry.get_abi(contract_address)
+    if contract_abi is None:
+        api_query = f"{celo_base_api_url}/?module=contract&action=getabi&address={contract_address}"
+        contract_abi = http_client.get_json(api_query)["result"]
+    return contract_abi, abi_registry.get_contract(w3, contract_address, contract_abi)
+
+def plan_nft_info(collection_name, contract_address, total_supply, fetched_token_ids):
+    # -> (contract_abi, contract_instance, new_token_ids, template) - everything a collection needs before fetching
+    print(collection_name, ":", contract_address, "start,", len(fetched_token_ids), "tokens already pulled..")
+    contract_abi, contract_instance = get_contract_instance(contract_address)
+
+    # exact set of existing ids - 0 based, sparse and burned ids included correctly
+    token_ids, token_ids_source = token_discovery.discover_token_ids(
+        w3, contract_instance, contract_abi, contract_address, total_supply
+    )
+    # every existing token without a row yet
+    new_token_ids = [token_id for token_id in token_ids if token_id not in fetched_token_ids]
+    if not new_token_ids:
+        print(collection_name, ":", contract_address, "up to date..")
+        return contract_abi, contract_instance, [], None
+    print("..", contract_address, "token ids from", token_ids_source, ":", len(new_token_ids), "new of", len(token_ids))
+
+    # infer the tokenURI pattern from a few sampled tokens - uris are then built locally without rpc calls
+    template = uri_template.discover_template(w3, contract_instance, token_ids)
+    print("..", contract_address, "token_uri template :", template)
+
+    return contract_abi, contract_instance, new_token_ids, template
+
+@metrics.instrument_stage
+def pull_nft_info():
+    df_nft_collection_info = storage.read_table(
+        "nft_collection_info", columns=["collection_name", "collection_slug", "contract_address", "total_supply"]
+    )
+    metadata_cache = cache.MetadataCache()
+    fetched_token_ids = load_fetched_token_ids()
+    abi_registry.load_index()
+
     for _, row in df_nft_collection_info.iterrows():
         try:
             collection_name = str(row["collection_name"])
             collection_slug = str(row["collection_slug"])
             contract_address = w3.to_checksum_address(row["contract_address"])
-
-            print(collection_name, ":", contract_address, "start..")
-
-            api_query = f"{celo_base_api_url}/?module=contract&action=getabi&address={contract_address}"
-            contract_abi = requests.get(api_query).json()["result"]
-            contract_instance = w3.eth.contract(address=contract_address, abi=contract_abi)
             total_supply = int(row["total_supply"])
+
+            _, contract_instance, new_token_ids, template = plan_nft_info(
+                collection_name, contract_address, total_supply, fetched_token_ids.get(contract_address, set())
+            )
             err_count = 0
 
-            # get token_uri template for last token
-            token_uri_url = contract_instance.functions.tokenURI(total_supply).call()
-
-            for token_id in range(1, total_supply + 1):
-                try:
-                    if "/" + str(total_supply) in token_uri_url:
-                        token_uri = str(token_uri_url).replace("/" + str(total_supply), "/" + str(token_id))
-                    else:
-                        token_uri = contract_instance.functions.tokenURI(token_id).call()
-                    
-                    if "/Qm" in token_uri:
-                        token_uri = "https://ipfs.io/ipfs" + token_uri[str(token_uri).find("/Qm"):]
-                    nft_metadata = requests.get(token_uri).json()
-
-                    token_description = ""
-                    if "description" in nft_metadata:
-                        token_description = nft_metadata["description"]
-
-                    nft_info_row = {
-                        "chain": "Celo",
-                        "collection_contract_address": contract_address,
-                        "collection_name": collection_name,
-                        "collection_slug": collection_slug,
-                        "description": token_description,
-                        "image_mime_type": mimetypes.guess_type(nft_metadata["image"])[0],
-                        "image_url": nft_metadata["image"],
-                        "metadata": nft_metadata,
-                        "metadata_uri": token_uri,
-                        "nft_token_id": token_id,
-                        "token_name": nft_metadata["name"]
-                    }
-                    nft_info_list.append(nft_info_row)
+            for chunk_start in range(0, len(new_token_ids), config.nft_info_chunk_size):
+                chunk_token_ids = new_token_ids[chunk_start:chunk_start + config.nft_info_chunk_size]
 
-                    if token_id % 100 == 0 or token_id == total_supply:
-                        print("..", contract_address, "progress :", token_id)
-                except:
-                    err_count += 1
-                    err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
-                    print("nft_info token error for", contract_address, "token_id:", token_id, "\n", err_msg)
-                    if err_count < 10:
-                        continue
-                    else:
-                        break
+                nft_info_list, err_count = fetch_nft_info_rows(
+                    contract_instance, collection_name, collection_slug, chunk_token_ids, template, metadata_cache, err_count
+                )
+                if err_count >= config.nft_info_max_errors:
+                    # chunk isn't written - a rerun plans it again without duplicates
+                    print("nft_info too many errors for", collection_name, ":", contract_address, "stopped at token_id", chunk_token_ids[0])
+                    break
+
+                # tokens that failed on their own have no row - the next run picks them up
+                df_nft_info = pd.DataFrame(nft_info_list, columns=config.nft_info_columns)
+                storage.append_table(df_nft_info, "nft_info")
 
             print(collection_name, ":", contract_address, "end..")
         except:
@@ -271,47 +437,385 @@ def pull_nft_info():
             print("nft_info error for", collection_name, ":", contract_address, "\n", err_msg)
             continue
 
-    df_nft_info = pd.DataFrame(nft_info_list, columns=config.nft_info_columns)
-    #df_nft_info.to_csv("./output/nft_info.csv", index=False)
-    df_nft_info.to_csv("./output/nft_info.csv", mode="a", index=False, header=False)
+    metadata_cache.close()
+    print("metadata cache :", metadata_cache.stats)
 
-def pull_nft_token_attributes():
-    df_nft_info = pd.read_csv("./output/nft_info.csv")
-    nft_token_attributes_list = []
+def get_metadata_cache():
+    # one cache connection per worker process, opened on first use
+    global worker_metadata_cache
+    if worker_metadata_cache is None:
+        worker_metadata_cache = cache.MetadataCache()
+    return worker_metadata_cache
 
-    for _, row in df_nft_info.iterrows():
+def pull_nft_info_range(contract_address, contract_abi, collection_name, collection_slug, token_ids, template):
+    # process pool work item - one token id range of a collection, None when it hit the error limit
+    contract_instance = abi_registry.get_contract(w3, contract_address, contract_abi)
+    nft_info_list, err_count = fetch_nft_info_rows(
+        contract_instance, collection_name, collection_slug, token_ids, template, get_metadata_cache()
+    )
+    if err_count >= config.nft_info_max_errors:
+        print("nft_info too many errors for", collection_name, ":", contract_address, "range from token_id", token_ids[0])
+        return None
+    return pd.DataFrame(nft_info_list, columns=config.nft_info_columns)
+
+@metrics.instrument_stage
+def pull_nft_info_parallel(workers=None):
+    # pull_nft_info over a process pool - collections are planned here, token id ranges are fetched by the workers
+    df_nft_collection_info = storage.read_table(
+        "nft_collection_info", columns=["collection_name", "collection_slug", "contract_address", "total_supply"]
+    )
+    fetched_token_ids = load_fetched_token_ids()
+    abi_registry.load_index()
+    # parts left over from an interrupted run were never merged - they are fetched again
+    storage.drop_parts("nft_info")
+    items = []
+
+    for _, row in df_nft_collection_info.iterrows():
         try:
-            collection_contract_address = row["collection_contract_address"]
-            collection_slug = row["collection_slug"]
-            token_id = row["nft_token_id"]
+            collection_name = str(row["collection_name"])
+            collection_slug = str(row["collection_slug"])
+            contract_address = w3.to_checksum_address(row["contract_address"])
 
-            json_md = json.dumps(ast.literal_eval(row["metadata"]))
-            dict_md = json.loads(json_md)
-            
-            if "attributes" in dict_md:
-                df_md = pd.json_normalize(dict_md["attributes"]).rename(
-                    index=str,
-                    columns={"trait_type": "attribute_key", "value": "attribute_value"}
-                )
-                df_md["attribute_type"] = df_md["attribute_value"].apply(lambda s: type(s).__name__)
-                df_md["nft_token_id"] = token_id
-                df_md["chain"] = "Celo"
-                df_md["collection_contract_address"] = collection_contract_address
-                df_md["collection_slug"] = collection_slug
+            contract_abi, _, new_token_ids, template = plan_nft_info(
+                collection_name, contract_address, int(row["total_supply"]), fetched_token_ids.get(contract_address, set())
+            )
+
+            for token_ids in scheduler.split_ranges(new_token_ids):
+                part_name = f"{contract_address}-{token_ids[0]}"
+                items.append((part_name, len(token_ids), (contract_address, contract_abi, collection_name, collection_slug, token_ids, template)))
+        except:
+            err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
+            print("nft_info error for", collection_name, ":", contract_address, "\n", err_msg)
+            continue
+
+    results = scheduler.run_parallel(pull_nft_info_range, scheduler.largest_first(items), "nft_info", workers)
+
+    # ranges that hit the error limit aren't merged - their tokens have no row and are planned again next run
+    for part_name, _, _ in items:
+        if results.get(part_name) is None:
+            print("nft_info range not merged :", part_name)
+            continue
+        storage.merge_part("nft_info", part_name)
 
-                nft_token_attributes_list.append(df_md)
+    storage.drop_parts("nft_info")
 
-                if token_id % 100 == 0:
-                    print("..", collection_contract_address, "progress :", token_id)
+def get_animation_url(animation_url, metadata):
+    # rows written before animation_url was filled still carry it in their metadata
+    if isinstance(animation_url, str) and animation_url:
+        return animation_url
+    try:
+        animation_url = parse_metadata(metadata).get("animation_url")
+    except:
+        return None
+    return animation_url if isinstance(animation_url, str) and animation_url else None
+
+def pending_media_rows(df_nft_info):
+    # tokens never probed successfully - internet_mime_type is only set once the token's main asset has a type
+    return df_nft_info[df_nft_info["internet_mime_type"].isna()]
+
+def fill_media_types(df_nft_info, media_types):
+    pending = df_nft_info["internet_mime_type"].isna()
+    if not pending.any():
+        return df_nft_info
+
+    df_nft_info = df_nft_info.copy()
+    for column in ["animation_url", "image_mime_type", "internet_mime_type"]:
+        df_nft_info[column] = df_nft_info[column].astype(object)
+
+    for i in df_nft_info.index[pending]:
+        animation_url = get_animation_url(df_nft_info.at[i, "animation_url"], df_nft_info.at[i, "metadata"])
+        image_mime_type = media_types.get(df_nft_info.at[i, "image_url"])
+        df_nft_info.at[i, "animation_url"] = animation_url
+        if image_mime_type is not None:
+            df_nft_info.at[i, "image_mime_type"] = image_mime_type
+        # the asset the token is about - its animation when it has one
+        df_nft_info.at[i, "internet_mime_type"] = media_types.get(animation_url) if animation_url else image_mime_type
+
+    return df_nft_info
+
+@metrics.instrument_stage
+def pull_nft_media_types():
+    # content types of image_url / animation_url from a few hundred bytes per distinct asset - see media.py
+    if not storage.table_exists("nft_info"):
+        return
+    media_cache = cache.MediaTypeCache()
+    # uri -> mime type, every distinct asset of the run
+    media_types = {}
+    pending_count = 0
+    resolved_count = 0
+
+    # first pass probes - nft_info is only rewritten when something new was learned
+    for df_nft_info in storage.read_table_chunks(
+        "nft_info", columns=["image_url", "animation_url", "metadata", "internet_mime_type"]
+    ):
+        df_pending = pending_media_rows(df_nft_info)
+        if df_pending.empty:
+            continue
+        animation_urls = [
+            get_animation_url(animation_url, metadata) for animation_url, metadata in zip(df_pending["animation_url"], df_pending["metadata"])
+        ]
+        uris = [uri for uri in list(df_pending["image_url"]) + animation_urls if uri not in media_types]
+        media_types.update(media.probe_media_types(uris, media_cache))
+        pending_count += len(df_pending)
+        resolved_count += sum(
+            media_types.get(animation_url if animation_url else image_url) is not None
+            for image_url, animation_url in zip(df_pending["image_url"], animation_urls)
+        )
+        print("..", "nft media types progress :", pending_count, "tokens,", len(media_types), "assets")
+
+    media_cache.close()
+    print("nft media types : resolved", resolved_count, "of", pending_count, "tokens, media cache :", media_cache.stats)
+    # tokens whose assets still can't be probed stay pending - no rewrite unless one of them got its type
+    if resolved_count == 0:
+        return
+
+    storage.rewrite_table("nft_info", lambda df_nft_info: fill_media_types(df_nft_info, media_types))
+
+def add_missing_hashes(hashes):
+    # tokens pulled since the last refresh get the hash of the row already in nft_info - no network
+    for df_nft_info in storage.read_table_chunks(
+        "nft_info", columns=["collection_contract_address", "nft_token_id", "metadata_uri", "metadata"]
+    ):
+        for contract_address, token_id, metadata_uri, metadata in zip(
+            df_nft_info["collection_contract_address"], df_nft_info["nft_token_id"], df_nft_info["metadata_uri"], df_nft_info["metadata"]
+        ):
+            key = (contract_address, int(token_id))
+            if key not in hashes:
+                metadata_hash = refresh.content_hash(parse_metadata(metadata))
+                # attribute rows were built from this same row
+                hashes[key] = {"metadata_uri": metadata_uri, "metadata_hash": metadata_hash, "attributes_hash": metadata_hash}
+    return hashes
+
+def get_metadata_update_ranges(contract_addresses, from_blocks, latest_block):
+    # erc-4906 events since each collection's last refresh -> {contract_address: [(from_token_id, to_token_id)]}
+    # contracts whose scan failed are left out - they are skipped this time and scanned again next time
+    update_ranges = {}
+    for i in range(0, len(contract_addresses), config.logs_addresses_per_request):
+        address_group = contract_addresses[i:i + config.logs_addresses_per_request]
+        from_block = min(from_blocks[address] for address in address_group)
+        group_ranges = {address: [] for address in address_group}
+        try:
+            for _, updates in logs.get_metadata_updates(w3, address_group, from_block, latest_block):
+                for contract_address, token_ranges in updates.items():
+                    group_ranges.setdefault(contract_address, []).extend(token_ranges)
+            update_ranges.update(group_ranges)
+        except:
+            err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
+            print("metadata update events error for", address_group, "\n", err_msg)
+            continue
+    return update_ranges
+
+@metrics.instrument_stage
+def refresh_nft_info():
+    # re-fetches only tokens whose metadata may have changed since the last refresh:
+    # every token after a baseURI change / reveal, the tokens named by erc-4906 events otherwise
+    df_nft_collection_info = storage.read_table(
+        "nft_collection_info", columns=["collection_name", "collection_slug", "contract_address", "deploy_block_number"]
+    )
+    # contract_address -> {"block": last block scanned for events, "base_uri": baseURI at that point}
+    checkpoints = checkpoint.load_checkpoints("nft_refresh")
+    abi_registry.load_index()
+    metadata_cache = cache.MetadataCache()
+    hashes = add_missing_hashes(refresh.load_hashes())
+    latest_block = w3.eth.block_number
+
+    # {contract_address: {token_id: metadata_uri}} for tokens already in nft_info
+    stored_uris = {}
+    for (contract_address, token_id), entry in hashes.items():
+        stored_uris.setdefault(contract_address, {})[token_id] = entry["metadata_uri"]
+
+    contract_addresses = [w3.to_checksum_address(address) for address in df_nft_collection_info["contract_address"]]
+    from_blocks = {
+        address: int(checkpoints.get(address, {}).get("block", int(deploy_block) - 1 if pd.notna(deploy_block) else -1)) + 1
+        for address, deploy_block in zip(contract_addresses, df_nft_collection_info["deploy_block_number"])
+    }
+    update_ranges = get_metadata_update_ranges([address for address in contract_addresses if address in stored_uris], from_blocks, latest_block)
+
+    nft_info_list = []
+    refreshed = {}
+    for (_, row), contract_address in zip(df_nft_collection_info.iterrows(), contract_addresses):
+        if contract_address not in stored_uris or contract_address not in update_ranges:
+            continue
+        try:
+            collection_name = str(row["collection_name"])
+            collection_slug = str(row["collection_slug"])
+            token_uris = stored_uris[contract_address]
+            _, contract_instance = get_contract_instance(contract_address)
+
+            # one baseURI call is the cheapest check - sampled tokenURIs cover contracts without it
+            base_uri = None
+            if abi_registry.contract_capabilities(contract_address) & abi_registry.BASE_URI:
+                base_uri = refresh.read_base_uri(w3, contract_instance)
+            previous_base_uri = checkpoints.get(contract_address, {}).get("base_uri")
+            base_uri_changed = base_uri is not None and previous_base_uri is not None and base_uri != previous_base_uri
+
+            if base_uri_changed or refresh.sample_uris_changed(w3, contract_instance, token_uris):
+                token_ids = sorted(token_uris)
+                template = uri_template.discover_template(w3, contract_instance, token_ids)
+                print(collection_name, ":", contract_address, "token uris changed, refreshing all", len(token_ids), "tokens..")
+            else:
+                token_ids = refresh.token_ids_in_ranges(sorted(token_uris), update_ranges[contract_address])
+                template = None
+                print(collection_name, ":", contract_address, "metadata update events for", len(token_ids), "tokens..")
+
+            changed_count = 0
+            for chunk_start in range(0, len(token_ids), config.nft_info_chunk_size):
+                chunk_token_ids = token_ids[chunk_start:chunk_start + config.nft_info_chunk_size]
+                # http metadata goes out with If-None-Match / If-Modified-Since from the cache - unchanged tokens cost a 304
+                chunk_rows, _ = fetch_nft_info_rows(contract_instance, collection_name, collection_slug, chunk_token_ids, template, metadata_cache)
+
+                for nft_info_row in chunk_rows:
+                    entry = hashes[(contract_address, nft_info_row["nft_token_id"])]
+                    metadata_hash = refresh.content_hash(json.loads(nft_info_row["metadata"]))
+                    if metadata_hash == entry["metadata_hash"] and nft_info_row["metadata_uri"] == entry["metadata_uri"]:
+                        continue
+                    entry["metadata_hash"] = metadata_hash
+                    entry["metadata_uri"] = nft_info_row["metadata_uri"]
+                    nft_info_list.append(nft_info_row)
+                    changed_count += 1
+
+            refreshed[contract_address] = {"block": latest_block, "base_uri": base_uri}
+            print(collection_name, ":", contract_address, "end.. changed tokens:", changed_count)
+        except:
+            err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
+            print("nft_info refresh error for", contract_address, "\n", err_msg)
+            continue
+
+    # changed rows replace their old versions in one pass over nft_info, then the hashes and checkpoints follow -
+    # a crash in between only means the same tokens are compared again next time
+    if nft_info_list:
+        storage.replace_rows(pd.DataFrame(nft_info_list, columns=config.nft_info_columns), "nft_info", ["collection_contract_address", "nft_token_id"])
+    refresh.write_hashes(hashes)
+    for contract_address, state in refreshed.items():
+        checkpoint.save_checkpoint("nft_refresh", contract_address, state)
+
+    metadata_cache.close()
+    print("nft_info refresh : changed tokens", len(nft_info_list), "metadata cache :", metadata_cache.stats)
+
+def parse_metadata(metadata):
+    # metadata is written as json - rows from older runs still hold the python repr of the dict
+    try:
+        return json.loads(metadata)
+    except ValueError:
+        return ast.literal_eval(metadata)
+
+@metrics.timed("parse_seconds", step="attribute_rows")
+def build_nft_token_attribute_rows(df_nft_info):
+    # one flat pass over a chunk of tokens - no per token DataFrame
+    nft_token_attributes_list = []
+
+    for collection_contract_address, collection_slug, token_id, metadata in zip(
+        df_nft_info["collection_contract_address"], df_nft_info["collection_slug"], df_nft_info["nft_token_id"], df_nft_info["metadata"]
+    ):
+        try:
+            dict_md = parse_metadata(metadata)
+            attributes = dict_md.get("attributes", [])
+            if isinstance(attributes, dict):
+                attributes = [attributes]
+
+            for attribute in attributes:
+                if not isinstance(attribute, dict):
+                    continue
+                attribute_value = attribute.get("value")
+                nft_token_attributes_list.append({
+                    "attribute_key": attribute.get("trait_type"),
+                    "attribute_type": type(attribute_value).__name__,
+                    "attribute_value": attribute_value,
+                    "chain": "Celo",
+                    "collection_contract_address": collection_contract_address,
+                    "collection_slug": collection_slug,
+                    "created_at": "",
+                    # opensea's optional trait keys - columns of their own, as json_normalize made them before
+                    "display_type": attribute.get("display_type"),
+                    "max_value": attribute.get("max_value"),
+                    "nft_token_id": token_id,
+                    "updated_at": ""
+                })
         except:
             err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
             print("nft_token_attributes error for", collection_contract_address, "tokenId:", token_id, "\n", err_msg)
             continue
 
-    df_nft_token_attributes = pd.concat(nft_token_attributes_list)
-    df_nft_token_attributes[["created_at", "updated_at"]] = ""
-    df_nft_token_attributes.to_csv("./output/nft_token_attributes.csv", index=False)
+    return pd.DataFrame(nft_token_attributes_list, columns=config.nft_token_attributes_columns)
+
+@metrics.instrument_stage
+def pull_nft_token_attributes():
+    storage.drop_table("nft_token_attributes")
+
+    # stream nft_info in chunks and append each chunk's attributes - memory stays flat
+    df_nft_info_chunks = storage.read_table_chunks(
+        "nft_info", columns=["collection_contract_address", "collection_slug", "nft_token_id", "metadata"]
+    )
+    token_count = 0
 
+    for df_nft_info in df_nft_info_chunks:
+        df_nft_token_attributes = build_nft_token_attribute_rows(df_nft_info)
+        storage.append_table(df_nft_token_attributes, "nft_token_attributes")
+
+        token_count += len(df_nft_info)
+        print("..", "nft_token_attributes progress :", token_count)
+
+    mark_attributes_current()
+
+@metrics.instrument_stage
+def pull_nft_token_attributes_parallel(workers=None):
+    # metadata parsing is cpu bound - nft_info chunks are spread over a process pool and merged back in order
+    storage.drop_table("nft_token_attributes")
+    storage.drop_parts("nft_token_attributes")
+
+    df_nft_info_chunks = storage.read_table_chunks(
+        "nft_info", columns=["collection_contract_address", "collection_slug", "nft_token_id", "metadata"]
+    )
+    items = ((f"{i:06d}", len(df_nft_info), (df_nft_info,)) for i, df_nft_info in enumerate(df_nft_info_chunks))
+    results = scheduler.run_parallel(build_nft_token_attribute_rows, items, "nft_token_attributes", workers)
+
+    for part_name in sorted(results):
+        if results[part_name] is not None:
+            storage.merge_part("nft_token_attributes", part_name)
+
+    storage.drop_parts("nft_token_attributes")
+    mark_attributes_current()
+
+def mark_attributes_current():
+    # a full rebuild covers every token - nothing left for refresh_nft_token_attributes
+    if not storage.table_exists("nft_metadata_hashes"):
+        return
+    hashes = refresh.load_hashes()
+    for entry in hashes.values():
+        entry["attributes_hash"] = entry["metadata_hash"]
+    refresh.write_hashes(hashes)
+
+@metrics.instrument_stage
+def refresh_nft_token_attributes():
+    # attribute rows are rebuilt only for tokens whose metadata hash moved since their rows were built
+    hashes = refresh.load_hashes()
+    changed = {key for key, entry in hashes.items() if entry["metadata_hash"] != entry["attributes_hash"]}
+    if not changed:
+        print("nft_token_attributes up to date..")
+        return
+
+    df_nft_info_chunks = storage.read_table_chunks(
+        "nft_info", columns=["collection_contract_address", "collection_slug", "nft_token_id", "metadata"],
+        filters=[("collection_contract_address", "in", sorted({contract_address for contract_address, _ in changed}))]
+    )
+    df_list = []
+    for df_nft_info in df_nft_info_chunks:
+        keep = [
+            (contract_address, int(token_id)) in changed
+            for contract_address, token_id in zip(df_nft_info["collection_contract_address"], df_nft_info["nft_token_id"])
+        ]
+        df_list.append(build_nft_token_attribute_rows(df_nft_info[keep]))
+
+    # old rows of changed tokens go even when the new metadata has no attributes at all
+    df_nft_token_attributes = pd.concat(df_list, ignore_index=True) if df_list else pd.DataFrame(columns=config.nft_token_attributes_columns)
+    storage.replace_rows(df_nft_token_attributes, "nft_token_attributes", ["collection_contract_address", "nft_token_id"], remove_keys=changed)
+
+    for key in changed:
+        hashes[key]["attributes_hash"] = hashes[key]["metadata_hash"]
+    refresh.write_hashes(hashes)
+    print("nft_token_attributes refreshed for", len(changed), "tokens")
+
+@metrics.instrument_stage
 def pull_nft_transactions():
     contract_address = "0x179513e0fa9B5AD964405B01194105A2d8e0c2df" # just test
 
@@ -321,7 +825,7 @@ def pull_nft_transactions():
     """
     for page_n in range(1, 1000):
         api_query = f"{celo_base_api_url}/?module=account&action=txlist&address={contract_address}&sort=asc&page={page_n}"
-        result = requests.get(api_query).json()
+        result = http_client.get_json(api_query)
         with open('./tests/samples/transactions.json', 'w') as f:
             json.dump(result, f, indent=4)
         df = pd.json_normalize(result["result"])
@@ -371,66 +875,215 @@ def pull_nft_transactions():
             "value_currency": ""
         }
 
+@metrics.timed("parse_seconds", step="transfer_rows")
+def build_nft_transfer_rows(df_transfers, contract_address):
+    # columnar version of the per-row normalization - explorer returns hex strings for the numeric fields
+    # every transfer in a block shares a timestamp - convert each distinct one to local time once
+    timestamp_codes, unique_timestamps = pd.factorize(hex_series_to_int(df_transfers["timeStamp"]))
+    unique_datetimes = [datetime.fromtimestamp(int(ts)).replace(microsecond=0) for ts in unique_timestamps]
+    block_timestamps = np.array([dt.isoformat() for dt in unique_datetimes], dtype=object)[timestamp_codes]
+    block_dates = np.array([dt.date() for dt in unique_datetimes], dtype=object)[timestamp_codes]
+
+    # topics come as a list (api json) or its repr string (csv) - "['0xddf252ad...', '0x..', '0x..', '0x..']"
+    topics = df_transfers["topics"].astype(str)
+    method_ids = topics.str.extract(r"(0x[0-9a-fA-F]{8})", expand=False)
+    token_ids = hex_series_to_int(
+        topics.str.extract(r"^\[?'?[^,]+'?, '?[^,]+'?, '?[^,]+'?, '?(0x[0-9a-fA-F]+)'?\]?$", expand=False).fillna("0")
+    )
+
+    transfer_types = method_ids.map(config.method_types)
+    if transfer_types.isna().any():
+        raise KeyError(f"unknown method ids: {sorted(set(method_ids[transfer_types.isna()].astype(str)))}")
+    # lowercase like the logs engine - explorer versions differ in how they case addresses
+    from_addresses = df_transfers["fromAddressHash"].str.lower()
+    # transfers out of the zero address are mints - same rule as logs.decode_transfer_logs
+    transfer_types = transfer_types.where(from_addresses != config.zero_address, "mint")
+
+    df_nft_tranfer = pd.DataFrame({
+        "amount_raw": token_ids,
+        "block_date": block_dates,
+        "block_number": hex_series_to_int(df_transfers["blockNumber"]),
+        "block_timestamp": block_timestamps,
+        "chain": "Celo",
+        "collection_contract_address": contract_address,
+        "from_address": from_addresses,
+        "internal_index": hex_series_to_int(df_transfers["transactionIndex"]),
+        "log_index": hex_series_to_int(df_transfers["logIndex"]),
+        "nft_token_id": token_ids,
+        "to_address": df_transfers["toAddressHash"].str.lower(),
+        "transaction_hash": df_transfers["transactionHash"],
+        "transfer_type": transfer_types
+    })
+
+    return df_nft_tranfer[config.nft_transfers_columns].reset_index(drop=True)
+
+def fetch_contract_transfers(contract_address, from_block, latest_block):
+    # yields (to_block, df_nft_transfers) per block range - ranges adapt to how busy the contract is
+    block_chunk_size = config.transfers_block_chunk_size
+
+    while from_block <= latest_block:
+        to_block = min(from_block + block_chunk_size - 1, latest_block)
+
+        api_query = f"{celo_base_api_url}/?module=token&action=tokentx&contractaddress={contract_address}&fromBlock={from_block}&toBlock={to_block}"
+        transfers = http_client.get_json(api_query)
+        #with open('./tests/samples/transfers.json', 'w') as f:
+        #    json.dump(transfers, f, indent=4)
+
+        # explorer truncated the range - halve it and query again
+        if len(transfers["result"]) >= config.explorer_max_results and to_block > from_block:
+            block_chunk_size = max(1, block_chunk_size // 2)
+            continue
+
+        df_transfers = pd.json_normalize(transfers["result"])
+        if df_transfers.empty:
+            yield to_block, pd.DataFrame(columns=config.nft_transfers_columns)
+        else:
+            yield to_block, build_nft_transfer_rows(df_transfers, contract_address)
+
+        # quiet range - widen the next one
+        if len(transfers["result"]) < config.explorer_max_results // 4:
+            block_chunk_size *= 2
+        from_block = to_block + 1
+
+def migrate_nft_transfers():
+    # the per contract watermarks never revisit old blocks - rows written by an older version are dropped with their
+    # checkpoints and the ownership index built from them, and the next pull starts from block 0
+    versions = checkpoint.load_checkpoints("table_versions")
+    if int(versions.get("nft_transfers", 1)) >= config.nft_transfers_version:
+        return
+    if storage.table_exists("nft_transfers"):
+        print("nft_transfers : table written by version", versions.get("nft_transfers", 1), "- pulling it again")
+    storage.drop_table("nft_transfers")
+    checkpoint.reset_checkpoints("nft_transfers")
+    if os.path.exists(config.ownership_index_path):
+        os.remove(config.ownership_index_path)
+    checkpoint.save_checkpoint("table_versions", "nft_transfers", config.nft_transfers_version)
+
+@metrics.instrument_stage
 def pull_nft_transfers():
-    df_nft_collection_info = pd.read_csv("./output/nft_collection_info.csv")
-    nft_tranfer_list = []
+    migrate_nft_transfers()
+    df_nft_collection_info = storage.read_table("nft_collection_info", columns=["collection_name", "contract_address"])
+    # last block whose transfers have been written to nft_transfers.csv, per contract
+    watermarks = checkpoint.load_checkpoints("nft_transfers")
+    latest_block = w3.eth.block_number
 
     for _, row in df_nft_collection_info.iterrows():
         try:
             collection_name = str(row["collection_name"])
             contract_address = w3.to_checksum_address(row["contract_address"])
+            from_block = int(watermarks.get(contract_address, -1)) + 1
+            transfer_count = 0
 
-            print(collection_name, ":", contract_address, "start..")
-
-            api_query = f"{celo_base_api_url}/?module=token&action=tokentx&contractaddress={contract_address}&fromBlock=0&toBlock=latest"
-            transfers = requests.get(api_query).json()
-            #with open('./tests/samples/transfers.json', 'w') as f:
-            #    json.dump(transfers, f, indent=4)
-            df_transfers = pd.json_normalize(transfers["result"])
-
-            for _, row in df_transfers.iterrows():
-                timestamp = datetime.fromtimestamp(hex_to_int(row["timeStamp"])).replace(microsecond=0).isoformat()
-
-                topics = [str(item).strip("'") for item in str(row["topics"]).strip("[]").split(", ")]
-                method_id = topics[0][:10]
-                if len(topics) == 4:
-                    token_id = hex_to_int(topics[3])
-                else:
-                    token_id = 0
-                
-                nft_tranfer_row = {
-                    "amount_raw": token_id,
-                    "block_date": datetime.fromisoformat(timestamp).date(),
-                    "block_number": hex_to_int(row["blockNumber"]),
-                    "block_timestamp": timestamp,
-                    "chain": "Celo",
-                    "collection_contract_address": contract_address,
-                    "from_address": row["fromAddressHash"],
-                    "internal_index": hex_to_int(row["transactionIndex"]),
-                    "log_index": hex_to_int(row["logIndex"]),
-                    "nft_token_id": token_id,
-                    "to_address": row["fromAddressHash"],
-                    "transaction_hash": row["transactionHash"],
-                    "transfer_type": config.method_types[method_id]
-                }
-                nft_tranfer_list.append(nft_tranfer_row)
+            print(collection_name, ":", contract_address, "start from block", from_block, "..")
 
-            print(collection_name, ":", contract_address, "end..")
+            for to_block, df_nft_transfers in fetch_contract_transfers(contract_address, from_block, latest_block):
+                if not df_nft_transfers.empty:
+                    storage.append_table(df_nft_transfers, "nft_transfers")
+                    transfer_count += len(df_nft_transfers)
+                checkpoint.save_checkpoint("nft_transfers", contract_address, to_block)
+
+            print(collection_name, ":", contract_address, "end.. new transfers:", transfer_count)
         except:
             err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
-            print("nft_transfers error for", collection_name, ":", contract_address, "tokenId:", token_id, "\n", err_msg)
+            print("nft_transfers error for", collection_name, ":", contract_address, "\n", err_msg)
             continue
 
-    df_nft_tranfer = pd.DataFrame(nft_tranfer_list, columns=config.nft_transfers_columns)
-    df_nft_tranfer.to_csv("./output/nft_transfers.csv", index=False)
+def pull_nft_transfers_contract(contract_address, from_block, latest_block):
+    # process pool work item - every new transfer of one contract
+    df_list = [df_nft_transfers for _, df_nft_transfers in fetch_contract_transfers(contract_address, from_block, latest_block)]
+    if not df_list:
+        return pd.DataFrame(columns=config.nft_transfers_columns)
+    return pd.concat(df_list, ignore_index=True)
+
+@metrics.instrument_stage
+def pull_nft_transfers_parallel(workers=None):
+    # pull_nft_transfers over a process pool - one work item per contract, busiest (largest supply) first
+    migrate_nft_transfers()
+    df_nft_collection_info = storage.read_table("nft_collection_info", columns=["contract_address", "total_supply"])
+    watermarks = checkpoint.load_checkpoints("nft_transfers")
+    latest_block = w3.eth.block_number
+    storage.drop_parts("nft_transfers")
+    items = []
+
+    for contract_address, total_supply in zip(df_nft_collection_info["contract_address"], df_nft_collection_info["total_supply"]):
+        contract_address = w3.to_checksum_address(contract_address)
+        from_block = int(watermarks.get(contract_address, -1)) + 1
+        if from_block <= latest_block:
+            items.append((contract_address, int(total_supply), (contract_address, from_block, latest_block)))
+
+    results = scheduler.run_parallel(pull_nft_transfers_contract, scheduler.largest_first(items), "nft_transfers", workers)
+
+    for contract_address, _, _ in items:
+        if results.get(contract_address) is None:
+            print("nft_transfers error for", contract_address)
+            continue
+        storage.merge_part("nft_transfers", contract_address)
+        checkpoint.save_checkpoint("nft_transfers", contract_address, latest_block)
+
+    storage.drop_parts("nft_transfers")
         
 
-##########
-#pull_all_contracts()
-get_active_contract_tokens()
-#pull_nft_contracts()
-#get_active_nft_collections()
-#pull_nft_info()
-#pull_nft_token_attributes()
-#pull_nft_transfers()
-#pull_nft_transactions()
+@metrics.instrument_stage
+def pull_nft_ownership():
+    # applies transfers written since the last run to the ownership index and writes the current holder snapshot
+    index = ownership.OwnershipIndex.load()
+    df_nft_collection_info = storage.read_table("nft_collection_info", columns=["contract_address"])
+    contract_addresses = [w3.to_checksum_address(address) for address in df_nft_collection_info["contract_address"]]
+
+    # once every collection has a watermark only the tail of nft_transfers is read - the index drops rows it already has
+    filters = None
+    if contract_addresses and all(address in index.watermarks for address in contract_addresses):
+        filters = [("block_number", ">=", min(index.watermarks[address][0] for address in contract_addresses))]
+
+    applied_count = 0
+    for df_nft_transfers in storage.read_table_chunks(
+        "nft_transfers", columns=["collection_contract_address", "block_number", "log_index", "nft_token_id", "to_address"], filters=filters
+    ):
+        applied_count += index.apply(df_nft_transfers)
+        print("..", "nft ownership progress :", applied_count, "transfers applied")
+
+    index.save()
+    df_nft_owners = index.snapshot()
+    storage.write_table(df_nft_owners, "nft_owners")
+    print("nft ownership : held tokens", len(df_nft_owners), "distinct holders", df_nft_owners["owner_address"].nunique())
+
+@metrics.instrument_stage
+def pull_nft_transfers_logs():
+    # same output as pull_nft_transfers, but straight from Transfer logs over rpc instead of the explorer tokentx api
+    migrate_nft_transfers()
+    df_nft_collection_info = storage.read_table("nft_collection_info", columns=["contract_address"])
+    watermarks = checkpoint.load_checkpoints("nft_transfers")
+    latest_block = w3.eth.block_number
+    contract_addresses = [w3.to_checksum_address(address) for address in df_nft_collection_info["contract_address"]]
+
+    for i in range(0, len(contract_addresses), config.logs_addresses_per_request):
+        address_group = contract_addresses[i:i + config.logs_addresses_per_request]
+        group_watermarks = {address: int(watermarks.get(address, -1)) for address in address_group}
+        from_block = min(group_watermarks.values()) + 1
+        transfer_count = 0
+
+        print("transfer logs for", len(address_group), "contracts start from block", from_block, "..")
+
+        try:
+            for window_to_block, nft_tranfer_list in logs.get_transfer_logs(w3, address_group, from_block, latest_block):
+                # contracts in a group can have different watermarks - drop rows that were already written
+                nft_tranfer_list = [
+                    nft_tranfer_row for nft_tranfer_row in nft_tranfer_list
+                    if nft_tranfer_row["block_number"] > group_watermarks[nft_tranfer_row["collection_contract_address"]]
+                ]
+                if nft_tranfer_list:
+                    df_nft_tranfer = pd.DataFrame(nft_tranfer_list, columns=config.nft_transfers_columns)
+                    storage.append_table(df_nft_tranfer, "nft_transfers")
+                    transfer_count += len(nft_tranfer_list)
+
+                for address in address_group:
+                    if group_watermarks[address] < window_to_block:
+                        group_watermarks[address] = window_to_block
+                        checkpoint.save_checkpoint("nft_transfers", address, window_to_block)
+
+            print("transfer logs end.. new transfers:", transfer_count)
+        except:
+            err_msg = f"{sys.exc_info()[0]}, {sys.exc_info()[1]}, line: {sys.exc_info()[2].tb_lineno}"
+            print("nft_transfers_logs error for", address_group, "\n", err_msg)
+            continue
+
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import mimetypes
+import aiohttp
+
+import config
+import fetcher
+import http_client
+import ipfs
+import metrics
+
+# (offset, magic bytes, mime type) - first match wins
+signatures = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"glTF", "model/gltf-binary"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"WAVE", "audio/wav"),
+    (8, b"AVI ", "video/x-msvideo")
+]
+# iso base media files (mp4, mov, heic, avif) - told apart by the major brand after "ftyp"
+ftyp_brands = {
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"mif1": "image/heif",
+    b"qt  ": "video/quicktime",
+    b"M4A ": "audio/mp4"
+}
+# content types that say nothing - gateways and object stores send these for anything they don't recognise
+generic_types = {"", "application/octet-stream", "binary/octet-stream", "text/plain"}
+
+
+@metrics.timed("parse_seconds", step="media_sniff")
+def sniff(head):
+    # mime type from the first bytes of a file, None when nothing matches
+    for offset, magic, mime_type in signatures:
+        if head[offset:offset + len(magic)] == magic:
+            return mime_type
+    if head[4:8] == b"ftyp":
+        return ftyp_brands.get(head[8:12], "video/mp4")
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # mp3 frame sync without an id3 tag
+        return "audio/mpeg"
+
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in text):
+        return "image/svg+xml"
+    if text.startswith(b"<!doctype html") or text.startswith(b"<html"):
+        return "text/html"
+    if text.startswith(b"{") or text.startswith(b"["):
+        return "application/json"
+    return None
+
+def data_uri_type(uri):
+    # data:image/svg+xml;base64,... - on-chain art carries its type in the uri itself
+    mime_type = uri[len("data:"):].split(",", 1)[0].split(";", 1)[0].strip().lower()
+    return mime_type or "text/plain"
+
+def header_type(headers):
+    mime_type = headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+    return None if mime_type in generic_types else mime_type
+
+def probe_target(uri):
+    # -> uri as the fetcher and caches see it: ipfs uris in canonical form, ar:// on the arweave gateway
+    uri = str(uri).strip()
+    if uri.startswith("ar://"):
+        return f"{config.arweave_gateway}/{uri[len('ar://'):]}"
+    return ipfs.to_ipfs_uri(uri)
+
+async def probe_ipfs(session, cid, path):
+    # no hedging - a few hundred bytes aren't worth racing gateways for, the next one is tried on failure
+    errors = []
+    for gateway in ipfs.ranked_gateways()[:config.media_ipfs_gateway_attempts]:
+        start = time.monotonic()
+        try:
+            _, headers, head = await http_client.request_async(
+                session, ipfs.gateway_url(gateway, cid, path), max_bytes=config.media_sniff_bytes,
+                max_retries=config.ipfs_gateway_retries, deadline_seconds=config.ipfs_gateway_deadline_seconds
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            ipfs.get_health(gateway).record(error=True)
+            errors.append(err)
+            continue
+        ipfs.get_health(gateway).record(latency=time.monotonic() - start)
+        return headers, head
+    raise errors[-1]
+
+async def probe(session, uri):
+    # magic bytes first, then the server's content type, then the file extension
+    ipfs_path = ipfs.parse_ipfs_uri(uri)
+    if ipfs_path is not None:
+        headers, head = await probe_ipfs(session, *ipfs_path)
+    else:
+        _, headers, head = await http_client.request_async(session, uri, max_bytes=config.media_sniff_bytes)
+    return sniff(head) or header_type(headers) or mimetypes.guess_type(uri.split("?", 1)[0])[0]
+
+async def probe_many_async(uris, concurrency=None, host_limits=None):
+    concurrency = concurrency or config.media_concurrency
+    host_limits = host_limits if host_limits is not None else config.metadata_host_limits
+    host_limit_default = max(1, min(concurrency, config.metadata_default_host_limit))
+    semaphores = {host: asyncio.Semaphore(limit) for host, limit in host_limits.items()}
+    results = {}
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=config.metadata_timeout_seconds)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def probe_one(uri):
+            host = fetcher.get_host(uri)
+            if host not in semaphores:
+                semaphores[host] = asyncio.Semaphore(host_limit_default)
+            try:
+                async with semaphores[host]:
+                    results[uri] = await probe(session, uri)
+            except Exception:
+                metrics.inc("media_probe_errors_total", host=host)
+                results[uri] = None
+
+        # the connector caps connections - semaphores keep single hosts from taking all of them
+        await asyncio.gather(*[probe_one(uri) for uri in uris])
+
+    return results
+
+def probe_media_types(uris, cache=None):
+    # uris: image / animation urls of many tokens -> {uri: mime type or None}
+    # each distinct asset is probed once - tokens sharing an image share the result
+    results = {}
+    pending = []
+    for uri in dict.fromkeys(uri for uri in uris if isinstance(uri, str) and uri.strip()):
+        if uri.startswith("data:"):
+            results[uri] = data_uri_type(uri)
+            continue
+        target = probe_target(uri)
+        entry = cache.get(target) if cache is not None else None
+        if entry is not None:
+            results[uri] = entry["mime_type"]
+        else:
+            pending.append((uri, target))
+
+    if pending:
+        probed = asyncio.run(probe_many_async(list(dict.fromkeys(target for _, target in pending))))
+        for uri, target in pending:
+            results[uri] = probed[target]
+        if cache is not None:
+            for target, mime_type in probed.items():
+                cache.put(target, mime_type)
+
+    return results
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# in-process counters and histograms - every sample is labelled with the stage that was running
+lock = threading.Lock()
+# (name, labels) -> value, labels is a sorted tuple of (key, value)
+counters = {}
+# (name, labels) -> [count per bucket..., sum, count]
+histograms = {}
+current_stage = "none"
+# stages running side by side on pipeline threads label their own samples - helper threads fall back to current_stage
+stage_local = threading.local()
+run_started = time.time()
+server = None
+
+
+def stage_name():
+    return getattr(stage_local, "name", None) or current_stage
+
+def label_key(labels):
+    labels.setdefault("stage", stage_name())
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = (name, label_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    key = (name, label_key(labels))
+    buckets = config.metrics_histogram_buckets
+    with lock:
+        if key not in histograms:
+            histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        histogram = histograms[key]
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+@contextmanager
+def timer(name, **labels):
+    # e.g. timer("parse_seconds") around cpu work - network time comes from the http histograms
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def timed(name, **labels):
+    # decorator form of timer
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    # picklable copy - process pool workers hand theirs back to the parent
+    with lock:
+        return {"counters": dict(counters), "histograms": {key: list(value) for key, value in histograms.items()}}
+
+def merge(other):
+    with lock:
+        for key, value in other["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+        for key, value in other["histograms"].items():
+            if key not in histograms:
+                histograms[key] = [0] * len(value)
+            histograms[key] = [a + b for a, b in zip(histograms[key], value)]
+
+def reset():
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def prometheus_text():
+    # prometheus text exposition format
+    lines = []
+    buckets = config.metrics_histogram_buckets
+    with lock:
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE nft_{name} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"nft_{name}{format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE nft_{name} histogram")
+            for (histogram_name, labels), histogram in sorted(histograms.items()):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + [float("inf")], histogram[:-2]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"nft_{name}_bucket{format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"nft_{name}_sum{format_labels(labels)} {histogram[-2]}")
+                lines.append(f"nft_{name}_count{format_labels(labels)} {histogram[-1]}")
+    return "\n".join(lines) + "\n"
+
+def summary():
+    # json run summary - totals per metric and stage, histograms as count / sum / mean
+    result = {"run_started": run_started, "updated": time.time(), "counters": {}, "histograms": {}}
+    with lock:
+        for (name, labels), value in sorted(counters.items()):
+            result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in sorted(histograms.items()):
+            count, total = histogram[-1], histogram[-2]
+            result["histograms"].setdefault(name, []).append({
+                "labels": dict(labels), "count": count, "sum": round(total, 6), "mean": round(total / count, 6) if count else 0.0
+            })
+    return result
+
+def write_exports(path=None):
+    # rewritten after every stage so a long run that dies still leaves its numbers behind
+    path = path or config.metrics_path
+    os.makedirs(path, exist_ok=True)
+    for file_name, content in [("metrics.prom", prometheus_text()), ("run_summary.json", json.dumps(summary(), indent=4))]:
+        tmp_path = os.path.join(path, file_name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, os.path.join(path, file_name))
+
+def serve(port=None):
+    # /metrics endpoint for a prometheus scraper - started once, runs on a daemon thread
+    global server
+    port = port or config.metrics_port
+    if server is not None or not port:
+        return
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+@contextmanager
+def profile(stage_name):
+    # optional profiler around a stage - "cprofile" writes a .prof for snakeviz/pstats, "pyinstrument" an html report
+    profiler_name = config.metrics_profiler
+    if not profiler_name or (config.metrics_profile_stages and stage_name not in config.metrics_profile_stages):
+        yield
+        return
+
+    os.makedirs(config.metrics_path, exist_ok=True)
+    if profiler_name == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(config.metrics_path, f"{stage_name}.prof"))
+    elif profiler_name == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ImportError("metrics_profiler 'pyinstrument' needs pyinstrument - pip install pyinstrument")
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(os.path.join(config.metrics_path, f"{stage_name}.html"), "w") as f:
+                f.write(profiler.output_html())
+    else:
+        raise ValueError(f"unknown metrics_profiler: {profiler_name}")
+
+@contextmanager
+def stage(stage_name):
+    global current_stage
+    previous_stage, current_stage = current_stage, stage_name
+    previous_local = getattr(stage_local, "name", None)
+    stage_local.name = stage_name
+    serve()
+    start = time.perf_counter()
+    try:
+        with profile(stage_name):
+            yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - start)
+        current_stage = previous_stage
+        stage_local.name = previous_local
+        write_exports()
+
+def instrument_stage(fn):
+    # decorator for the pull_* entry points in main.py
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
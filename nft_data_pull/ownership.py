@@ -0,0 +1,230 @@
+import os
+import numpy as np
+import pandas as pd
+
+import config
+
+# ownership of every token, kept up to date from nft_transfers instead of replaying the table for each question
+# contracts, holders and (contract, token_id) keys are interned to ints - the state itself is a few numpy arrays
+
+
+class OwnershipIndex:
+    def __init__(self):
+        self.contracts = []
+        self.contract_ids = {}
+        self.addresses = []
+        self.address_ids = {}
+        # token code -> (contract_id, token_id), and back
+        self.tokens = []
+        self.token_codes = {}
+        # per token code
+        self.token_contract = np.zeros(0, dtype=np.int32)
+        self.current_owner = np.zeros(0, dtype=np.int32)
+        self.current_block = np.zeros(0, dtype=np.int64)
+        # change log in apply order - chronological per token, snapshots at a block are cut from it
+        self.log_token = np.zeros(0, dtype=np.int32)
+        self.log_block = np.zeros(0, dtype=np.int64)
+        self.log_owner = np.zeros(0, dtype=np.int32)
+        # contract_address -> (block_number, log_index) of the last applied transfer
+        self.watermarks = {}
+
+    def contract_id(self, contract_address):
+        if contract_address not in self.contract_ids:
+            self.contract_ids[contract_address] = len(self.contracts)
+            self.contracts.append(contract_address)
+        return self.contract_ids[contract_address]
+
+    def address_id(self, address):
+        address = address.lower()
+        if address not in self.address_ids:
+            self.address_ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return self.address_ids[address]
+
+    def token_code(self, contract_id, token_id):
+        key = (contract_id, token_id)
+        if key not in self.token_codes:
+            self.token_codes[key] = len(self.tokens)
+            self.tokens.append(key)
+        return self.token_codes[key]
+
+    def apply(self, df_transfers):
+        # df_transfers: nft_transfers rows in any order - rows up to a contract's watermark were applied before
+        # -> number of transfers applied
+        df = df_transfers[["collection_contract_address", "block_number", "log_index", "nft_token_id", "to_address"]].dropna()
+        df = df.drop_duplicates(["collection_contract_address", "block_number", "log_index", "nft_token_id"])
+        watermarks = [self.watermarks.get(contract_address, (-1, -1)) for contract_address in df["collection_contract_address"]]
+        watermark_blocks = np.array([block_number for block_number, _ in watermarks], dtype=np.int64)
+        watermark_logs = np.array([log_index for _, log_index in watermarks], dtype=np.int64)
+        block_numbers = df["block_number"].to_numpy(dtype=np.int64)
+        log_indexes = df["log_index"].to_numpy(dtype=np.int64)
+        is_new = (block_numbers > watermark_blocks) | ((block_numbers == watermark_blocks) & (log_indexes > watermark_logs))
+        df = df[is_new].sort_values(["collection_contract_address", "block_number", "log_index"])
+        if df.empty:
+            return 0
+
+        token_count = len(self.tokens)
+        log_token = []
+        log_owner = []
+        new_token_contracts = []
+        for contract_address, token_id, to_address in zip(df["collection_contract_address"], df["nft_token_id"], df["to_address"]):
+            contract_id = self.contract_id(contract_address)
+            code = self.token_code(contract_id, int(token_id))
+            if code >= token_count + len(new_token_contracts):
+                new_token_contracts.append(contract_id)
+            log_token.append(code)
+            log_owner.append(self.address_id(to_address))
+
+        log_token = np.array(log_token, dtype=np.int32)
+        log_owner = np.array(log_owner, dtype=np.int32)
+        log_block = df["block_number"].to_numpy(dtype=np.int64)
+
+        self.token_contract = np.concatenate([self.token_contract, np.array(new_token_contracts, dtype=np.int32)])
+        self.current_owner = np.concatenate([self.current_owner, np.full(len(new_token_contracts), -1, dtype=np.int32)])
+        self.current_block = np.concatenate([self.current_block, np.full(len(new_token_contracts), -1, dtype=np.int64)])
+        # a token can move several times in one batch - its last transfer decides
+        last_tokens, last_positions = last_occurrences(log_token)
+        self.current_owner[last_tokens] = log_owner[last_positions]
+        self.current_block[last_tokens] = log_block[last_positions]
+
+        self.log_token = np.concatenate([self.log_token, log_token])
+        self.log_block = np.concatenate([self.log_block, log_block])
+        self.log_owner = np.concatenate([self.log_owner, log_owner])
+
+        for contract_address, block_number, log_index in zip(df["collection_contract_address"], df["block_number"], df["log_index"]):
+            self.watermarks[contract_address] = (int(block_number), int(log_index))
+        return len(df)
+
+    def owners_at(self, block_number=None):
+        # -> (owner id, block of the last transfer) per token code as of block_number, -1 for tokens not minted yet
+        if block_number is None:
+            return self.current_owner, self.current_block
+        mask = self.log_block <= block_number
+        log_token = self.log_token[mask]
+        owners = np.full(len(self.tokens), -1, dtype=np.int32)
+        blocks = np.full(len(self.tokens), -1, dtype=np.int64)
+        last_tokens, last_positions = last_occurrences(log_token)
+        owners[last_tokens] = self.log_owner[mask][last_positions]
+        blocks[last_tokens] = self.log_block[mask][last_positions]
+        return owners, blocks
+
+    def held(self, owners):
+        # tokens that exist and aren't burned
+        zero_id = self.address_ids.get(config.zero_address, -1)
+        return (owners >= 0) & (owners != zero_id)
+
+    def owner_of(self, contract_address, token_id, block_number=None):
+        return self.owners(contract_address, [token_id], block_number).get(token_id)
+
+    def owners(self, contract_address, token_ids=None, block_number=None):
+        # {token_id: owner} for one collection - all of its tokens when token_ids is None, burned tokens left out
+        if contract_address not in self.contract_ids:
+            return {}
+        contract_id = self.contract_ids[contract_address]
+        owners, _ = self.owners_at(block_number)
+        if token_ids is None:
+            codes = np.flatnonzero(self.token_contract == contract_id)
+        else:
+            codes = np.array([self.token_codes.get((contract_id, int(token_id)), -1) for token_id in token_ids], dtype=np.int64)
+            codes = codes[codes >= 0]
+        codes = codes[self.held(owners[codes])]
+        return {self.tokens[code][1]: self.addresses[owners[code]] for code in codes}
+
+    def holders(self, contract_address, block_number=None):
+        # {holder: token count} for one collection, largest holders first
+        if contract_address not in self.contract_ids:
+            return {}
+        owners, _ = self.owners_at(block_number)
+        collection_owners = owners[self.token_contract == self.contract_ids[contract_address]]
+        counts = np.bincount(collection_owners[self.held(collection_owners)], minlength=len(self.addresses))
+        holder_ids = np.flatnonzero(counts)
+        holder_ids = holder_ids[np.argsort(-counts[holder_ids], kind="stable")]
+        return {self.addresses[holder_id]: int(counts[holder_id]) for holder_id in holder_ids}
+
+    def holder_counts(self, block_number=None):
+        # {contract_address: distinct holders} for every collection at once
+        owners, _ = self.owners_at(block_number)
+        held = self.held(owners)
+        if not held.any():
+            return {}
+        pairs = np.unique(np.stack([self.token_contract[held].astype(np.int64), owners[held].astype(np.int64)]), axis=1)
+        contract_ids, counts = np.unique(pairs[0], return_counts=True)
+        return {self.contracts[contract_id]: int(count) for contract_id, count in zip(contract_ids, counts)}
+
+    def tokens_of(self, address, block_number=None):
+        # [(contract_address, token_id)] held by one address
+        address_id = self.address_ids.get(address.lower())
+        if address_id is None:
+            return []
+        owners, _ = self.owners_at(block_number)
+        return [(self.contracts[self.tokens[code][0]], self.tokens[code][1]) for code in np.flatnonzero(owners == address_id)]
+
+    def snapshot(self, block_number=None):
+        # nft_owners rows - one per held token as of block_number
+        owners, blocks = self.owners_at(block_number)
+        codes = np.flatnonzero(self.held(owners))
+        return pd.DataFrame({
+            "chain": "Celo",
+            "collection_contract_address": [self.contracts[self.tokens[code][0]] for code in codes],
+            "nft_token_id": [self.tokens[code][1] for code in codes],
+            "owner_address": [self.addresses[owner] for owner in owners[codes]],
+            "last_transfer_block": blocks[codes]
+        }, columns=config.nft_owners_columns)
+
+    def save(self, path=None):
+        # one npz file, swapped in whole - token ids can be wider than 64 bits, they are stored as decimal strings
+        path = path or config.ownership_index_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        watermark_contracts = list(self.watermarks)
+        np.savez_compressed(
+            tmp_path,
+            contracts=np.array(self.contracts, dtype=str),
+            addresses=np.array(self.addresses, dtype=str),
+            token_contract=self.token_contract,
+            token_ids=np.array([str(token_id) for _, token_id in self.tokens], dtype=str),
+            current_owner=self.current_owner,
+            current_block=self.current_block,
+            log_token=self.log_token,
+            log_block=self.log_block,
+            log_owner=self.log_owner,
+            watermark_contracts=np.array(watermark_contracts, dtype=str),
+            watermark_positions=np.array([self.watermarks[contract_address] for contract_address in watermark_contracts], dtype=np.int64).reshape(-1, 2)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        # empty index when nothing was saved yet
+        path = path or config.ownership_index_path
+        index = cls()
+        if not os.path.exists(path):
+            return index
+
+        with np.load(path) as data:
+            index.contracts = data["contracts"].tolist()
+            index.addresses = data["addresses"].tolist()
+            index.token_contract = data["token_contract"]
+            index.tokens = list(zip(index.token_contract.tolist(), [int(token_id) for token_id in data["token_ids"]]))
+            index.current_owner = data["current_owner"]
+            index.current_block = data["current_block"]
+            index.log_token = data["log_token"]
+            index.log_block = data["log_block"]
+            index.log_owner = data["log_owner"]
+            index.watermarks = {
+                contract_address: (int(block_number), int(log_index))
+                for contract_address, (block_number, log_index) in zip(data["watermark_contracts"].tolist(), data["watermark_positions"])
+            }
+
+        index.contract_ids = {contract_address: i for i, contract_address in enumerate(index.contracts)}
+        index.address_ids = {address: i for i, address in enumerate(index.addresses)}
+        index.token_codes = {key: code for code, key in enumerate(index.tokens)}
+        return index
+
+
+def last_occurrences(values):
+    # -> (distinct values, position of the last occurrence of each)
+    if len(values) == 0:
+        return values, np.zeros(0, dtype=np.int64)
+    distinct, first_from_end = np.unique(values[::-1], return_index=True)
+    return distinct, len(values) - 1 - first_from_end
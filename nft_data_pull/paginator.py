@@ -0,0 +1,63 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import http_client
+
+
+def fetch_page(api_query, page_n):
+    # rate limiting and retries are handled by the explorer bucket in http_client
+    result = http_client.get_json(f"{api_query}&page={page_n}", endpoint="explorer")
+    return pd.json_normalize(result["result"])
+
+def find_last_page(api_query, pages, max_page):
+    # exponential probe for the first empty page, then binary search for the last non-empty one
+    # fetched pages are kept in `pages` so they aren't downloaded twice
+    def is_empty(page_n):
+        if page_n not in pages:
+            pages[page_n] = fetch_page(api_query, page_n)
+        return pages[page_n].empty
+
+    if is_empty(1):
+        return 0
+
+    low, high = 1, 2
+    while high <= max_page and not is_empty(high):
+        low, high = high, high * 2
+    high = min(high, max_page + 1)
+
+    # invariant: low is non-empty, high is empty (or past max_page)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if is_empty(mid):
+            high = mid
+        else:
+            low = mid
+    return low
+
+def fetch_all_pages(api_query, on_page=None, max_workers=None, max_page=None):
+    # api_query: explorer url without the page parameter
+    # on_page(df) runs as each page arrives (e.g. filtering) - returns the DataFrame to keep
+    max_workers = max_workers or config.explorer_page_workers
+    max_page = max_page or config.explorer_max_page
+    pages = {}
+
+    last_page = find_last_page(api_query, pages, max_page)
+    print("..", api_query, "pages :", last_page)
+
+    kept = {}
+    for page_n in list(pages):
+        if page_n <= last_page:
+            kept[page_n] = on_page(pages[page_n]) if on_page else pages[page_n]
+    pages.clear()
+
+    def fetch_and_process(page_n):
+        df_page = fetch_page(api_query, page_n)
+        return page_n, on_page(df_page) if on_page else df_page
+
+    remaining = [page_n for page_n in range(1, last_page + 1) if page_n not in kept]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_n, df_page in executor.map(fetch_and_process, remaining):
+            kept[page_n] = df_page
+
+    return [kept[page_n] for page_n in sorted(kept)]
@@ -0,0 +1,194 @@
+import os
+import sys
+import hashlib
+import argparse
+import importlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import checkpoint
+import config
+
+# fn / parallel_fn are "module:function" - imported only when the stage actually runs, so a run that skips
+# everything (or --list) never loads pandas / web3
+# incremental stages follow the chain through their own checkpoints - they run even when their inputs are unchanged
+# source stages (no inputs) only rerun once their output is gone or with --force
+Stage = namedtuple("Stage", ["name", "fn", "parallel_fn", "inputs", "outputs", "depends_on", "incremental"])
+
+def build_stages():
+    # the nft_contracts, transfers and info stages follow config - see nft_contracts_source, transfer_engine and
+    # token_discovery_mints
+    if config.nft_contracts_source == "explorer":
+        # its own listcontracts crawl, filtered page by page - no contracts table needed
+        nft_contracts = Stage("nft_contracts", "main:pull_nft_contracts", None, [], ["nft_contracts"], [], False)
+    else:
+        nft_contracts = Stage("nft_contracts", "main:filter_all_contracts", None, ["contracts"], ["nft_contracts"], ["contracts"], False)
+    if config.transfer_engine == "logs":
+        transfers = Stage("transfers", "main:pull_nft_transfers_logs", None, ["nft_collection_info"], ["nft_transfers"], ["collections"], True)
+    else:
+        transfers = Stage("transfers", "main:pull_nft_transfers", "main:pull_nft_transfers_parallel", ["nft_collection_info"], ["nft_transfers"], ["collections"], True)
+
+    return [
+        Stage("contracts", "main:pull_all_contracts", None, [], ["contracts"], [], False),
+        Stage("contract_token", "main:get_active_contract_tokens", None, ["contracts"], ["contract_token"], ["contracts"], False),
+        nft_contracts,
+        Stage("collections", "main:get_active_nft_collections", None, ["nft_contracts"], ["nft_collection_info"], ["nft_contracts"], False),
+        transfers,
+        # token discovery reads the mints in nft_transfers - with it on, info waits for the whole transfers stage
+        Stage(
+            "info", "main:pull_nft_info", "main:pull_nft_info_parallel", ["nft_collection_info"], ["nft_info"],
+            ["collections", "transfers"] if config.token_discovery_mints else ["collections"], True
+        ),
+        # media fills the content type columns of nft_info in place - attributes wait for it so they see the final table
+        Stage("media", "main:pull_nft_media_types", None, ["nft_info"], ["nft_info"], ["info"], True),
+        Stage("attributes", "main:pull_nft_token_attributes", "main:pull_nft_token_attributes_parallel", ["nft_info"], ["nft_token_attributes"], ["media"], False),
+        Stage("ownership", "main:pull_nft_ownership", None, ["nft_transfers"], ["nft_owners"], ["transfers"], False),
+        # refresh rewrites nft_info in place - it waits for attributes so the two never touch nft_info at the same time
+        Stage("refresh", "main:refresh_nft_info", None, ["nft_collection_info"], ["nft_info"], ["info", "attributes"], True),
+        Stage("refresh_attributes", "main:refresh_nft_token_attributes", None, ["nft_info"], ["nft_token_attributes"], ["refresh"], True)
+    ]
+
+stages = build_stages()
+stages_by_name = {stage.name: stage for stage in stages}
+# only run when named as a target (or by a target that depends on them) - not part of a default run
+on_demand = {"refresh", "refresh_attributes"}
+# stages that bring another stage's outputs in line with its current inputs - that stage's fingerprint moves along,
+# so a later run doesn't rebuild all attributes because refresh touched nft_info
+keeps_current = {"refresh_attributes": ["attributes"]}
+
+
+def table_path(table):
+    # same as storage.table_path - kept here so fingerprinting doesn't import pandas
+    path = config.tables[table]["path"]
+    return path + ".csv" if config.output_format == "csv" else path
+
+def table_files(table):
+    path = table_path(table)
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for dir_path, _, file_names in os.walk(path):
+        files.extend(os.path.join(dir_path, file_name) for file_name in file_names)
+    return sorted(files)
+
+def fingerprint(tables):
+    # small files by content, big ones by size + mtime - a rerun that rewrites identical small tables changes nothing
+    digest = hashlib.sha1()
+    for table in tables:
+        digest.update(table.encode())
+        for file_path in table_files(table):
+            stat = os.stat(file_path)
+            digest.update(f"{file_path}:{stat.st_size}".encode())
+            if stat.st_size <= config.pipeline_hash_max_bytes:
+                with open(file_path, "rb") as f:
+                    digest.update(hashlib.sha1(f.read()).digest())
+            else:
+                digest.update(str(stat.st_mtime_ns).encode())
+    return digest.hexdigest()
+
+def outputs_exist(stage):
+    return all(table_files(table) for table in stage.outputs)
+
+def is_up_to_date(stage):
+    if stage.incremental or not outputs_exist(stage):
+        return False
+    return checkpoint.load_checkpoints("pipeline").get(stage.name) == fingerprint(stage.inputs)
+
+def resolve(targets):
+    # targets plus everything they depend on, in declaration order
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in stages_by_name:
+            raise ValueError(f"unknown stage: {name} - one of {', '.join(stages_by_name)}")
+        if name not in needed:
+            needed.add(name)
+            pending.extend(stages_by_name[name].depends_on)
+    return [stage for stage in stages if stage.name in needed]
+
+def load_fn(fn_path):
+    module_name, fn_name = fn_path.split(":")
+    return getattr(importlib.import_module(module_name), fn_name)
+
+def run_stage(stage, force, parallel):
+    if not force and is_up_to_date(stage):
+        print("pipeline :", stage.name, "up to date, skipped")
+        return False
+
+    # small tables are handed from stage to stage in memory instead of being read back from disk
+    import storage
+    storage.keep_in_memory(config.pipeline_memory_tables)
+
+    print("pipeline :", stage.name, "start..")
+    load_fn(stage.parallel_fn if parallel and stage.parallel_fn else stage.fn)()
+    # inputs as they were when this stage finished with them
+    checkpoint.save_checkpoint("pipeline", stage.name, fingerprint(stage.inputs))
+    for other_name in keeps_current.get(stage.name, []):
+        checkpoint.save_checkpoint("pipeline", other_name, fingerprint(stages_by_name[other_name].inputs))
+    print("pipeline :", stage.name, "end..")
+    return True
+
+def run(targets=None, force=(), force_all=False, parallel=None, max_concurrent=None):
+    # runs the targets and their dependencies - stages whose dependencies are done start right away,
+    # so independent branches (attributes, ownership) run side by side
+    default_stages = [stage for stage in stages if stage.name not in on_demand]
+    targets = targets or [stage.name for stage in default_stages if not any(stage.name in other.depends_on for other in default_stages)]
+    parallel = config.pipeline_parallel if parallel is None else parallel
+    plan = resolve(targets)
+    done = set()
+    failed = set()
+    # downstream stages don't need forcing - their input fingerprints change when an upstream stage rewrites a table
+    forced = set(force) | ({stage.name for stage in plan} if force_all else set())
+
+    with ThreadPoolExecutor(max_workers=max_concurrent or config.pipeline_max_concurrent) as executor:
+        running = {}
+        while True:
+            for stage in plan:
+                if stage.name in done or stage.name in failed or stage.name in running.values():
+                    continue
+                if any(dependency in failed for dependency in stage.depends_on):
+                    print("pipeline :", stage.name, "skipped - a dependency failed")
+                    failed.add(stage.name)
+                    continue
+                if all(dependency in done for dependency in stage.depends_on):
+                    running[executor.submit(run_stage, stage, stage.name in forced, parallel)] = stage.name
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                except:
+                    print("pipeline error for", name, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+                    failed.add(name)
+
+    if "storage" in sys.modules:
+        sys.modules["storage"].release_memory()
+    return done, failed
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="celo nft data pull")
+    parser.add_argument("targets", nargs="*", help=f"stages to run with their dependencies: {', '.join(stages_by_name)} (default: all but {', '.join(sorted(on_demand))})")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="rerun these stages even if their inputs are unchanged")
+    parser.add_argument("--force-all", action="store_true", help="rerun every stage")
+    parser.add_argument("--parallel", action="store_true", default=None, help="use the process pool variants of info / attributes / transfers")
+    parser.add_argument("--list", action="store_true", help="show the stages and whether they would run")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for stage in resolve(args.targets or list(stages_by_name)):
+            state = "incremental" if stage.incremental else "up to date" if is_up_to_date(stage) else "stale"
+            print(f"{stage.name:<16} <- {', '.join(stage.depends_on) or '-':<16} {state}")
+        return
+
+    _, failed = run(args.targets, args.force, args.force_all, args.parallel)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,61 @@
+import json
+import hashlib
+import pandas as pd
+
+import config
+import ipfs
+import rpc_batch
+import storage
+import uri_template
+
+
+def content_hash(nft_metadata):
+    # key order and whitespace don't count - the same metadata served differently hashes the same
+    return hashlib.sha1(json.dumps(nft_metadata, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+def load_hashes():
+    # {(contract_address, token_id): {"metadata_uri", "metadata_hash", "attributes_hash"}}
+    if not storage.table_exists("nft_metadata_hashes"):
+        return {}
+    df_hashes = storage.read_table("nft_metadata_hashes")
+    return {
+        (contract_address, int(token_id)): {"metadata_uri": metadata_uri, "metadata_hash": metadata_hash, "attributes_hash": attributes_hash}
+        for contract_address, token_id, metadata_uri, metadata_hash, attributes_hash in zip(
+            df_hashes["collection_contract_address"], df_hashes["nft_token_id"], df_hashes["metadata_uri"],
+            df_hashes["metadata_hash"], df_hashes["attributes_hash"]
+        )
+    }
+
+def write_hashes(hashes):
+    df_hashes = pd.DataFrame(
+        [(contract_address, token_id, entry["metadata_uri"], entry["metadata_hash"], entry["attributes_hash"])
+         for (contract_address, token_id), entry in sorted(hashes.items())],
+        columns=config.nft_metadata_hashes_columns
+    )
+    storage.write_table(df_hashes, "nft_metadata_hashes")
+
+def read_base_uri(w3, contract_instance):
+    # None when the contract doesn't expose it or the call reverts
+    result = rpc_batch.aggregate_calls(w3, [(contract_instance, "baseURI", ())])[0]
+    return str(result.value) if result.success else None
+
+def sample_uris_changed(w3, contract_instance, stored_uris):
+    # stored_uris: {token_id: metadata_uri} as written to nft_info
+    # a reveal or baseURI update moves every token - a few sampled tokenURIs in one aggregated call are enough to see it
+    infer_ids, verify_ids = uri_template.sample_token_ids(sorted(stored_uris))
+    sample_ids = infer_ids + verify_ids
+    results = rpc_batch.aggregate_calls(w3, [(contract_instance, "tokenURI", (token_id,)) for token_id in sample_ids])
+    return any(
+        result.success and ipfs.to_ipfs_uri(str(result.value)) != stored_uris[token_id]
+        for token_id, result in zip(sample_ids, results)
+    )
+
+def token_ids_in_ranges(token_ids, token_ranges):
+    # token_ranges: [(from_token_id, to_token_id)] from erc-4906 events - only ids that were pulled before
+    # MetadataUpdate events name one token each and can be numerous - looked up in a set, not scanned as ranges
+    single_ids = {low for low, high in token_ranges if low == high}
+    wide_ranges = [(low, high) for low, high in token_ranges if low != high]
+    return [
+        token_id for token_id in token_ids
+        if token_id in single_ids or any(low <= token_id <= high for low, high in wide_ranges)
+    ]
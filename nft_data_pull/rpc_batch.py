@@ -0,0 +1,119 @@
+import sys
+from collections import namedtuple
+from eth_utils.abi import collapse_if_tuple
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+import config
+import http_client
+
+# one entry per requested call - a reverted call comes back with success=False instead of raising
+CallResult = namedtuple("CallResult", ["success", "value"])
+
+
+def encode_call(contract_instance, fn_name, args=()):
+    return contract_instance.encodeABI(fn_name=fn_name, args=list(args))
+
+def decode_output(w3, contract_instance, fn_name, data):
+    fn_abi = contract_instance.get_function_by_name(fn_name).abi
+    output_types = [collapse_if_tuple(output) for output in fn_abi["outputs"]]
+    # same normalizers as .call() - addresses come back checksummed, not as the codec's lowercase
+    values = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, w3.codec.decode(output_types, bytes(data)))
+    if len(values) == 1:
+        return values[0]
+    return values
+
+def _decode_results(w3, calls, raw_results):
+    results = []
+    for (contract_instance, fn_name, _), (success, data) in zip(calls, raw_results):
+        if not success or not data:
+            results.append(CallResult(False, None))
+            continue
+        try:
+            results.append(CallResult(True, decode_output(w3, contract_instance, fn_name, data)))
+        except:
+            # e.g. contract returned something that doesn't match its abi
+            results.append(CallResult(False, None))
+    return results
+
+def post_batch(w3, payload):
+    # -> {id: response item} - a node that rejects the whole batch answers with one error object instead of a list
+    response = http_client.post_json(w3.provider.endpoint_uri, payload, endpoint="rpc")
+    if isinstance(response, dict):
+        raise ValueError(f"rpc batch rejected: {response.get('error', response)}")
+    if not isinstance(response, list) or not all(isinstance(item, dict) for item in response):
+        raise ValueError(f"unexpected rpc batch response: {str(response)[:200]}")
+    return {item.get("id"): item for item in response}
+
+def batch_rpc(w3, calls, block="latest"):
+    # calls: list of (contract_instance, fn_name, args)
+    payload = [
+        {
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "eth_call",
+            "params": [{"to": contract_instance.address, "data": encode_call(contract_instance, fn_name, args)}, block]
+        }
+        for i, (contract_instance, fn_name, args) in enumerate(calls)
+    ]
+    responses = post_batch(w3, payload)
+
+    raw_results = []
+    for i in range(len(calls)):
+        item = responses.get(i, {})
+        if "result" in item:
+            raw_results.append((True, bytes.fromhex(item["result"][2:])))
+        else:
+            raw_results.append((False, b""))
+    return _decode_results(w3, calls, raw_results)
+
+def multicall(w3, calls, block="latest"):
+    multicall_instance = w3.eth.contract(address=config.multicall3_address, abi=config.multicall3_abi)
+    call3_list = [
+        (contract_instance.address, True, encode_call(contract_instance, fn_name, args))
+        for contract_instance, fn_name, args in calls
+    ]
+    raw_results = multicall_instance.functions.aggregate3(call3_list).call(block_identifier=block)
+    return _decode_results(w3, calls, raw_results)
+
+def aggregate_calls(w3, calls, mode=None, batch_size=None, block="latest"):
+    mode = mode or config.rpc_aggregation_mode
+    batch_size = batch_size or config.rpc_batch_size
+    results = []
+
+    for i in range(0, len(calls), batch_size):
+        chunk = calls[i:i + batch_size]
+        if mode == "multicall":
+            try:
+                results.extend(multicall(w3, chunk, block))
+                continue
+            except:
+                # whole aggregate3 call failed (e.g. out of gas) - retry chunk as plain json-rpc batch
+                print("multicall error, falling back to rpc batch:", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+        results.extend(batch_rpc(w3, chunk, block))
+
+    return results
+
+def call_many(w3, contract_instances, fn_name, args=()):
+    # same view function across many contracts -> {address: value} for calls that succeeded
+    contract_instances = list(contract_instances)
+    calls = [(contract_instance, fn_name, args) for contract_instance in contract_instances]
+    results = aggregate_calls(w3, calls)
+    return {
+        contract_instance.address: result.value
+        for contract_instance, result in zip(contract_instances, results)
+        if result.success
+    }
+
+def batch_requests(w3, requests, batch_size=None):
+    # requests: list of (method, params) -> result per request in the same order, None where the node returned an error
+    batch_size = batch_size or config.rpc_batch_size
+    results = []
+
+    for i in range(0, len(requests), batch_size):
+        chunk = requests[i:i + batch_size]
+        payload = [{"jsonrpc": "2.0", "id": j, "method": method, "params": params} for j, (method, params) in enumerate(chunk)]
+        responses = post_batch(w3, payload)
+        results.extend(responses.get(j, {}).get("result") for j in range(len(chunk)))
+
+    return results
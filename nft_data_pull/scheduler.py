@@ -0,0 +1,118 @@
+import os
+import sys
+import types
+import pickle
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import config
+import http_client
+import metrics
+import storage
+
+
+def get_workers(workers=None):
+    return workers or config.scheduler_workers or os.cpu_count() or 1
+
+def split_ranges(token_ids, range_size=None):
+    # large collections become several work items so one 50k token collection isn't the long tail
+    range_size = range_size or config.scheduler_range_size
+    token_ids = list(token_ids)
+    return [token_ids[i:i + range_size] for i in range(0, len(token_ids), range_size)]
+
+def largest_first(items):
+    # items: (part_name, weight, args) - longest jobs start first so the pool drains evenly
+    return sorted(items, key=lambda item: item[1], reverse=True)
+
+def plain_values(module):
+    # module level settings that can be sent to a worker - clients, locks and connections are left out
+    values = {}
+    for name, value in vars(module).items():
+        if name.startswith("_") or isinstance(value, (types.ModuleType, types.FunctionType, type)):
+            continue
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        values[name] = value
+    return values
+
+def worker_settings(fn):
+    # spawned workers import every module from disk - runtime changes the parent made
+    # (benchmark urls and rate limits, tests, --flags) would be lost without this
+    return {
+        "config": plain_values(config),
+        "http_client": {"endpoint_hosts": dict(http_client.endpoint_hosts)},
+        fn.__module__: plain_values(sys.modules[fn.__module__])
+    }
+
+def init_worker(workers, settings=None):
+    for module_name, values in (settings or {}).items():
+        module = importlib.import_module(module_name)
+        for name, value in values.items():
+            setattr(module, name, value)
+    # every process has its own buckets - split the configured rates so the pool as a whole stays within them
+    http_client.share_rate_limits(workers)
+
+def run_item(fn, table, part_name, args, stage_name=None):
+    # runs inside a worker - fn(*args) -> DataFrame, or None when the item failed and nothing should be written
+    # the worker's metrics for this item go back with the result and are merged into the parent's
+    if stage_name is not None:
+        metrics.reset()
+        metrics.current_stage = stage_name
+    df = fn(*args)
+    rows = None
+    if df is not None:
+        storage.write_part(df, table, part_name)
+        rows = len(df)
+    return part_name, rows, metrics.snapshot() if stage_name is not None else None
+
+def collect(future, part_name, table, on_done):
+    try:
+        part_name, rows, worker_metrics = future.result()
+        metrics.merge(worker_metrics)
+        on_done(part_name, rows)
+    except:
+        print("scheduler error for", table, ":", part_name, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+        on_done(part_name, None)
+
+def run_parallel(fn, items, table, workers=None):
+    # items: iterable of (part_name, weight, args), consumed lazily - fn must be a module level function
+    # every item is written to its own part file of `table` - returns {part_name: rows or None}, merging is up to the caller
+    workers = get_workers(workers)
+    results = {}
+
+    def on_done(part_name, rows):
+        results[part_name] = rows
+        print("..", table, "parts done :", len(results), "last :", part_name, "rows :", rows)
+
+    if workers <= 1:
+        for part_name, _, args in items:
+            try:
+                on_done(*run_item(fn, table, part_name, args)[:2])
+            except:
+                print("scheduler error for", table, ":", part_name, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+                on_done(part_name, None)
+        return results
+
+    # spawned workers start with a fresh rpc provider and http session instead of sharing the parent's sockets
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(workers, worker_settings(fn))
+    ) as executor:
+        # bounded queue of submitted items - streamed inputs (e.g. nft_info chunks) aren't all held in memory
+        pending = {}
+        for part_name, _, args in items:
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, pending.pop(future), table, on_done)
+            pending[executor.submit(run_item, fn, table, part_name, args, metrics.stage_name())] = part_name
+
+        for future in list(pending):
+            collect(future, pending.pop(future), table, on_done)
+
+    return results
@@ -0,0 +1,339 @@
+import os
+import csv
+import uuid
+import shutil
+import operator
+import pandas as pd
+
+import config
+import metrics
+
+filter_ops = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda series, values: series.isin(values),
+    "not in": lambda series, values: ~series.isin(values)
+}
+
+# tables chained pipeline stages hand over in memory - still written to disk, but reads are served from here
+memory_enabled = set()
+# table -> DataFrames in append order
+memory_tables = {}
+# csv paths whose header was checked in this process
+checked_headers = set()
+
+
+def import_pyarrow():
+    # optional dependency - only needed for output_format = "parquet"
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise ImportError("output_format 'parquet' needs pyarrow - install with: poetry install -E parquet")
+
+def partitioning(pyarrow, table):
+    # partition values are always strings - left to inference, hex addresses can come back as ints
+    partition_cols = config.tables[table]["partition_cols"]
+    if not partition_cols:
+        return None
+    return pyarrow.dataset.partitioning(pyarrow.schema([(column, pyarrow.string()) for column in partition_cols]), flavor="hive")
+
+def table_path(table, output_format=None):
+    output_format = output_format or config.output_format
+    path = config.tables[table]["path"]
+    if output_format == "csv":
+        return path + ".csv"
+    return path
+
+def table_exists(table, output_format=None):
+    return os.path.exists(table_path(table, output_format))
+
+def ensure_header(table, path):
+    # nft_info.csv used to be appended with header=False - such a file gets the header put in front once,
+    # otherwise read_csv takes its first row for the header and appends keep it headerless
+    columns = config.tables[table]["columns"]
+    key = os.path.abspath(path)
+    if columns is None or key in checked_headers or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    checked_headers.add(key)
+    with open(path, newline="") as f:
+        first_row = next(csv.reader([f.readline()]), [])
+    if set(first_row) <= set(columns):
+        return
+
+    print("adding the missing header to", path)
+    tmp_path = path + ".tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        dst.write((",".join(columns) + "\n").encode())
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, path)
+
+def cast_types(df, table):
+    # typed columns from config - nullable ints so empty values survive
+    columns = config.tables[table]["columns"]
+    if columns is not None:
+        df = df.reindex(columns=columns)
+
+    for column in df.columns:
+        column_type = config.column_types.get(column, "string")
+        if column_type == "Int64":
+            df[column] = pd.to_numeric(df[column]).astype("Int64")
+        elif column_type == "uint256":
+            # token ids and amounts can be wider than any arrow int - stored as decimal strings
+            df[column] = df[column].map(lambda value: None if pd.isna(value) else str(int(value))).astype("string")
+        else:
+            df[column] = df[column].astype(column_type)
+    return df
+
+def to_uint256(series):
+    # decimal strings -> python ints, Int64 while every value fits so the common case stays vectorized
+    values = [None if pd.isna(value) else int(value) for value in series]
+    if all(value is None or -2**63 <= value < 2**63 for value in values):
+        return pd.Series(values, index=series.index, dtype="Int64")
+    return pd.Series(values, index=series.index, dtype=object)
+
+def restore_types(df):
+    # uint256 columns come back as strings from parquet, and from csv once a value overflows int64
+    for column in df.columns:
+        if config.column_types.get(column) == "uint256" and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = to_uint256(df[column])
+    return df
+
+def from_arrow(arrow_data):
+    # hive partition columns come back as dictionaries - hand stages plain values like the csv path does
+    df = arrow_data.to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(str)
+    return restore_types(df)
+
+def apply_filters(df, filters):
+    # filters: [(column, op, value)] - same form pyarrow takes, all conditions and-ed
+    for column, op, value in filters or []:
+        df = df[filter_ops[op](df[column], value)]
+    return df
+
+def split_filters(filters):
+    # -> (filters pyarrow can apply, filters left for pandas)
+    # uint256 columns are strings on disk - equality works on the decimal form, ranges only on the ints
+    pushed = []
+    remaining = []
+    for column, op, value in filters or []:
+        if config.column_types.get(column) != "uint256":
+            pushed.append((column, op, value))
+        elif op in ("in", "not in"):
+            pushed.append((column, op, [str(int(item)) for item in value]))
+        elif op in ("==", "!="):
+            pushed.append((column, op, str(int(value))))
+        else:
+            remaining.append((column, op, value))
+    return pushed, remaining
+
+def keep_in_memory(tables):
+    memory_enabled.update(tables)
+
+def release_memory():
+    memory_enabled.clear()
+    memory_tables.clear()
+
+def read_memory(table, columns=None, filters=None):
+    df = pd.concat(memory_tables[table], ignore_index=True)
+    df = apply_filters(df, filters)
+    return df if columns is None else df[columns]
+
+def drop_table(table, output_format=None):
+    memory_tables.pop(table, None)
+    path = table_path(table, output_format)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def write_table(df, table, output_format=None):
+    drop_table(table, output_format)
+    append_table(df, table, output_format)
+
+def append_table(df, table, output_format=None):
+    metrics.inc("rows_emitted_total", len(df), table=table)
+    if table in memory_enabled:
+        memory_tables.setdefault(table, []).append(df)
+    write_rows(df, table, output_format)
+
+def write_rows(df, table, output_format=None, path=None):
+    output_format = output_format or config.output_format
+    path = path or table_path(table, output_format)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if output_format == "csv":
+        if config.tables[table]["columns"] is not None:
+            df = df.reindex(columns=config.tables[table]["columns"])
+        ensure_header(table, path)
+        # header only when the file is created - later chunks are plain appends
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        df.to_csv(path, mode="a", index=False, header=write_header)
+        return
+
+    pyarrow = import_pyarrow()
+    arrow_table = pyarrow.Table.from_pandas(cast_types(df, table), preserve_index=False)
+    # every append gets its own files inside the partition directories
+    pyarrow.dataset.write_dataset(
+        arrow_table,
+        path,
+        format="parquet",
+        partitioning=partitioning(pyarrow, table),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+def rewrite_table(table, transform, extra_rows=None, output_format=None):
+    # every chunk goes through transform(df) -> df into a temp copy that is swapped in,
+    # readers never see a half rewritten table - extra_rows (a DataFrame) are appended at the end
+    output_format = output_format or config.output_format
+    memory_enabled.discard(table)
+    memory_tables.pop(table, None)
+    path = table_path(table, output_format)
+    tmp_path = path + ".tmp"
+    # leftover of an interrupted rewrite
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    if table_exists(table, output_format):
+        for chunk in read_table_chunks(table, output_format=output_format):
+            write_rows(transform(chunk), table, output_format, tmp_path)
+    if extra_rows is not None:
+        metrics.inc("rows_emitted_total", len(extra_rows), table=table)
+        write_rows(extra_rows, table, output_format, tmp_path)
+
+    if os.path.isdir(path):
+        # parquet datasets are directories - os.replace can't swap those in one step
+        shutil.rmtree(path)
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, path)
+
+def replace_rows(df, table, key_columns, remove_keys=None, output_format=None):
+    # rows whose key is in remove_keys (default: the keys in df) are dropped and df is appended
+    if remove_keys is None:
+        remove_keys = zip(*[df[column] for column in key_columns])
+    remove_keys = set(remove_keys)
+
+    def drop_removed(chunk):
+        keep = [key not in remove_keys for key in zip(*[chunk[column] for column in key_columns])]
+        return chunk[keep]
+
+    rewrite_table(table, drop_removed, df, output_format)
+
+def part_path(table, part_name, output_format=None):
+    # work item outputs of the process pool live next to the table until they are merged
+    output_format = output_format or config.output_format
+    extension = ".csv" if output_format == "csv" else ".parquet"
+    return os.path.join(config.tables[table]["path"] + ".parts", part_name + extension)
+
+def write_part(df, table, part_name, output_format=None):
+    output_format = output_format or config.output_format
+    metrics.inc("rows_emitted_total", len(df), table=table)
+    path = part_path(table, part_name, output_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # written under a temp name and swapped in - a killed worker never leaves half a part behind
+    tmp_path = path + ".tmp"
+    if output_format == "csv":
+        if config.tables[table]["columns"] is not None:
+            df = df.reindex(columns=config.tables[table]["columns"])
+        df.to_csv(tmp_path, index=False)
+    else:
+        pyarrow = import_pyarrow()
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(cast_types(df, table), preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+def merge_part(table, part_name, output_format=None):
+    # appends one part to the table and removes it - callers merge in a deterministic order
+    output_format = output_format or config.output_format
+    # parts never pass through memory - later reads of this table go to disk
+    memory_enabled.discard(table)
+    memory_tables.pop(table, None)
+    path = part_path(table, part_name, output_format)
+
+    if output_format == "csv":
+        # same columns in the same order - plain byte copy, the header only goes in when the table is new
+        target = table_path(table, output_format)
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        ensure_header(table, target)
+        write_header = not os.path.exists(target) or os.path.getsize(target) == 0
+        with open(path, "rb") as src, open(target, "ab") as dst:
+            header = src.readline()
+            if write_header:
+                dst.write(header)
+            shutil.copyfileobj(src, dst)
+    else:
+        pyarrow = import_pyarrow()
+        # rows were counted by the worker that wrote the part
+        write_rows(from_arrow(pyarrow.parquet.read_table(path)), table, output_format)
+    os.remove(path)
+
+def drop_parts(table, output_format=None):
+    parts_dir = os.path.dirname(part_path(table, "", output_format))
+    if os.path.isdir(parts_dir):
+        shutil.rmtree(parts_dir)
+
+def read_table(table, columns=None, filters=None, output_format=None):
+    if table in memory_tables:
+        return read_memory(table, columns, filters)
+    output_format = output_format or config.output_format
+    path = table_path(table, output_format)
+
+    if output_format == "csv":
+        ensure_header(table, path)
+        filter_columns = [column for column, _, _ in filters or []]
+        usecols = None if columns is None else list(dict.fromkeys(columns + filter_columns))
+        df = apply_filters(restore_types(pd.read_csv(path, usecols=usecols)), filters)
+        return df if columns is None else df[columns]
+
+    pyarrow = import_pyarrow()
+    pushed, remaining = split_filters(filters)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + [column for column, _, _ in remaining]))
+    # partition columns and row groups are pruned by pyarrow before anything is read
+    arrow_table = pyarrow.parquet.read_table(path, columns=read_columns, filters=pushed or None, partitioning=partitioning(pyarrow, table))
+    df = apply_filters(from_arrow(arrow_table), remaining)
+    return df if columns is None else df[columns]
+
+def read_table_chunks(table, columns=None, filters=None, chunksize=None, output_format=None):
+    output_format = output_format or config.output_format
+    path = table_path(table, output_format)
+    chunksize = chunksize or config.attributes_chunk_size
+
+    if table in memory_tables:
+        df = read_memory(table, columns, filters)
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i:i + chunksize]
+        return
+
+    if output_format == "csv":
+        ensure_header(table, path)
+        filter_columns = [column for column, _, _ in filters or []]
+        usecols = None if columns is None else list(dict.fromkeys(columns + filter_columns))
+        for df in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            df = apply_filters(restore_types(df), filters)
+            yield df if columns is None else df[columns]
+        return
+
+    pyarrow = import_pyarrow()
+    dataset = pyarrow.dataset.dataset(path, format="parquet", partitioning=partitioning(pyarrow, table))
+    pushed, remaining = split_filters(filters)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + [column for column, _, _ in remaining]))
+    expression = None
+    for column, op, value in pushed:
+        field = pyarrow.dataset.field(column)
+        condition = field.isin(value) if op == "in" else ~field.isin(value) if op == "not in" else filter_ops[op](field, value)
+        expression = condition if expression is None else expression & condition
+
+    for batch in dataset.to_batches(columns=read_columns, filter=expression, batch_size=chunksize):
+        df = apply_filters(from_arrow(batch), remaining)
+        yield df if columns is None else df[columns]
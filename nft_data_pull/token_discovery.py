@@ -0,0 +1,59 @@
+import sys
+
+import abi_registry
+import config
+import rpc_batch
+import storage
+
+
+def ids_from_enumerable(w3, contract_instance, total_supply):
+    # ERC721Enumerable - tokenByIndex(0..total_supply-1) is exactly the set of live tokens
+    calls = [(contract_instance, "tokenByIndex", (index,)) for index in range(total_supply)]
+    results = rpc_batch.aggregate_calls(w3, calls)
+    token_ids = [int(result.value) for result in results if result.success]
+    if len(token_ids) < total_supply:
+        # some indexes reverted - the enumeration is incomplete, let the caller try something else
+        return None
+    return sorted(set(token_ids))
+
+def ids_from_mints(contract_address):
+    # tokens that came out of the zero address in the pulled transfers and weren't burned since
+    if not storage.table_exists("nft_transfers"):
+        return None
+    df_transfers = storage.read_table(
+        "nft_transfers",
+        columns=["block_number", "log_index", "from_address", "to_address", "nft_token_id"],
+        filters=[("collection_contract_address", "==", contract_address)]
+    )
+    if not (df_transfers["from_address"].astype(str).str.lower() == config.zero_address).any():
+        return None
+    # a token's last transfer decides - one sent back to the zero address is gone
+    df_last = df_transfers.sort_values(["block_number", "log_index"]).drop_duplicates("nft_token_id", keep="last")
+    df_live = df_last[df_last["to_address"].astype(str).str.lower() != config.zero_address]
+    return sorted({int(token_id) for token_id in df_live["nft_token_id"]})
+
+def ids_from_owners(w3, contract_instance, total_supply):
+    # no enumeration and no transfers - probe ownerOf around the usual 0/1 based range, nonexistent ids revert
+    candidate_ids = list(range(0, total_supply + 1))
+    results = rpc_batch.aggregate_calls(w3, [(contract_instance, "ownerOf", (token_id,)) for token_id in candidate_ids])
+    return [token_id for token_id, result in zip(candidate_ids, results) if result.success]
+
+def discover_token_ids(w3, contract_instance, contract_abi, contract_address, total_supply):
+    # -> (sorted token ids, source) - only ids that exist, so nothing downstream requests missing tokens
+    if abi_registry.capabilities(contract_abi) & abi_registry.TOKEN_BY_INDEX:
+        try:
+            token_ids = ids_from_enumerable(w3, contract_instance, total_supply)
+            if token_ids is not None:
+                return token_ids, "tokenByIndex"
+        except:
+            print("tokenByIndex error for", contract_address, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+
+    if config.token_discovery_mints:
+        try:
+            token_ids = ids_from_mints(contract_address)
+            if token_ids is not None:
+                return token_ids, "mints"
+        except:
+            print("mint events error for", contract_address, "\n", f"{sys.exc_info()[0]}, {sys.exc_info()[1]}")
+
+    return ids_from_owners(w3, contract_instance, total_supply), "ownerOf"
@@ -0,0 +1,72 @@
+import random
+from collections import namedtuple
+
+import config
+import rpc_batch
+
+# tokenURI(id) == prefix + encode(id, encoding) + suffix
+UriTemplate = namedtuple("UriTemplate", ["prefix", "encoding", "suffix"])
+
+
+def encode_token_id(token_id, encoding):
+    if encoding == "dec":
+        return str(token_id)
+    if encoding.startswith("dec_pad"):
+        return str(token_id).zfill(int(encoding[len("dec_pad"):]))
+    if encoding == "hex":
+        return format(token_id, "x")
+    if encoding == "hex64":
+        # erc-1155 style {id} substitution
+        return format(token_id, "064x")
+    raise ValueError(f"unknown token id encoding: {encoding}")
+
+def render(template, token_id):
+    return template.prefix + encode_token_id(token_id, template.encoding) + template.suffix
+
+def candidate_encodings(samples):
+    # zero padded ids (e.g. 0001.json) can be any width wider than the largest sampled id
+    digits = len(str(max(samples)))
+    return ["dec", "hex64", "hex"] + [f"dec_pad{width}" for width in range(digits + 1, 9)]
+
+def infer_template(samples):
+    # samples: {token_id: token_uri} - returns the UriTemplate every sample agrees on, or None
+    if len(samples) < 2:
+        return None
+
+    token_id, uri = max(samples.items())
+    for encoding in candidate_encodings(samples):
+        encoded = encode_token_id(token_id, encoding)
+        # ids usually sit at the end of the uri - try the rightmost occurrence first
+        position = uri.rfind(encoded)
+        while position != -1:
+            template = UriTemplate(uri[:position], encoding, uri[position + len(encoded):])
+            if all(render(template, sample_id) == sample_uri for sample_id, sample_uri in samples.items()):
+                return template
+            position = uri.rfind(encoded, 0, position)
+
+    return None
+
+def sample_token_ids(token_ids):
+    # spread out ids to infer from + random ids to verify against
+    token_ids = list(token_ids)
+    infer_ids = sorted({token_ids[0], token_ids[len(token_ids) // 2], token_ids[-1]})
+    rest = [token_id for token_id in token_ids if token_id not in infer_ids]
+    verify_ids = random.sample(rest, min(len(rest), config.uri_template_verify_samples))
+    return infer_ids, verify_ids
+
+def discover_template(w3, contract_instance, token_ids):
+    # a handful of tokenURI calls in one aggregated request instead of one per token
+    infer_ids, verify_ids = sample_token_ids(token_ids)
+    sample_ids = infer_ids + verify_ids
+    results = rpc_batch.aggregate_calls(w3, [(contract_instance, "tokenURI", (token_id,)) for token_id in sample_ids])
+    token_uris = {token_id: str(result.value) for token_id, result in zip(sample_ids, results) if result.success}
+
+    template = infer_template({token_id: token_uris[token_id] for token_id in infer_ids if token_id in token_uris})
+    if template is None:
+        return None
+
+    # the pattern has to hold for random tokens too - otherwise fall back to batched calls
+    for token_id in verify_ids:
+        if token_id in token_uris and render(template, token_id) != token_uris[token_id]:
+            return None
+    return template
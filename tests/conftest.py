@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules in nft_data_pull import each other as top-level modules (main.py is run from that directory)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull"))
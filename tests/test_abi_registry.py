@@ -0,0 +1,43 @@
+import os
+import json
+import pandas as pd
+
+import abi_registry
+import config
+import storage
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+nft_abi = '[{"inputs":[{"internalType":"uint256","name":"tokenId","type":"uint256"}],"name":"tokenURI","outputs":[{"internalType":"string","name":"","type":"string"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"totalSupply","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"}]'
+# substring checks would have matched the "paused" event - only functions count
+event_abi = '[{"anonymous":false,"inputs":[],"name":"paused","type":"event"}]'
+
+
+def test_capabilities():
+    assert abi_registry.has_capability(abi_registry.capabilities(nft_abi), abi_registry.NFT)
+    assert abi_registry.capabilities(event_abi) == 0
+    assert abi_registry.capabilities(float("nan")) == 0
+    assert abi_registry.capabilities("not json") == 0
+
+    with open(os.path.join(samples_dir, "contract_abi.json")) as f:
+        sample_abi = json.load(f)["result"]
+    assert abi_registry.capabilities(sample_abi) & abi_registry.TOKEN_URI
+
+def test_abis_are_deduplicated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    df_contracts = pd.DataFrame({
+        "Address": ["0x00000000000000000000000000000000000000a1", "0x00000000000000000000000000000000000000A2"],
+        "ContractName": ["One", "Two"],
+        "ABI": [nft_abi, nft_abi]
+    })
+
+    abi_registry.write_index(df_contracts)
+
+    df_index = storage.read_table("contract_index")
+    assert df_index["abi_hash"].nunique() == 1
+    assert (storage.read_table("abis")["abi_hash"] == df_index["abi_hash"][0]).sum() == 1
+
+    abi_registry.contract_index.clear()
+    assert abi_registry.load_index()
+    assert abi_registry.get_abi("0x00000000000000000000000000000000000000a2") == nft_abi
+    assert abi_registry.contract_capabilities("0x00000000000000000000000000000000000000A1") == abi_registry.NFT
@@ -0,0 +1,66 @@
+import json
+import pandas as pd
+
+import config
+from main import build_nft_token_attribute_rows, parse_metadata
+
+contract_address = "0x179513e0fa9B5AD964405B01194105A2d8e0c2df"
+
+
+def nft_info_rows(metadata_list):
+    return pd.DataFrame({
+        "collection_contract_address": contract_address,
+        "collection_slug": "celo-punks",
+        "nft_token_id": range(1, len(metadata_list) + 1),
+        "metadata": metadata_list
+    })
+
+def test_parse_metadata_json_and_legacy_repr():
+    metadata = {"name": "Punk #1", "attributes": [{"trait_type": "Hat", "value": "Cap"}]}
+
+    assert parse_metadata(json.dumps(metadata)) == metadata
+    # older runs wrote the python repr of the dict
+    assert parse_metadata(repr(metadata)) == metadata
+    assert parse_metadata(repr({"flag": True, "none": None})) == {"flag": True, "none": None}
+
+def test_attribute_rows():
+    df = build_nft_token_attribute_rows(nft_info_rows([
+        json.dumps({"attributes": [
+            {"trait_type": "Hat", "value": "Cap"},
+            {"trait_type": "Level", "value": 5, "display_type": "number", "max_value": 10}
+        ]}),
+        # legacy repr
+        repr({"attributes": [{"trait_type": "Eyes", "value": "Laser"}]}),
+        # a single attribute as a dict instead of a list
+        json.dumps({"attributes": {"trait_type": "Background", "value": "Blue"}})
+    ]))
+
+    assert list(df.columns) == config.nft_token_attributes_columns
+    assert df["nft_token_id"].tolist() == [1, 1, 2, 3]
+    assert df["attribute_key"].tolist() == ["Hat", "Level", "Eyes", "Background"]
+    assert df["attribute_value"].tolist() == ["Cap", 5, "Laser", "Blue"]
+    assert df["attribute_type"].tolist() == ["str", "int", "str", "str"]
+    level = df.iloc[1]
+    assert level["display_type"] == "number"
+    assert level["max_value"] == 10
+    assert pd.isna(df.iloc[0]["display_type"])
+    assert set(df["collection_slug"]) == {"celo-punks"}
+
+def test_malformed_and_missing_attributes_are_skipped():
+    df = build_nft_token_attribute_rows(nft_info_rows([
+        # no attributes at all
+        json.dumps({"name": "Punk #1"}),
+        # neither json nor a python literal
+        "{not metadata",
+        # entries that aren't objects are dropped, the rest of the token is kept
+        json.dumps({"attributes": ["Cap", None, {"trait_type": "Hat", "value": "Cap"}]}),
+        # attributes of the wrong type
+        json.dumps({"attributes": 7}),
+        # value without a trait_type
+        json.dumps({"attributes": [{"value": "Unnamed"}]})
+    ]))
+
+    assert df["nft_token_id"].tolist() == [3, 5]
+    assert df["attribute_key"].tolist()[0] == "Hat"
+    assert pd.isna(df["attribute_key"].tolist()[1])
+    assert df["attribute_value"].tolist() == ["Cap", "Unnamed"]
@@ -0,0 +1,67 @@
+import sqlite3
+
+import config
+from cache import MetadataCache, cache_key
+
+cid = "QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx"
+
+
+def test_ipfs_urls_share_cid_key():
+    assert cache_key(f"https://ipfs.io/ipfs/{cid}/1.json") == (f"ipfs:{cid}/1.json", True)
+    assert cache_key(f"ipfs://{cid}/1.json") == (f"ipfs:{cid}/1.json", True)
+    assert cache_key("https://example.com/1.json") == ("https://example.com/1.json", False)
+
+def test_http_entry_needs_validators(tmp_path):
+    metadata_cache = MetadataCache(str(tmp_path / "cache.sqlite"))
+    metadata_cache.put("https://example.com/1.json", b"{}", {})
+    metadata_cache.put("https://example.com/2.json", b"{}", {"ETag": '"abc"'})
+
+    assert metadata_cache.get("https://example.com/1.json") is None
+    entry = metadata_cache.get("https://example.com/2.json")
+    assert metadata_cache.validators(entry) == {"If-None-Match": '"abc"'}
+
+def test_new_body_without_validators_drops_the_old_entry(tmp_path):
+    metadata_cache = MetadataCache(str(tmp_path / "cache.sqlite"))
+    metadata_cache.put("https://example.com/1.json", b'{"v": 1}', {"ETag": '"v1"'})
+    # revalidation came back 200 with a new body and no validators - the old etag must not get a 304 later
+    metadata_cache.put("https://example.com/1.json", b'{"v": 2}', {})
+
+    assert metadata_cache.get("https://example.com/1.json") is None
+    assert metadata_cache.total_bytes() == 0
+
+def test_lru_eviction(tmp_path):
+    metadata_cache = MetadataCache(str(tmp_path / "cache.sqlite"), max_bytes=25)
+    for token_id in range(3):
+        metadata_cache.put(f"ipfs://{cid}/{token_id}.json", b"x" * 10)
+
+    assert metadata_cache.stats["evictions"] == 1
+    assert metadata_cache.get(f"ipfs://{cid}/0.json") is None
+    assert metadata_cache.get(f"ipfs://{cid}/2.json") is not None
+
+def test_size_cap_is_shared_across_connections(tmp_path):
+    # process pool workers each open the cache - the cap applies to the file, not to each connection
+    path = str(tmp_path / "cache.sqlite")
+    first = MetadataCache(path, max_bytes=25)
+    second = MetadataCache(path, max_bytes=25)
+    first.put(f"ipfs://{cid}/0.json", b"x" * 10)
+    second.put(f"ipfs://{cid}/1.json", b"x" * 10)
+    first.put(f"ipfs://{cid}/2.json", b"x" * 10)
+
+    assert first.total_bytes() == second.total_bytes() <= 25
+    assert first.stats["evictions"] + second.stats["evictions"] == 1
+
+def test_locked_cache_is_a_miss(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "cache_busy_timeout_seconds", 0.1)
+    path = str(tmp_path / "cache.sqlite")
+    metadata_cache = MetadataCache(path)
+    metadata_cache.put(f"ipfs://{cid}/0.json", b"{}")
+
+    # another process holds the write lock past the busy timeout - no exception reaches the fetch
+    locker = sqlite3.connect(path)
+    locker.execute("BEGIN EXCLUSIVE")
+    metadata_cache.put(f"ipfs://{cid}/1.json", b"{}")
+    assert metadata_cache.get(f"ipfs://{cid}/0.json") is None
+    locker.rollback()
+
+    assert metadata_cache.get(f"ipfs://{cid}/0.json") is not None
+    assert metadata_cache.get(f"ipfs://{cid}/1.json") is None
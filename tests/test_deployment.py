@@ -0,0 +1,78 @@
+import config
+import deployment
+import http_client
+import logs
+import rpc_batch
+
+# two collections deployed directly, one by a factory (no creation transaction of its own)
+direct_a = "0x00000000000000000000000000000000000000A1"
+direct_b = "0x00000000000000000000000000000000000000b2"
+factory_made = "0x00000000000000000000000000000000000000c3"
+deploy_blocks = {direct_a.lower(): 1234, direct_b.lower(): 77, factory_made.lower(): 500}
+latest_block = 100000
+
+
+class FakeNode:
+    # answers the json-rpc methods the resolver uses from deploy_blocks
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, w3, requests, batch_size=None):
+        self.batches.append([method for method, _ in requests])
+        return [getattr(self, method)(*params) for method, params in requests]
+
+    def eth_getCode(self, address, block):
+        return "0x6080" if int(block, 16) >= deploy_blocks[address.lower()] else "0x"
+
+    def eth_getBlockByNumber(self, block, full_transactions):
+        block_number = int(block, 16)
+        transactions = [
+            {"hash": f"0x{block_number:064x}", "from": "0x00000000000000000000000000000000000000EE", "to": None}
+            for address, deploy_block in deploy_blocks.items() if deploy_block == block_number and address != factory_made.lower()
+        ]
+        return {"number": block, "timestamp": hex(1600000000 + block_number), "transactions": transactions}
+
+    def eth_getTransactionReceipt(self, transaction_hash):
+        block_number = int(transaction_hash, 16)
+        address = next(address for address, deploy_block in deploy_blocks.items() if deploy_block == block_number)
+        return {"contractAddress": address, "transactionHash": transaction_hash}
+
+
+class FakeW3:
+    class eth:
+        block_number = latest_block
+
+
+def test_find_creation_blocks(monkeypatch):
+    node = FakeNode()
+    monkeypatch.setattr(rpc_batch, "batch_requests", node)
+
+    creation_blocks = deployment.find_creation_blocks(FakeW3, [direct_a, direct_b, factory_made], latest_block)
+
+    assert creation_blocks == {direct_a: 1234, direct_b: 77, factory_made: 500}
+    # all contracts share each round's batch - rounds grow with log2(latest_block), not with the contract count
+    assert len(node.batches) <= latest_block.bit_length() + 2
+
+def test_resolve_deployments_falls_back_to_explorer(monkeypatch):
+    monkeypatch.setattr(rpc_batch, "batch_requests", FakeNode())
+    monkeypatch.setattr(config, "deployment_lookup", "rpc")
+    monkeypatch.setattr(deployment, "deployments", {})
+    explorer_queries = []
+
+    def fake_get_json(url, **kwargs):
+        explorer_queries.append(url)
+        return {"result": [{"blockNumber": "500", "timeStamp": "1600000500", "hash": "0xfactory", "from": "0x00000000000000000000000000000000000000ff"}]}
+    monkeypatch.setattr(http_client, "get_json", fake_get_json)
+
+    found = deployment.resolve_deployments(FakeW3, [direct_a, direct_b, factory_made], "https://explorer")
+
+    assert found[deployment.to_checksum_address(direct_a)] == {
+        "block_number": 1234, "timestamp": 1600001234, "transaction_hash": f"0x{1234:064x}", "from": deployment.to_checksum_address("0x00000000000000000000000000000000000000ee")
+    }
+    assert found[deployment.to_checksum_address(direct_b)]["block_number"] == 77
+    assert found[deployment.to_checksum_address(factory_made)]["transaction_hash"] == "0xfactory"
+    # both lookup paths give the sender in checksum form
+    assert found[deployment.to_checksum_address(factory_made)]["from"] == deployment.to_checksum_address("0x00000000000000000000000000000000000000ff")
+    # only the factory deployment needed a txlist call
+    assert len(explorer_queries) == 1
+    assert logs.block_timestamp_cache[1234] == 1600001234
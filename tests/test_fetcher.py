@@ -0,0 +1,62 @@
+import asyncio
+
+import config
+import fetcher
+
+
+def fake_fetch_json(in_flight, peaks, fail_urls=()):
+    # stands in for the network - tracks how many requests each host has open at once
+    async def fetch_json(session, url, cache=None):
+        host = fetcher.get_host(url)
+        in_flight[host] = in_flight.get(host, 0) + 1
+        peaks[host] = max(peaks.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        if url in fail_urls:
+            raise ValueError("http status 500")
+        return {"name": url, "image": url}
+    return fetch_json
+
+def test_per_host_limits(monkeypatch):
+    peaks = {}
+    monkeypatch.setattr(fetcher, "fetch_json", fake_fetch_json({}, peaks))
+    monkeypatch.setattr(config, "metadata_default_host_limit", 3)
+    items = [(i, f"https://{host}/{i}.json") for host in ["a.test", "b.test"] for i in range(20)]
+    results = []
+
+    errors = fetcher.fetch_metadata(items, lambda key, url, md, err: results.append(key), concurrency=10, host_limits={"a.test": 2})
+
+    assert errors == 0
+    assert len(results) == len(items)
+    # configured limit for a.test, the default for hosts without one
+    assert peaks == {"a.test": 2, "b.test": 3}
+
+def test_errors_are_counted(monkeypatch):
+    fail_urls = {"https://a.test/1.json", "https://a.test/2.json"}
+    monkeypatch.setattr(fetcher, "fetch_json", fake_fetch_json({}, {}, fail_urls))
+    items = [(i, f"https://a.test/{i}.json") for i in range(10)]
+    failed = []
+
+    def on_result(key, url, metadata, err):
+        if err is not None:
+            failed.append(key)
+            return
+        if key == 5:
+            # e.g. metadata without the fields the caller needs
+            raise KeyError("image")
+
+    errors = fetcher.fetch_metadata(items, on_result, concurrency=4)
+
+    assert sorted(failed) == [1, 2]
+    assert errors == 3
+
+def test_max_errors_stops_the_queue(monkeypatch):
+    items = [(i, f"https://a.test/{i}.json") for i in range(100)]
+    monkeypatch.setattr(fetcher, "fetch_json", fake_fetch_json({}, {}, {url for _, url in items}))
+    calls = []
+
+    errors = fetcher.fetch_metadata(items, lambda key, url, md, err: calls.append(key), concurrency=2, max_errors=5)
+
+    # items already queued still finish - nothing new is queued once the limit is reached
+    assert 5 <= errors < 20
+    assert len(calls) == errors
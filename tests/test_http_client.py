@@ -0,0 +1,76 @@
+import pytest
+import requests
+
+import config
+import http_client
+
+
+def test_token_bucket_burst_then_wait():
+    bucket = http_client.TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.05 < bucket.reserve() <= 0.1
+
+def test_token_bucket_adapts_to_throttling():
+    bucket = http_client.TokenBucket(rate=16, burst=1)
+
+    for _ in range(10):
+        bucket.throttled()
+    assert bucket.rate == 1
+
+    bucket.throttled(retry_after=5)
+    assert bucket.reserve() > 4
+
+    bucket.succeeded()
+    assert bucket.rate > 1
+
+def test_endpoint_for():
+    http_client.register_endpoint("https://explorer.celo.org/mainnet/api", "explorer")
+
+    assert http_client.endpoint_for("https://explorer.celo.org/mainnet/api/?module=token") == "explorer"
+    assert http_client.endpoint_for("https://ipfs.io/ipfs/Qm") == "ipfs:ipfs.io"
+    assert http_client.endpoint_for("https://example.com/1.json") == "metadata:example.com"
+
+def test_backoff_honors_retry_after():
+    assert http_client.parse_retry_after("3") == 3
+    assert http_client.backoff_seconds(0, retry_after=3) >= 3
+    assert http_client.backoff_seconds(10) <= config.http_backoff_max_seconds
+
+def http_error(status, headers=None):
+    # what the web3 http provider raises for a non-2xx response
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"http status {status}", response=response)
+
+def fake_make_request(responses, calls):
+    def make_request(method, params):
+        calls.append(method)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    return make_request
+
+def test_rpc_middleware_retries_throttled_calls(monkeypatch):
+    monkeypatch.setattr(http_client, "buckets", {"rpc": http_client.TokenBucket(rate=1000, burst=1000)})
+    monkeypatch.setattr(http_client, "backoff_seconds", lambda attempt, retry_after=None: 0)
+    calls = []
+    responses = [http_error(429, {"Retry-After": "0"}), http_error(503), {"jsonrpc": "2.0", "id": 1, "result": "0x1"}]
+    middleware = http_client.rate_limit_middleware(fake_make_request(responses, calls), None)
+
+    assert middleware("eth_blockNumber", [])["result"] == "0x1"
+    assert calls == ["eth_blockNumber"] * 3
+    # the 429 slowed the rpc bucket down
+    assert http_client.buckets["rpc"].rate < 1000
+
+def test_rpc_middleware_raises_other_errors(monkeypatch):
+    monkeypatch.setattr(http_client, "buckets", {"rpc": http_client.TokenBucket(rate=1000, burst=1000)})
+    monkeypatch.setattr(http_client, "backoff_seconds", lambda attempt, retry_after=None: 0)
+    calls = []
+    middleware = http_client.rate_limit_middleware(fake_make_request([http_error(400)], calls), None)
+
+    with pytest.raises(requests.HTTPError):
+        middleware("eth_call", [])
+    assert calls == ["eth_call"]
@@ -0,0 +1,87 @@
+import time
+import asyncio
+import aiohttp
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import ipfs
+
+cid_v0 = "QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx"
+cid_v1 = "bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi"
+
+
+def test_parse_ipfs_uri():
+    assert ipfs.parse_ipfs_uri(f"ipfs://{cid_v0}/1.json") == (cid_v0, "/1.json")
+    assert ipfs.parse_ipfs_uri(f"ipfs://ipfs/{cid_v0}/1.json") == (cid_v0, "/1.json")
+    assert ipfs.parse_ipfs_uri(f"https://gateway.pinata.cloud/ipfs/{cid_v1}/1") == (cid_v1, "/1")
+    assert ipfs.parse_ipfs_uri(f"https://{cid_v1}.ipfs.dweb.link/1.json") == (cid_v1, "/1.json")
+    assert ipfs.parse_ipfs_uri(cid_v0) == (cid_v0, "")
+    assert ipfs.parse_ipfs_uri("https://example.com/metadata/1.json") is None
+
+def test_to_ipfs_uri():
+    assert ipfs.to_ipfs_uri(f"https://ipfs.io/ipfs/{cid_v0}/7") == f"ipfs://{cid_v0}/7"
+    assert ipfs.to_ipfs_uri("https://example.com/7") == "https://example.com/7"
+
+def start_gateway(delay=0.0, status=200):
+    class GatewayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = b'{"name": "token"}'
+            try:
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except ConnectionError:
+                # hedged request that lost the race was cancelled by the client
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GatewayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def test_hedged_fetch_demotes_slow_and_failing_gateways(monkeypatch):
+    slow_server, slow = start_gateway(delay=1.0)
+    broken_server, broken = start_gateway(status=404)
+    fast_server, fast = start_gateway()
+    monkeypatch.setattr(config, "ipfs_gateways", [slow, broken, fast])
+    monkeypatch.setattr(config, "ipfs_hedge_delay_seconds", 0.1)
+    monkeypatch.setattr(ipfs, "gateway_health", {})
+
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            return await ipfs.fetch_ipfs(session, cid_v0, "/1.json")
+
+    start = time.monotonic()
+    assert asyncio.run(fetch()) == b'{"name": "token"}'
+    assert time.monotonic() - start < 0.9
+    assert ipfs.ranked_gateways()[0] == fast
+
+    for server in [slow_server, broken_server, fast_server]:
+        server.shutdown()
+
+def test_slow_primary_loses_its_rank(monkeypatch):
+    # the primary never fails, it just got slow - every fetch is won by the hedge
+    slow_server, slow = start_gateway(delay=1.0)
+    fast_server, fast = start_gateway()
+    monkeypatch.setattr(config, "ipfs_gateways", [slow, fast])
+    monkeypatch.setattr(config, "ipfs_hedge_delay_seconds", 0.05)
+    monkeypatch.setattr(ipfs, "gateway_health", {})
+    ipfs.get_health(slow).latency = 0.005
+
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            for _ in range(20):
+                await ipfs.fetch_ipfs(session, cid_v0, "/1.json")
+
+    asyncio.run(fetch())
+    assert ipfs.get_health(slow).latency > 0.02
+    assert ipfs.ranked_gateways()[0] == fast
+
+    for server in [slow_server, fast_server]:
+        server.shutdown()
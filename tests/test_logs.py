@@ -0,0 +1,148 @@
+import os
+import json
+import pytest
+import pandas as pd
+
+import config
+import http_client
+import logs
+from logs import decode_transfer_logs, to_int
+from main import build_nft_transfer_rows
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+def load_fixture():
+    with open(os.path.join(samples_dir, "transfer_logs.json")) as f:
+        fixture = json.load(f)
+    block_timestamps = {int(block, 16): int(ts, 16) for block, ts in fixture["block_timestamps"].items()}
+    return fixture["result"], block_timestamps
+
+def test_decode_transfer_logs():
+    raw_logs, block_timestamps = load_fixture()
+    rows = decode_transfer_logs(raw_logs, block_timestamps)
+
+    assert len(rows) == len(raw_logs)
+    assert set(rows[0]) == set(config.nft_transfers_columns)
+    assert rows[0]["from_address"] == config.zero_address
+    assert rows[0]["to_address"] == "0xb5901482d09a34710ae006b99b5378d77b529422"
+    assert rows[0]["nft_token_id"] == 1
+    assert rows[0]["block_number"] == 0x941265
+    assert rows[0]["transfer_type"] == "mint"
+
+def test_decode_skips_erc20_transfers():
+    raw_logs, block_timestamps = load_fixture()
+    erc20_log = dict(raw_logs[0], topics=raw_logs[0]["topics"][:3])
+
+    assert decode_transfer_logs([erc20_log], block_timestamps) == []
+    assert to_int("0x10") == 16
+
+def test_logs_and_explorer_engines_agree():
+    # the same 72 transfers as returned by eth_getLogs and by the explorer tokentx api
+    raw_logs, block_timestamps = load_fixture()
+    with open(os.path.join(samples_dir, "transfers.json")) as f:
+        df_transfers = pd.json_normalize(json.load(f)["result"])
+    contract_address = "0x179513e0fa9B5AD964405B01194105A2d8e0c2df"
+    # the sample is all mints - every other transfer gets a holder as sender, in both sources
+    sender = "0xB5901482d09A34710AE006B99b5378D77b529422"
+    raw_logs = [
+        dict(log, topics=[log["topics"][0], "0x" + "0" * 24 + sender[2:].lower()] + log["topics"][2:]) if i % 2 else log
+        for i, log in enumerate(raw_logs)
+    ]
+    block_log_indexes = [(int(log["blockNumber"], 16), int(log["logIndex"], 16)) for log in raw_logs[1::2]]
+    is_resale = [(int(block, 16), int(log_index, 16)) in block_log_indexes for block, log_index in zip(df_transfers["blockNumber"], df_transfers["logIndex"])]
+    df_transfers.loc[is_resale, "fromAddressHash"] = sender
+
+    df_logs = pd.DataFrame(decode_transfer_logs(raw_logs, block_timestamps), columns=config.nft_transfers_columns)
+    df_explorer = build_nft_transfer_rows(df_transfers, contract_address)
+
+    sort_columns = ["block_number", "log_index"]
+    pd.testing.assert_frame_equal(
+        df_logs.sort_values(sort_columns).reset_index(drop=True),
+        df_explorer.sort_values(sort_columns).reset_index(drop=True),
+        check_dtype=False
+    )
+    assert set(df_logs["transfer_type"]) == {"mint", "transfer"}
+
+
+class FakeEth:
+    # blocks below dense_until are busy - wider windows than dense_window are refused there with a range error
+    def __init__(self, dense_until=0, dense_window=None, reset_at=None):
+        self.dense_until = dense_until
+        self.dense_window = dense_window
+        self.reset_at = reset_at
+        self.windows = []
+
+    def get_logs(self, params):
+        if params["fromBlock"] == self.reset_at:
+            self.reset_at = None
+            raise ConnectionError("connection reset by peer")
+        if params["fromBlock"] < self.dense_until and params["toBlock"] - params["fromBlock"] + 1 > self.dense_window:
+            raise ValueError({"code": -32005, "message": "query returned more than 10000 results"})
+        self.windows.append((params["fromBlock"], params["toBlock"]))
+        return []
+
+
+class FakeW3:
+    def __init__(self, eth):
+        self.eth = eth
+
+def test_block_window_shrinks_and_grows_back(monkeypatch):
+    monkeypatch.setattr(config, "logs_block_window", 1000)
+    eth = FakeEth(dense_until=500, dense_window=250)
+
+    windows = [window_to_block for window_to_block, _ in logs.get_log_windows(FakeW3(eth), ["0xA"], [], 0, 4999)]
+
+    assert windows[-1] == 4999
+    # halved until the node accepts the dense range, doubled back to the configured window after it
+    assert eth.windows[:2] == [(0, 249), (250, 499)]
+    assert eth.windows[-2:] == [(3000, 3999), (4000, 4999)]
+
+def test_other_errors_do_not_shrink_the_window(monkeypatch):
+    monkeypatch.setattr(config, "logs_block_window", 1000)
+    eth = FakeEth(reset_at=1000)
+
+    windows = logs.get_log_windows(FakeW3(eth), ["0xA"], [], 0, 1999)
+    assert next(windows)[0] == 999
+    with pytest.raises(ConnectionError):
+        next(windows)
+    assert eth.windows == [(0, 999)]
+
+
+class FakeRpcW3:
+    class provider:
+        endpoint_uri = "http://rpc.test"
+
+def fake_block_node(failing, requested):
+    # eth_getBlockByNumber - blocks in failing get an error item as many times as failing says
+    def post_json(url, payload, **kwargs):
+        response = []
+        for item in payload:
+            block_number = int(item["params"][0], 16)
+            requested.append(block_number)
+            if failing.get(block_number, 0) > 0:
+                failing[block_number] -= 1
+                response.append({"jsonrpc": "2.0", "id": item["id"], "error": {"code": -32000, "message": "header not found"}})
+            else:
+                response.append({"jsonrpc": "2.0", "id": item["id"], "result": {"number": hex(block_number), "timestamp": hex(1600000000 + block_number)}})
+        return response
+    return post_json
+
+def test_block_timestamps_retry_failed_blocks(monkeypatch):
+    monkeypatch.setattr(http_client, "backoff_seconds", lambda attempt, retry_after=None: 0)
+    requested = []
+    monkeypatch.setattr(http_client, "post_json", fake_block_node({11: 1}, requested))
+
+    block_timestamps = logs.get_block_timestamps(FakeRpcW3, [10, 11, 12, 11], {})
+
+    assert block_timestamps == {10: 1600000010, 11: 1600000011, 12: 1600000012}
+    # only the failed block is asked for again
+    assert requested == [10, 11, 12, 11]
+
+def test_block_timestamps_name_the_missing_blocks(monkeypatch):
+    monkeypatch.setattr(http_client, "backoff_seconds", lambda attempt, retry_after=None: 0)
+    monkeypatch.setattr(config, "http_max_retries", 2)
+    monkeypatch.setattr(http_client, "post_json", fake_block_node({11: 99}, []))
+
+    with pytest.raises(ValueError, match=r"blocks \[11\]"):
+        logs.get_block_timestamps(FakeRpcW3, [10, 11], {})
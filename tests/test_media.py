@@ -0,0 +1,41 @@
+import media
+from cache import MediaTypeCache
+
+
+def test_sniff():
+    assert media.sniff(b"\x89PNG\r\n\x1a\n" + bytes(8)) == "image/png"
+    assert media.sniff(b"\xff\xd8\xff\xe0" + bytes(8)) == "image/jpeg"
+    assert media.sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert media.sniff(b"\x00\x00\x00\x20ftypisom\x00\x00") == "video/mp4"
+    assert media.sniff(b"\x00\x00\x00\x1cftypavif\x00\x00") == "image/avif"
+    assert media.sniff(b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg">') == "image/svg+xml"
+    assert media.sniff(b"glTF\x02\x00\x00\x00") == "model/gltf-binary"
+    assert media.sniff(b"\x00\x01\x02\x03") is None
+
+def test_data_uri_type():
+    assert media.data_uri_type("data:image/svg+xml;base64,PHN2Zz4=") == "image/svg+xml"
+    assert media.data_uri_type("data:,hello") == "text/plain"
+
+def test_assets_are_probed_once(tmp_path, monkeypatch):
+    probed = []
+
+    async def fake_probe_many_async(uris, concurrency=None, host_limits=None):
+        probed.extend(uris)
+        return {uri: "image/png" for uri in uris}
+    monkeypatch.setattr(media, "probe_many_async", fake_probe_many_async)
+    media_cache = MediaTypeCache(str(tmp_path / "cache.sqlite"))
+    cid = "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG"
+    # the same ipfs asset through two gateways + a shared http image
+    uris = [f"ipfs://{cid}/1.png", f"https://ipfs.io/ipfs/{cid}/1.png", "https://example.com/a", "https://example.com/a", "data:image/gif;base64,R0lG"]
+
+    results = media.probe_media_types(uris, media_cache)
+
+    assert probed == [f"ipfs://{cid}/1.png", "https://example.com/a"]
+    assert results["data:image/gif;base64,R0lG"] == "image/gif"
+    assert results[f"https://ipfs.io/ipfs/{cid}/1.png"] == "image/png"
+
+    probed.clear()
+    media.probe_media_types(uris, media_cache)
+    # second run is served from the cache
+    assert probed == []
+    media_cache.close()
@@ -0,0 +1,44 @@
+import json
+
+import config
+import metrics
+
+
+def test_prometheus_text_and_summary(monkeypatch):
+    monkeypatch.setattr(config, "metrics_histogram_buckets", [0.1, 1])
+    metrics.reset()
+
+    metrics.inc("http_requests_total", endpoint="explorer", status=200)
+    metrics.inc("http_requests_total", endpoint="explorer", status=200)
+    metrics.observe("http_request_seconds", 0.05, endpoint="explorer")
+    metrics.observe("http_request_seconds", 5, endpoint="explorer")
+
+    text = metrics.prometheus_text()
+    assert 'nft_http_requests_total{endpoint="explorer",stage="none",status="200"} 2' in text
+    assert 'nft_http_request_seconds_bucket{endpoint="explorer",stage="none",le="0.1"} 1' in text
+    assert 'nft_http_request_seconds_bucket{endpoint="explorer",stage="none",le="+Inf"} 2' in text
+    assert metrics.summary()["histograms"]["http_request_seconds"][0]["count"] == 2
+
+def test_worker_snapshot_merge():
+    metrics.reset()
+    metrics.inc("rows_emitted_total", 10, table="nft_info")
+    worker_metrics = metrics.snapshot()
+
+    metrics.merge(worker_metrics)
+    assert metrics.summary()["counters"]["rows_emitted_total"][0]["value"] == 20
+
+def test_stage_writes_exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "metrics_path", str(tmp_path))
+    metrics.reset()
+
+    @metrics.instrument_stage
+    def pull_something():
+        metrics.inc("rows_emitted_total", 3, table="nft_info")
+
+    pull_something()
+
+    with open(tmp_path / "run_summary.json") as f:
+        summary = json.load(f)
+    assert summary["counters"]["rows_emitted_total"][0]["labels"]["stage"] == "pull_something"
+    assert summary["histograms"]["stage_seconds"][0]["count"] == 1
+    assert (tmp_path / "metrics.prom").exists()
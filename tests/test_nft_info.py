@@ -0,0 +1,20 @@
+import pandas as pd
+
+import config
+import storage
+from main import load_fetched_token_ids
+
+
+def test_fetched_token_ids_come_from_nft_info(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    assert load_fetched_token_ids() == {}
+
+    # 2 failed and 1 was minted late - a high-water mark at 1000 would skip both
+    storage.write_table(pd.DataFrame([
+        {"collection_contract_address": "0xA", "nft_token_id": token_id} for token_id in [0, 3, 1000]
+    ] + [{"collection_contract_address": "0xB", "nft_token_id": 1}]), "nft_info")
+
+    fetched_token_ids = load_fetched_token_ids()
+    assert fetched_token_ids == {"0xA": {0, 3, 1000}, "0xB": {1}}
+    assert [token_id for token_id in [0, 1, 2, 3, 1000, 1001] if token_id not in fetched_token_ids["0xA"]] == [1, 2, 1001]
@@ -0,0 +1,49 @@
+import pandas as pd
+
+import config
+import ownership
+
+collection = "0x00000000000000000000000000000000000000C0"
+alice = "0x00000000000000000000000000000000000000a1"
+bob = "0x00000000000000000000000000000000000000B2"
+
+
+def transfer(block_number, log_index, token_id, to_address):
+    return {"collection_contract_address": collection, "block_number": block_number, "log_index": log_index, "nft_token_id": token_id, "to_address": to_address}
+
+df_transfers = pd.DataFrame([
+    transfer(10, 0, 1, alice),
+    transfer(10, 1, 2, alice),
+    transfer(20, 0, 1, bob),
+    transfer(30, 0, 2, config.zero_address),
+    # token ids wider than 64 bits survive the round trip
+    transfer(30, 1, 2 ** 200, bob)
+])
+
+def test_current_and_point_in_time_owners():
+    index = ownership.OwnershipIndex()
+    assert index.apply(df_transfers) == len(df_transfers)
+
+    assert index.owner_of(collection, 1) == bob.lower()
+    # burned
+    assert index.owner_of(collection, 2) is None
+    assert index.owners(collection, block_number=15) == {1: alice, 2: alice}
+    assert index.holders(collection) == {bob.lower(): 2}
+    assert index.holders(collection, block_number=25) == {alice: 1, bob.lower(): 1}
+    assert index.holder_counts(block_number=15) == {collection: 1}
+    assert sorted(index.tokens_of(bob)) == [(collection, 1), (collection, 2 ** 200)]
+
+def test_apply_is_incremental(tmp_path):
+    path = str(tmp_path / "ownership_index.npz")
+    index = ownership.OwnershipIndex()
+    index.apply(df_transfers.iloc[:3])
+    index.save(path)
+
+    index = ownership.OwnershipIndex.load(path)
+    # rows before the watermark were applied already
+    assert index.apply(df_transfers) == 2
+    assert index.owner_of(collection, 2 ** 200) == bob.lower()
+
+    snapshot = index.snapshot()
+    assert list(snapshot.columns) == config.nft_owners_columns
+    assert sorted(snapshot["nft_token_id"]) == [1, 2 ** 200]
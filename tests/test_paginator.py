@@ -0,0 +1,28 @@
+import pandas as pd
+
+import paginator
+
+
+def fake_fetch_page(last_page, fetched):
+    def fetch_page(api_query, page_n):
+        fetched.append(page_n)
+        return pd.DataFrame({"page": [page_n]}) if page_n <= last_page else pd.DataFrame()
+    return fetch_page
+
+def test_fetch_all_pages(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(paginator, "fetch_page", fake_fetch_page(37, fetched))
+
+    pages = paginator.fetch_all_pages("http://explorer/api?module=contract")
+
+    assert [df_page["page"][0] for df_page in pages] == list(range(1, 38))
+    # every page is downloaded once - probing pages are reused
+    assert len(fetched) == len(set(fetched))
+
+def test_fetch_all_pages_empty_and_on_page(monkeypatch):
+    monkeypatch.setattr(paginator, "fetch_page", fake_fetch_page(0, []))
+    assert paginator.fetch_all_pages("http://explorer/api") == []
+
+    monkeypatch.setattr(paginator, "fetch_page", fake_fetch_page(5, []))
+    pages = paginator.fetch_all_pages("http://explorer/api", on_page=lambda df: df.assign(kept=True))
+    assert all(df_page["kept"][0] for df_page in pages)
@@ -0,0 +1,92 @@
+import os
+import sys
+import subprocess
+
+import config
+import pipeline
+
+
+def fake_stages(calls):
+    # every stage writes its output tables as a one line csv
+    def load_fn(fn_path):
+        stage = next(stage for stage in pipeline.stages if fn_path in (stage.fn, stage.parallel_fn))
+        def fn():
+            calls.append(stage.name)
+            for table in stage.outputs:
+                path = pipeline.table_path(table)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write("a\n1\n")
+        return fn
+    return load_fn
+
+def test_resolve_includes_dependencies():
+    # attributes and transfers are independent branches after collections
+    assert [stage.name for stage in pipeline.resolve(["attributes"])] == ["contracts", "nft_contracts", "collections", "info", "media", "attributes"]
+    assert [stage.name for stage in pipeline.resolve(["transfers"])] == ["contracts", "nft_contracts", "collections", "transfers"]
+
+def test_stages_follow_config(monkeypatch):
+    monkeypatch.setattr(config, "token_discovery_mints", True)
+    monkeypatch.setattr(config, "transfer_engine", "logs")
+    monkeypatch.setattr(config, "nft_contracts_source", "explorer")
+    stages_by_name = {stage.name: stage for stage in pipeline.build_stages()}
+
+    assert stages_by_name["info"].depends_on == ["collections", "transfers"]
+    assert stages_by_name["transfers"].fn == "main:pull_nft_transfers_logs"
+    assert stages_by_name["transfers"].parallel_fn is None
+    assert stages_by_name["nft_contracts"].fn == "main:pull_nft_contracts"
+    assert stages_by_name["nft_contracts"].depends_on == []
+
+def test_run_skips_unchanged_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    calls = []
+    monkeypatch.setattr(pipeline, "load_fn", fake_stages(calls))
+
+    done, failed = pipeline.run(["attributes", "transfers"])
+    assert not failed
+    assert set(calls) == {"contracts", "nft_contracts", "collections", "info", "media", "attributes", "transfers"}
+    # attributes and transfers only start once their dependencies are done
+    assert calls.index("info") < calls.index("media") < calls.index("attributes")
+    assert calls.index("collections") < calls.index("transfers")
+
+    calls.clear()
+    pipeline.run(["attributes", "transfers"])
+    # only the incremental stages run again
+    assert sorted(calls) == ["info", "media", "transfers"]
+
+    calls.clear()
+    pipeline.run(["collections"], force=["contracts"])
+    assert calls == ["contracts"]
+
+def test_refresh_runs_only_on_demand(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    calls = []
+    monkeypatch.setattr(pipeline, "load_fn", fake_stages(calls))
+
+    pipeline.run()
+    assert "refresh" not in calls and "refresh_attributes" not in calls
+
+    calls.clear()
+    pipeline.run(["refresh_attributes"])
+    # attributes is up to date - only the incremental stages and the refresh chain run
+    assert calls.index("refresh") < calls.index("refresh_attributes")
+    assert "attributes" not in calls
+
+def test_list_starts_without_the_stage_modules(tmp_path):
+    # python main.py --list in a fresh interpreter - nothing runs, so pandas / numpy / web3 stay unloaded
+    package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nft_data_pull")
+    code = (
+        "import sys, runpy\n"
+        f"sys.path.insert(0, {package_dir!r})\n"
+        "sys.argv = ['main.py', '--list']\n"
+        "try:\n"
+        f"    runpy.run_path({os.path.join(package_dir, 'main.py')!r}, run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted({'main', 'pandas', 'numpy', 'web3'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, check=True)
+    assert "contracts" in result.stdout
+    assert result.stdout.strip().splitlines()[-1] == "[]"
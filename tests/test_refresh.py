@@ -0,0 +1,36 @@
+import config
+import logs
+import refresh
+
+
+def test_content_hash_ignores_key_order():
+    assert refresh.content_hash({"name": "a", "attributes": [1]}) == refresh.content_hash({"attributes": [1], "name": "a"})
+    assert refresh.content_hash({"name": "a"}) != refresh.content_hash({"name": "b"})
+
+def test_token_ids_in_ranges():
+    token_ids = list(range(1, 11))
+    assert refresh.token_ids_in_ranges(token_ids, [(3, 3), (7, 8)]) == [3, 7, 8]
+    # BatchMetadataUpdate(0, type(uint256).max) - the whole collection
+    assert refresh.token_ids_in_ranges(token_ids, [(0, 2 ** 256 - 1)]) == token_ids
+    assert refresh.token_ids_in_ranges(token_ids, []) == []
+
+def test_decode_metadata_updates():
+    contract_address = "0x00000000000000000000000000000000000000a1"
+    raw_logs = [
+        {"address": contract_address, "topics": [config.metadata_update_topic], "data": "0x" + format(5, "064x")},
+        {"address": contract_address, "topics": [config.batch_metadata_update_topic], "data": "0x" + format(10, "064x") + format(20, "064x")},
+        {"address": contract_address, "topics": [config.transfer_event_topic], "data": "0x"}
+    ]
+
+    updates = logs.decode_metadata_updates(raw_logs)
+
+    assert updates == {"0x00000000000000000000000000000000000000A1": [(5, 5), (10, 20)]}
+
+def test_hashes_round_trip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    hashes = {("0xA", 1): {"metadata_uri": "ipfs://cid/1", "metadata_hash": "h1", "attributes_hash": "h0"}}
+
+    refresh.write_hashes(hashes)
+
+    assert refresh.load_hashes() == hashes
@@ -0,0 +1,84 @@
+import pytest
+from web3 import Web3
+
+import http_client
+import rpc_batch
+from rpc_batch import CallResult
+
+abi = [
+    {"inputs": [], "name": "name", "outputs": [{"name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "tokenId", "type": "uint256"}], "name": "ownerOf", "outputs": [{"name": "", "type": "address"}], "stateMutability": "view", "type": "function"}
+]
+owner = Web3.to_checksum_address("0x00000000000000000000000000000000000000a1")
+codec_w3 = Web3()
+token = codec_w3.eth.contract(address=Web3.to_checksum_address("0x00000000000000000000000000000000000000c0"), abi=abi)
+
+
+class FakeW3:
+    codec = codec_w3.codec
+
+    class provider:
+        endpoint_uri = "http://rpc.test"
+
+
+def fake_node(posted):
+    # eth_call answers for token: name() and ownerOf(1) succeed, ownerOf(2) reverts, ownerOf(3) returns garbage
+    answers = {
+        rpc_batch.encode_call(token, "name"): "0x" + codec_w3.codec.encode(["string"], ["Celo Punks"]).hex(),
+        rpc_batch.encode_call(token, "ownerOf", (1,)): "0x" + codec_w3.codec.encode(["address"], [owner]).hex(),
+        rpc_batch.encode_call(token, "ownerOf", (3,)): "0x01"
+    }
+
+    def post_json(url, payload, **kwargs):
+        posted.append(len(payload))
+        responses = []
+        for item in payload:
+            data = item["params"][0]["data"]
+            if data in answers:
+                responses.append({"jsonrpc": "2.0", "id": item["id"], "result": answers[data]})
+            else:
+                responses.append({"jsonrpc": "2.0", "id": item["id"], "error": {"code": 3, "message": "execution reverted"}})
+        # nodes don't have to keep the batch order
+        return responses[::-1]
+    return post_json
+
+calls = [(token, "name", ()), (token, "ownerOf", (1,)), (token, "ownerOf", (2,)), (token, "ownerOf", (3,))]
+
+
+def test_batch_isolates_reverted_calls(monkeypatch):
+    posted = []
+    monkeypatch.setattr(http_client, "post_json", fake_node(posted))
+
+    results = rpc_batch.aggregate_calls(FakeW3, calls, mode="batch", batch_size=3)
+
+    assert results == [CallResult(True, "Celo Punks"), CallResult(True, owner), CallResult(False, None), CallResult(False, None)]
+    assert posted == [3, 1]
+
+def test_multicall_falls_back_to_batch(monkeypatch):
+    monkeypatch.setattr(http_client, "post_json", fake_node([]))
+
+    def failing_multicall(w3, chunk, block):
+        raise ValueError("out of gas")
+    monkeypatch.setattr(rpc_batch, "multicall", failing_multicall)
+
+    results = rpc_batch.aggregate_calls(FakeW3, calls, mode="multicall")
+    assert [result.success for result in results] == [True, True, False, False]
+
+def test_decode_multicall_results():
+    # aggregate3 returns (success, returnData) per call
+    raw_results = [
+        (True, codec_w3.codec.encode(["string"], ["Celo Punks"])),
+        (True, codec_w3.codec.encode(["address"], [owner])),
+        (False, b""),
+        (True, b"\x01")
+    ]
+    results = rpc_batch._decode_results(FakeW3, calls, raw_results)
+    assert results == [CallResult(True, "Celo Punks"), CallResult(True, owner), CallResult(False, None), CallResult(False, None)]
+
+def test_rejected_batch_raises(monkeypatch):
+    monkeypatch.setattr(http_client, "post_json", lambda url, payload, **kwargs: {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch too large"}})
+
+    with pytest.raises(ValueError, match="batch too large"):
+        rpc_batch.batch_requests(FakeW3, [("eth_blockNumber", [])])
+    with pytest.raises(ValueError, match="batch too large"):
+        rpc_batch.batch_rpc(FakeW3, calls)
@@ -0,0 +1,57 @@
+import pandas as pd
+
+import config
+import http_client
+import scheduler
+import storage
+
+
+def make_rows(first_token_id, n):
+    # work item stub - n nft_info rows, or None to simulate an item that hit its error limit
+    if n is None:
+        return None
+    return pd.DataFrame({"collection_contract_address": "0xA", "nft_token_id": range(first_token_id, first_token_id + n)})
+
+def report_settings(first_token_id, n):
+    # work item run by a spawned worker - rows carry the settings the worker sees
+    settings = f"{config.scheduler_range_size} {http_client.get_bucket('rpc').max_rate}"
+    return pd.DataFrame({"collection_name": settings, "nft_token_id": range(first_token_id, first_token_id + n)})
+
+def test_split_ranges_and_largest_first():
+    assert scheduler.split_ranges(range(5), range_size=2) == [[0, 1], [2, 3], [4]]
+
+    items = [("a", 1, ()), ("b", 3, ()), ("c", 2, ())]
+    assert [part_name for part_name, _, _ in scheduler.largest_first(items)] == ["b", "c", "a"]
+
+def test_run_parallel_writes_and_merges_parts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    items = [("0xA-0", 3, (0, 3)), ("0xA-3", 2, (3, 2)), ("0xA-5", 0, (5, None))]
+
+    results = scheduler.run_parallel(make_rows, items, "nft_info", workers=1)
+    assert results == {"0xA-0": 3, "0xA-3": 2, "0xA-5": None}
+
+    for part_name in ["0xA-0", "0xA-3"]:
+        storage.merge_part("nft_info", part_name)
+    storage.drop_parts("nft_info")
+
+    df = storage.read_table("nft_info", columns=["nft_token_id"])
+    assert df["nft_token_id"].tolist() == [0, 1, 2, 3, 4]
+
+def test_workers_get_the_parent_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    # changed at runtime, the way the benchmark points stages at its mock and lifts the rate limits
+    monkeypatch.setattr(config, "scheduler_range_size", 1234)
+    monkeypatch.setattr(config, "rate_limits", dict(config.rate_limits, rpc={"rate": 100, "burst": 10}))
+    items = [("0xA-0", 2, (0, 2)), ("0xA-2", 2, (2, 2)), ("0xA-4", 1, (4, 1))]
+
+    results = scheduler.run_parallel(report_settings, items, "nft_info", workers=2)
+    assert results == {"0xA-0": 2, "0xA-2": 2, "0xA-4": 1}
+
+    for part_name, _, _ in items:
+        storage.merge_part("nft_info", part_name)
+    df = storage.read_table("nft_info", columns=["collection_name", "nft_token_id"])
+    assert df["nft_token_id"].tolist() == [0, 1, 2, 3, 4]
+    # each of the 2 workers gets half of the rpc rate
+    assert set(df["collection_name"]) == {"1234 50.0"}
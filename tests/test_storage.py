@@ -0,0 +1,77 @@
+import os
+import pytest
+import pandas as pd
+
+import config
+import storage
+
+nft_info_rows = [
+    {"chain": "Celo", "collection_contract_address": address, "nft_token_id": token_id, "metadata": "{}"}
+    for address in ["0xA", "0xB"] for token_id in range(1, 4)
+]
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def output_format(request, tmp_path, monkeypatch):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", request.param)
+    return request.param
+
+def test_write_append_and_filtered_read(output_format):
+    storage.write_table(pd.DataFrame(nft_info_rows[:3]), "nft_info")
+    storage.append_table(pd.DataFrame(nft_info_rows[3:]), "nft_info")
+
+    df = storage.read_table(
+        "nft_info",
+        columns=["collection_contract_address", "nft_token_id"],
+        filters=[("collection_contract_address", "==", "0xB"), ("nft_token_id", ">=", 2)]
+    )
+    assert list(df.columns) == ["collection_contract_address", "nft_token_id"]
+    assert sorted(df["nft_token_id"].tolist()) == [2, 3]
+
+def test_read_table_chunks(output_format):
+    storage.write_table(pd.DataFrame(nft_info_rows), "nft_info")
+
+    chunks = list(storage.read_table_chunks("nft_info", columns=["nft_token_id"], chunksize=4))
+    assert sum(len(df) for df in chunks) == len(nft_info_rows)
+
+def test_replace_rows(output_format):
+    storage.write_table(pd.DataFrame(nft_info_rows), "nft_info")
+    changed = pd.DataFrame([{"chain": "Celo", "collection_contract_address": "0xA", "nft_token_id": 2, "metadata": '{"name": "new"}'}])
+
+    storage.replace_rows(changed, "nft_info", ["collection_contract_address", "nft_token_id"], remove_keys=[("0xA", 2), ("0xB", 3)])
+
+    df = storage.read_table("nft_info", columns=["collection_contract_address", "nft_token_id", "metadata"])
+    assert len(df) == len(nft_info_rows) - 1
+    assert df[df["nft_token_id"] == 2].set_index("collection_contract_address")["metadata"]["0xA"] == '{"name": "new"}'
+    assert not ((df["collection_contract_address"] == "0xB") & (df["nft_token_id"] == 3)).any()
+
+def test_wide_token_ids(output_format):
+    # uint256 ids don't fit in int64 - they round trip as python ints
+    wide_id = 2**200
+    rows = nft_info_rows + [{"chain": "Celo", "collection_contract_address": "0xA", "nft_token_id": wide_id, "metadata": "{}"}]
+    storage.write_table(pd.DataFrame(rows), "nft_info")
+
+    df = storage.read_table("nft_info", columns=["collection_contract_address", "nft_token_id"], filters=[("collection_contract_address", "==", "0xA")])
+    assert sorted(int(token_id) for token_id in df["nft_token_id"]) == [1, 2, 3, wide_id]
+
+    df = storage.read_table("nft_info", columns=["nft_token_id"], filters=[("nft_token_id", ">", 3)])
+    assert [int(token_id) for token_id in df["nft_token_id"]] == [wide_id]
+    df = storage.read_table("nft_info", columns=["nft_token_id"], filters=[("nft_token_id", "in", [wide_id])])
+    assert len(df) == 1
+
+def test_headerless_csv_is_migrated(tmp_path, monkeypatch):
+    # nft_info.csv files from before the storage layer were appended without a header
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    path = storage.table_path("nft_info")
+    os.makedirs(os.path.dirname(path))
+    pd.DataFrame(nft_info_rows[:3]).reindex(columns=config.nft_info_columns).to_csv(path, index=False, header=False)
+
+    storage.append_table(pd.DataFrame(nft_info_rows[3:]), "nft_info")
+
+    df = storage.read_table("nft_info", columns=["collection_contract_address", "nft_token_id"])
+    assert len(df) == len(nft_info_rows)
+    assert df["nft_token_id"].tolist() == [1, 2, 3, 1, 2, 3]
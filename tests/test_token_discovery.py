@@ -0,0 +1,63 @@
+import pandas as pd
+
+import config
+import rpc_batch
+import storage
+import token_discovery
+from rpc_batch import CallResult
+
+enumerable_abi = '[{"inputs":[{"internalType":"uint256","name":"index","type":"uint256"}],"name":"tokenByIndex","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"}]'
+plain_abi = '[{"inputs":[{"internalType":"uint256","name":"tokenId","type":"uint256"}],"name":"ownerOf","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"}]'
+
+
+class StubContract:
+    address = "0x00000000000000000000000000000000000000C0"
+
+
+def stub_calls(existing_ids, enumeration):
+    # tokenByIndex(i) -> enumeration[i], ownerOf(id) reverts for ids that don't exist
+    def aggregate_calls(w3, calls, *args, **kwargs):
+        results = []
+        for _, fn_name, (arg,) in calls:
+            if fn_name == "tokenByIndex":
+                results.append(CallResult(arg < len(enumeration), enumeration[arg] if arg < len(enumeration) else None))
+            else:
+                results.append(CallResult(arg in existing_ids, "0x01" if arg in existing_ids else None))
+        return results
+    return aggregate_calls
+
+def test_enumerable_ids_are_exact(monkeypatch):
+    # 0 based with token 2 burned and a sparse id
+    monkeypatch.setattr(rpc_batch, "aggregate_calls", stub_calls({0, 1, 3, 1000}, [1000, 0, 3, 1]))
+
+    token_ids, source = token_discovery.discover_token_ids(None, StubContract(), enumerable_abi, StubContract.address, 4)
+    assert source == "tokenByIndex"
+    assert token_ids == [0, 1, 3, 1000]
+
+def test_mint_events_fallback(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    monkeypatch.setattr(config, "token_discovery_mints", True)
+    monkeypatch.setattr(rpc_batch, "aggregate_calls", stub_calls(set(), []))
+    other_address = "0x00000000000000000000000000000000000000A1"
+    storage.write_table(pd.DataFrame([
+        {"collection_contract_address": StubContract.address, "block_number": 1, "log_index": 0, "from_address": config.zero_address, "to_address": other_address, "nft_token_id": 7},
+        {"collection_contract_address": StubContract.address, "block_number": 1, "log_index": 1, "from_address": config.zero_address, "to_address": other_address, "nft_token_id": 5},
+        {"collection_contract_address": StubContract.address, "block_number": 2, "log_index": 0, "from_address": other_address, "to_address": "0x00000000000000000000000000000000000000B2", "nft_token_id": 7},
+        # minted and burned again - it no longer exists
+        {"collection_contract_address": StubContract.address, "block_number": 3, "log_index": 0, "from_address": config.zero_address, "to_address": other_address, "nft_token_id": 6},
+        {"collection_contract_address": StubContract.address, "block_number": 4, "log_index": 0, "from_address": other_address, "to_address": config.zero_address, "nft_token_id": 6},
+        {"collection_contract_address": "0x00000000000000000000000000000000000000D0", "block_number": 1, "log_index": 0, "from_address": config.zero_address, "to_address": other_address, "nft_token_id": 9},
+    ]), "nft_transfers")
+
+    token_ids, source = token_discovery.discover_token_ids(None, StubContract(), enumerable_abi, StubContract.address, 2)
+    assert source == "mints"
+    assert token_ids == [5, 7]
+
+def test_owner_of_fallback(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rpc_batch, "aggregate_calls", stub_calls({0, 1, 2}, []))
+
+    token_ids, source = token_discovery.discover_token_ids(None, StubContract(), plain_abi, StubContract.address, 3)
+    assert source == "ownerOf"
+    assert token_ids == [0, 1, 2]
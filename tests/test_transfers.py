@@ -0,0 +1,128 @@
+import os
+import json
+import pandas as pd
+from urllib.parse import urlparse, parse_qs
+from web3 import Web3
+
+import config
+import checkpoint
+import http_client
+import main
+import storage
+from main import build_nft_transfer_rows, hex_series_to_int, migrate_nft_transfers
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+contract_address = "0x179513e0fa9B5AD964405B01194105A2d8e0c2df"
+
+
+class FakeExplorer:
+    # tokentx answers with one transfer (token id = block number) per listed block - cut at explorer_max_results,
+    # the way the explorer truncates busy ranges
+    def __init__(self, blocks):
+        with open(os.path.join(samples_dir, "transfers.json")) as f:
+            self.sample = json.load(f)["result"][0]
+        self.blocks = blocks
+        self.ranges = []
+
+    def transfer(self, block_number):
+        token_topic = "0x" + format(block_number, "064x")
+        return dict(self.sample, blockNumber=format(block_number, "x"), topics=self.sample["topics"][:3] + [token_topic])
+
+    def get_json(self, url, **kwargs):
+        query = parse_qs(urlparse(url).query)
+        from_block, to_block = int(query["fromBlock"][0]), int(query["toBlock"][0])
+        self.ranges.append((from_block, to_block))
+        result = [self.transfer(block_number) for block_number in self.blocks if from_block <= block_number <= to_block]
+        return {"status": "1", "message": "OK", "result": result[:config.explorer_max_results]}
+
+
+class FakeEth:
+    block_number = 59
+
+
+class FakeW3:
+    eth = FakeEth()
+    to_checksum_address = staticmethod(Web3.to_checksum_address)
+
+
+def test_hex_series_to_int():
+    assert hex_series_to_int(pd.Series(["0x1f", "ff", "0", "0x1f"])).tolist() == [31, 255, 0, 31]
+    assert hex_series_to_int(pd.Series(["0x" + "f" * 64])).tolist() == [2 ** 256 - 1]
+    assert hex_series_to_int(pd.Series(["zz"])).tolist() == ["zz"]
+
+def test_build_nft_transfer_rows():
+    with open(os.path.join(samples_dir, "transfers.json")) as f:
+        df_transfers = pd.json_normalize(json.load(f)["result"])
+
+    df_nft_transfers = build_nft_transfer_rows(df_transfers, contract_address)
+
+    assert list(df_nft_transfers.columns) == config.nft_transfers_columns
+    assert len(df_nft_transfers) == len(df_transfers)
+    first = df_nft_transfers.iloc[0]
+    assert first["nft_token_id"] == 1
+    assert first["block_number"] == 0x941265
+    assert first["log_index"] == 0x10
+    # from the zero address - a mint
+    assert first["transfer_type"] == "mint"
+    assert (df_nft_transfers["transfer_type"] == "mint").tolist() == (df_nft_transfers["from_address"] == config.zero_address).tolist()
+    assert first["from_address"] == config.zero_address
+    assert first["to_address"] == "0xb5901482d09a34710ae006b99b5378d77b529422"
+
+def test_old_nft_transfers_are_pulled_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    # written before the version marker existed - to_address holds the sender
+    storage.write_table(pd.DataFrame([{"collection_contract_address": contract_address, "block_number": 5, "nft_token_id": 1}]), "nft_transfers")
+    checkpoint.save_checkpoint("nft_transfers", contract_address, 100)
+    os.makedirs(os.path.dirname(config.ownership_index_path), exist_ok=True)
+    open(config.ownership_index_path, "wb").close()
+
+    migrate_nft_transfers()
+    assert not storage.table_exists("nft_transfers")
+    assert checkpoint.load_checkpoints("nft_transfers") == {}
+    assert not os.path.exists(config.ownership_index_path)
+
+    # current tables are left alone
+    storage.write_table(pd.DataFrame([{"collection_contract_address": contract_address, "block_number": 5, "nft_token_id": 1}]), "nft_transfers")
+    checkpoint.save_checkpoint("nft_transfers", contract_address, 100)
+    migrate_nft_transfers()
+    assert storage.table_exists("nft_transfers")
+    assert checkpoint.load_checkpoints("nft_transfers") == {contract_address: 100}
+
+def test_transfer_ranges_halve_when_truncated_and_widen_when_quiet(monkeypatch):
+    monkeypatch.setattr(config, "explorer_max_results", 4)
+    monkeypatch.setattr(config, "transfers_block_chunk_size", 100)
+    # one transfer in each of the first 40 blocks, nothing after
+    explorer = FakeExplorer(range(40))
+    monkeypatch.setattr(http_client, "get_json", explorer.get_json)
+
+    chunks = list(main.fetch_contract_transfers(contract_address, 0, 399))
+
+    # halved until a range fits in one response
+    assert explorer.ranges[:6] == [(0, 99), (0, 49), (0, 24), (0, 11), (0, 5), (0, 2)]
+    # every transfer comes back exactly once, nothing lost to a truncated response
+    token_ids = [token_id for _, df in chunks for token_id in df["nft_token_id"]]
+    assert token_ids == list(range(40))
+    # doubled over the quiet blocks after them
+    quiet_ranges = [(from_block, to_block) for from_block, to_block in explorer.ranges if from_block >= 42]
+    assert [to_block - from_block + 1 for from_block, to_block in quiet_ranges][:6] == [3, 6, 12, 24, 48, 96]
+    assert chunks[-1][0] == 399
+
+def test_pull_nft_transfers_resumes_from_the_watermark(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "output_format", "csv")
+    monkeypatch.setattr(main, "w3", FakeW3())
+    explorer = FakeExplorer(range(0, 60, 5))
+    monkeypatch.setattr(http_client, "get_json", explorer.get_json)
+    storage.write_table(pd.DataFrame([{"collection_name": "Celo Punks", "contract_address": contract_address}]), "nft_collection_info")
+    checkpoint.save_checkpoint("table_versions", "nft_transfers", config.nft_transfers_version)
+    checkpoint.save_checkpoint("nft_transfers", contract_address, 19)
+
+    main.pull_nft_transfers()
+    assert explorer.ranges == [(20, 59)]
+    assert storage.read_table("nft_transfers")["block_number"].tolist() == [20, 25, 30, 35, 40, 45, 50, 55]
+    assert checkpoint.load_checkpoints("nft_transfers") == {contract_address: 59}
+
+    # nothing new below the latest block - no requests
+    main.pull_nft_transfers()
+    assert explorer.ranges == [(20, 59)]
@@ -0,0 +1,48 @@
+import pytest
+
+from uri_template import UriTemplate, infer_template, render
+
+# tokenURI layouts seen on celo / evm collections - (uri for a token id, token ids sampled)
+uri_patterns = [
+    # plain "/{id}" on ipfs
+    (lambda token_id: f"ipfs://QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx/{token_id}", [1, 500, 1000]),
+    # baseURI() + id + baseExtension()
+    (lambda token_id: f"ipfs://Qme97ifAexrMDfjE3DZRMasWhe7D276uYsCGonyprSA2MJ/{token_id}.json", [1, 5000, 10000]),
+    # gateway url whose cid contains the id digits
+    (lambda token_id: f"https://ipfs.io/ipfs/QmT1x2Y3z4A5b6C7d8E9f1G2h3J4k5L6m7N8p9Q1r2S3t4/{token_id}.json", [1, 12, 123]),
+    # api host with a query string
+    (lambda token_id: f"https://api.celo-nfts.xyz/metadata?collection=punks&id={token_id}", [1, 2500, 5000]),
+    # zero based ids
+    (lambda token_id: f"https://metadata.example.io/api/token/{token_id}", [0, 4999, 9999]),
+    # zero padded ids
+    (lambda token_id: f"ipfs://QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx/{token_id:04d}.json", [1, 50, 100]),
+    # erc-1155 style 64 char hex ids
+    (lambda token_id: f"https://nft.example.com/api/{token_id:064x}.json", [1, 255, 4096]),
+    # short hex ids
+    (lambda token_id: f"https://nft.example.com/token/0x{token_id:x}", [1, 2748, 65535]),
+]
+
+
+@pytest.mark.parametrize("uri_for, token_ids", uri_patterns)
+def test_infer_template(uri_for, token_ids):
+    template = infer_template({token_id: uri_for(token_id) for token_id in token_ids})
+
+    assert template is not None
+    for token_id in [7, 42, 777, 9998]:
+        assert render(template, token_id) == uri_for(token_id)
+
+def test_no_template_for_per_token_cids():
+    samples = {
+        1: "ipfs://QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx",
+        500: "ipfs://Qme97ifAexrMDfjE3DZRMasWhe7D276uYsCGonyprSA2MJ",
+        1000: "ipfs://QmT1x2Y3z4A5b6C7d8E9f1G2h3J4k5L6m7N8p9Q1r2S3t4"
+    }
+    assert infer_template(samples) is None
+
+def test_no_template_for_unrevealed_placeholder():
+    samples = {token_id: "ipfs://QmNPzCHVR3o5pNFaRxWRJrcWcKHQJdG1WsNAMAoGEmoBxx/hidden.json" for token_id in [1, 50, 100]}
+    assert infer_template(samples) is None
+
+def test_render():
+    template = UriTemplate("https://example.com/", "dec_pad5", ".json")
+    assert render(template, 42) == "https://example.com/00042.json"